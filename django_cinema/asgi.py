@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
+
+Run it with an ASGI server, e.g. uvicorn django_cinema.asgi:application
+The async views (reservation_system/async_views.py) need Django 3.1 or later.
 """
 
 import os
@@ -13,4 +16,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_cinema.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# the seat events (Server-Sent Events) are streamed without Django's views
+from reservation_system.seatevents import SSE_PATH, sse_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and SSE_PATH.fullmatch(scope['path']):
+        return await sse_application(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -40,10 +40,12 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'rest_framework.authtoken',
-    'reservation_system',
+    'reservation_system.apps.ReservationSystemConfig',
 ]
 
 MIDDLEWARE = [
+    'reservation_system.instrumentation.InstrumentationMiddleware',  # first : times the whole request
+    'reservation_system.dbconnections.ConnectionLimitMiddleware',   # DB_MAX_CONNECTIONS
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,18 +81,134 @@ WSGI_APPLICATION = 'django_cinema.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+# the SQL Server of the deployment by default, the DB_* environment variables
+# select another one, e.g. DB_ENGINE=sqlite (local tests) or
+# DB_ENGINE=postgresql DB_NAME=cinema DB_USER=... DB_PASSWORD=...
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'mssql')
+DB_ENGINES = {
+    'mssql': 'sql_server.pyodbc',
+    'postgresql': 'django.db.backends.postgresql',
+    'sqlite': 'django.db.backends.sqlite3',
+}
+DB_OPTIONS = {
+    'mssql': {
+        'driver': os.environ.get('DB_DRIVER', 'SQL Server Native Client 11.0'),
+        'connection_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+        'connection_retries': 2,
+    },
+    'postgresql': {
+        'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+    },
+    # seconds a writer waits for the lock of the file (the concurrent
+    # booking tests run hundreds of writers at the same time)
+    'sqlite': {'timeout': 60},
+}
+
 DATABASES = {
     'default': {
-        'NAME': 'ReservationSystemDjango',
-        'ENGINE': 'sql_server.pyodbc',
-        'HOST': 'DESKTOP-UFSR4IB',
-        'PORT': '',
-        'OPTIONS': {
-            'driver': 'SQL Server Native Client 11.0',
-        },
+        'NAME': os.environ.get('DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3') if DB_ENGINE == 'sqlite' else 'ReservationSystemDjango'),
+        'ENGINE': DB_ENGINES[DB_ENGINE],
+        'HOST': os.environ.get('DB_HOST', 'DESKTOP-UFSR4IB' if DB_ENGINE == 'mssql' else ''),
+        'PORT': os.environ.get('DB_PORT', ''),
+        'USER': os.environ.get('DB_USER', ''),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'OPTIONS': DB_OPTIONS[DB_ENGINE],
+        # the connection of a thread is kept between the requests (no ODBC
+        # connect / login per request), renewed after this many seconds
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+    },
+}
+if DB_ENGINE == 'sqlite':
+    # a file rather than the in memory database : the threads of the tests
+    # (reservation_system/tests.py) share the test database
+    DATABASES['default']['TEST'] = {'NAME': DATABASES['default']['NAME'] + '.test'}
+
+# read replicas (reservation_system/dbrouter.py) : DB_REPLICAS is a comma
+# separated list of hosts (of files with sqlite) holding a copy of default,
+# e.g. locally DB_ENGINE=sqlite DB_NAME=primary.sqlite3 DB_REPLICAS=replica.sqlite3
+# (manage.py sync_replicas copies the primary into the sqlite replicas)
+DB_REPLICAS = [r.strip() for r in os.environ.get('DB_REPLICAS', '').split(',') if r.strip()]
+DATABASE_REPLICAS = ['replica%d' % i for i in range(1, len(DB_REPLICAS) + 1)]
+DATABASES.update({
+    alias: dict(DATABASES['default'], TEST={'MIRROR': 'default'}, **{'NAME' if DB_ENGINE == 'sqlite' else 'HOST': replica})
+    for alias, replica in zip(DATABASE_REPLICAS, DB_REPLICAS)
+})
+DATABASE_ROUTERS = ['reservation_system.dbrouter.ReplicaRouter']
+DB_REPLICA_PIN = 5      # seconds the reads of a user go to default after they wrote (replication lag)
+DB_REPLICA_RETRY = 30   # seconds a replica which lost its connection is left aside (by every worker)
+DB_REPLICA_CACHE = 'default'  # pins and replicas left aside, shared by the workers
+
+# connections (reservation_system/dbconnections.py)
+# one persistent connection per thread and database : a worker holds up to
+# DB_MAX_CONNECTIONS connections for its request threads (all of them, e.g.
+# gunicorn --threads, if not set) + the async threads (ASYNC_DB_WORKERS), the
+# connection limit of the server must allow that many per worker
+DB_HEALTH_CHECK = 30    # seconds : a connection idle longer is checked before the request
+DB_MAX_CONNECTIONS = int(os.environ['DB_MAX_CONNECTIONS']) if os.environ.get('DB_MAX_CONNECTIONS') else None
+DB_CONNECTION_WAIT = 5  # seconds a request waits for a connection over the cap, then 503
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# local memory by default, any shared backend (memcached, redis...) can be
+# used instead so that every worker sees the same holds and cached responses
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'django_cinema',
     },
 }
 
+RESPONSE_CACHE = 'default'
+RESPONSE_CACHE_TIMEOUT = 5 * 60  # seconds
+RESPONSE_CACHE_SEATS_REFRESH = 60   # seconds the viewers of the cached responses may be late
+
+# rows of the totals of the reservations (reservation_system/rollups.py), one
+# is updated per booking (by user) and the dashboard sums them
+ROLLUP_TOTALS_SHARDS = 16
+
+# threads running the queries of the async views (reservation_system/aio.py),
+# each with its own connections
+ASYNC_DB_WORKERS = int(os.environ.get('ASYNC_DB_WORKERS', 8))
+
+# push of the seats taken / released (reservation_system/seatevents.py)
+# RedisBackend (needs redis) to share the events between several workers
+SEATEVENTS_BACKEND = 'reservation_system.seatevents.LocalBackend'
+SEATEVENTS_REDIS_URL = 'redis://localhost:6379/0'
+SEATEVENTS_INTERVAL = 0.2   # seconds the changes are coalesced
+SEATEVENTS_TICKET_TIMEOUT = 30  # seconds a ticket of a stream (?ticket=) can be used, once
+
+# bearer tokens (reservation_system/token.py)
+TOKEN_CACHE = 'default'
+TOKEN_CACHE_TIMEOUT = 5 * 60    # seconds a token -> user lookup is cached
+TOKEN_EXPIRY = None             # seconds, None : the tokens never expire
+TOKEN_ROTATION = False          # True : a new token at each login
+
+# timing of the requests (reservation_system/instrumentation.py)
+# admin/request/metrics/ (Prometheus) and admin/request/metrics/slow-endpoints/
+INSTRUMENTATION_SAMPLE_RATE = 0.1       # part of the requests with their queries recorded
+INSTRUMENTATION_DUPLICATES = 5          # same query this many times in a request : logged as N+1
+INSTRUMENTATION_SERVER_TIMING = True    # Server-Timing header (total, db, serialize, render, app)
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/3.0/topics/auth/passwords/
+# the hashing runs in a bounded pool (reservation_system/passwords.py)
+
+PASSWORD_HASHERS = [
+    'reservation_system.passwords.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+PASSWORD_ITERATIONS = None  # PBKDF2 iterations, None : the default of Django
+PASSWORD_WORKERS = None     # threads hashing the passwords, None : number of cores
+PASSWORD_QUEUE = 32         # logins / sign-ups waiting for a thread, the others get a 503
+PASSWORD_WAIT = 2           # seconds a login / sign-up waits for its hash, then a 503
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -115,9 +233,13 @@ AUTH_USER_MODEL = 'reservation_system.User'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'reservation_system.token.BearerAuthentication'
-    ]
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'reservation_system.pagination.CinemaCursorPagination',
+    'PAGE_SIZE': 50,
 }
 
+MAX_PAGE_SIZE = 200     # upper bound of ?page_size=
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.0/topics/i18n/
 
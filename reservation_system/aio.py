@@ -0,0 +1,66 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework.renderers import JSONRenderer
+
+from .dbconnections import check_connections, release_connections
+from .responsecache import etag_matches, lookup, store
+
+# helpers of the async views (async_views.py) :
+# - the ORM of this Django version is synchronous, the queries run in a small
+#   pool of threads (ASYNC_DB_WORKERS) so that several independent queries of
+#   one request run at the same time (asyncio.gather) and the event loop is
+#   never blocked
+# - each thread keeps its connection, checked before each job and closed /
+#   renewed after it as the request threads do (dbconnections.py)
+# - the responses use the same cache (responsecache.py) as the sync views
+
+ASYNC_DB_WORKERS = getattr(settings, 'ASYNC_DB_WORKERS', 8)
+
+_executor = None
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=ASYNC_DB_WORKERS, thread_name_prefix='async-db')
+    return _executor
+
+
+def _job(func, args, kwargs):
+    check_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        release_connections()
+
+
+async def run(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool(), functools.partial(_job, func, args, kwargs))
+
+
+def json_response(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status)
+
+
+async def cached_json(request, groups, build):
+    # request : DRF Request (query_params), build : coroutine function returning the data
+    key, entry = await run(lookup, request, groups)
+    if entry is None:
+        data = await build()
+        if isinstance(data, HttpResponse):
+            return data
+        etag = await run(store, key, data)
+    else:
+        data, etag = entry['data'], entry['etag']
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = json_response(data)
+    response['ETag'] = etag
+    response['X-Cache'] = 'MISS' if entry is None else 'HIT'
+    return response
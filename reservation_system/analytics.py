@@ -0,0 +1,91 @@
+import datetime
+
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from .models import Category, DailyCategoryRollup
+
+# time series of the dashboards, read from the daily rollups of the categories
+# (see rollups.py) : one grouped query (category x bucket) on the days of the
+# range, the buckets without reservation are filled with 0 in Python. The
+# query reads at most one row per category and day, whatever the number of
+# reservations.
+# - start is included, end is excluded
+# - buckets : 'day', 'week' (starting on monday) or 'month'
+
+BUCKETS = ('day', 'week', 'month')
+MAX_BUCKETS = 400
+
+
+class SeriesError(ValueError):
+    pass
+
+
+def bucket_start(date, bucket):
+    if bucket == 'week':
+        return date - datetime.timedelta(days=date.weekday())
+    if bucket == 'month':
+        return date.replace(day=1)
+    return date
+
+
+def next_bucket(date, bucket):
+    if bucket == 'week':
+        return date + datetime.timedelta(days=7)
+    if bucket == 'month':
+        return (date.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    return date + datetime.timedelta(days=1)
+
+
+def buckets(start, end, bucket):
+    result = []
+    date = bucket_start(start, bucket)
+    while date < end:
+        result.append(date)
+        date = next_bucket(date, bucket)
+    return result
+
+
+def _truncate(field, bucket):
+    if bucket == 'week':
+        return TruncWeek(field)
+    if bucket == 'month':
+        return TruncMonth(field)
+    return F(field)
+
+
+def parse_range(params, default_days=7, today=None):
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD&bucket=day|week|month
+    today = today or datetime.date.today()
+    bucket = params.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        raise SeriesError('bucket must be one of %s' % ', '.join(BUCKETS))
+    try:
+        end = datetime.date.fromisoformat(params['end']) if params.get('end') else today
+        start = datetime.date.fromisoformat(params['start']) if params.get('start') \
+            else end - datetime.timedelta(days=default_days)
+    except ValueError:
+        raise SeriesError('dates must be YYYY-MM-DD')
+    if start >= end:
+        raise SeriesError('start must be before end')
+    if len(buckets(start, end, bucket)) > MAX_BUCKETS:
+        raise SeriesError('too many buckets, use a larger bucket or a smaller range')
+    return start, end, bucket
+
+
+def seats_reserved_per_category(start, end, bucket='day'):
+    # [{'name': category, 'series': [{'name': bucket, 'value': nb of seats}]}]
+    dates = buckets(start, end, bucket)
+    rows = DailyCategoryRollup.objects.filter(day__gte=start, day__lt=end).annotate(
+        bucket=_truncate('day', bucket)).values_list('category', 'bucket').annotate(
+        nb=Sum('seats')).order_by()
+    counts = {}
+    for category, date, nb in rows:
+        if isinstance(date, datetime.datetime):
+            date = date.date()
+        counts[(category, date)] = nb
+    response = []
+    for id, name in Category.objects.order_by('id').values_list('id', 'name'):
+        series = [{'name': date, 'value': counts.get((id, date), 0)} for date in dates]
+        response.append({'name': name, 'series': series})
+    return response
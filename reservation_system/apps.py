@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class ReservationSystemConfig(AppConfig):
     name = 'reservation_system'
+
+    def ready(self):
+        # connect the signals defined outside of models.py
+        from . import dbconnections, dbrouter, responsecache, rollups, search, seatevents, seatmap, stats, token
+        # the time of the serializers in the metrics
+        from .instrumentation import time_serializers
+        time_serializers()
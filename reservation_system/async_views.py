@@ -0,0 +1,137 @@
+import asyncio
+import functools
+
+from django.http import HttpResponseNotAllowed
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+
+from . import availability, querysets
+from .aio import cached_json, json_response, run
+from .models import Screening
+from .pagination import MoviePagination, ScreeningPagination
+from .responsecache import CATEGORIES, MOVIES, ROOMS, SCREENINGS, SEATS
+from .search import MovieSearchFilter
+from .seatmap import seat_map
+from .serializers import MovieListSerializer, ScreeningSerializer
+from .token import BearerAuthentication
+from .views import nbTrendingMovies
+
+# async versions of the public read endpoints with the most traffic, for the
+# ASGI deployment (django_cinema/asgi.py, e.g. uvicorn django_cinema.asgi:application)
+# same data as the sync views (views.py), the queries run with aio.run() and
+# the independent ones at the same time
+# manage.py benchmark_servers compares them under uvicorn with the sync views
+# under gunicorn
+
+MOVIE_GROUPS = (MOVIES, CATEGORIES, SCREENINGS, SEATS)
+SCREENING_GROUPS = (SCREENINGS, MOVIES, CATEGORIES, ROOMS, SEATS)
+
+
+def _page(paginatorClass, queryset, request, serializerClass):
+    paginator = paginatorClass()
+    page = paginator.paginate_queryset(queryset, request)
+    serializer = serializerClass(page, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data).data
+
+
+def _movie_page(queryset, request):
+    queryset = querysets.movie_list(queryset, request)
+    queryset = MovieSearchFilter().filter_queryset(request, queryset, None)
+    return _page(MoviePagination, queryset, request, MovieListSerializer)
+
+
+def _trending(request):
+    most_watched_movies = querysets.trending(availability.available_movies(), request, nbTrendingMovies)
+    return MovieListSerializer(most_watched_movies, many=True, context={'request': request}).data
+
+
+def _screenings(request):
+    screenings = querysets.screenings(availability.upcoming_screenings())
+    return _page(ScreeningPagination, screenings, request, ScreeningSerializer)
+
+
+def _screenings_for_movie(id, request):
+    screenings = querysets.screenings(availability.upcoming_screenings().filter(movieId__id=id))
+    return _page(ScreeningPagination, screenings, request, ScreeningSerializer)
+
+
+def _seat_map(id, user):
+    screening = Screening.objects.only('id', 'roomId').filter(id=id).first()
+    if screening is None:
+        return None
+    return seat_map(screening, user)
+
+
+def _authenticate(request):
+    try:
+        result = BearerAuthentication().authenticate(request)
+    except exceptions.AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def _get_only(view):
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return HttpResponseNotAllowed(['GET'])
+        return await view(Request(request), *args, **kwargs)
+    return wrapper
+
+
+@_get_only
+async def available_movies(request):     # public
+    return await cached_json(request, MOVIE_GROUPS,
+        lambda: run(_movie_page, availability.available_movies(), request))
+
+
+@_get_only
+async def coming_soon_movies(request):   # public
+    return await cached_json(request, MOVIE_GROUPS,
+        lambda: run(_movie_page, availability.coming_soon_movies(), request))
+
+
+@_get_only
+async def available_trending_movies(request):    # public
+    return await cached_json(request, MOVIE_GROUPS, lambda: run(_trending, request))
+
+
+@_get_only
+async def available_screenings(request):   # public
+    return await cached_json(request, SCREENING_GROUPS, lambda: run(_screenings, request))
+
+
+@_get_only
+async def available_screenings_for_movie(request, id):   # public
+    return await cached_json(request, SCREENING_GROUPS, lambda: run(_screenings_for_movie, id, request))
+
+
+# the home page in one request : first page of the available and coming soon
+# movies, trending movies and the numbers of movies / screenings, loaded at
+# the same time
+@_get_only
+async def catalogue(request):    # public
+    async def build():
+        available, comingSoon, trending, nbMovies, nbScreenings = await asyncio.gather(
+            run(_movie_page, availability.available_movies(), request),
+            run(_movie_page, availability.coming_soon_movies(), request),
+            run(_trending, request),
+            run(availability.available_movies().count),
+            run(availability.upcoming_screenings().count),
+        )
+        return {'available': available, 'comingSoon': comingSoon, 'trending': trending,
+                'counts': {'movies': nbMovies, 'screenings': nbScreenings}}
+    return await cached_json(request, SCREENING_GROUPS, build)
+
+
+# not cached : the seats held by the user are shown as free
+@_get_only
+async def seats_for_screening(request, id):   # user
+    user = await run(_authenticate, request)
+    if user is None:
+        return json_response({'detail': 'Authentication credentials were not provided.'},
+            status=status.HTTP_401_UNAUTHORIZED)
+    seatResponse = await run(_seat_map, id, user)
+    if seatResponse is None:
+        return json_response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+    return json_response(seatResponse)
@@ -0,0 +1,20 @@
+from django.utils import timezone
+
+from .models import Movie, Screening
+
+# what the public can see : the screenings which have not started yet and
+# their movies, the movies released after today
+# "now" is read at every call (never at import time) so long running workers
+# stay correct
+
+
+def upcoming_screenings():
+    return Screening.objects.upcoming().order_by('startDateTime', 'id')
+
+
+def available_movies():
+    return Movie.objects.filter(id__in=Screening.objects.upcoming().values('movieId'))
+
+
+def coming_soon_movies():
+    return Movie.objects.filter(releaseDate__gt=timezone.localdate())
@@ -0,0 +1,89 @@
+from django.db import IntegrityError, transaction
+
+from .models import Reservation, Seat, SeatReserved
+from .holds import held_by_others, place_holds, release_holds
+from .seatevents import seats_changed
+from .seatmap import get_layout, invalidate_occupancy
+from .stats import add_viewers
+
+# reservation of several seats in one transaction :
+# 1 query to validate the seats, 1 insert for the reservation, 1 to check the
+# seats already taken and 1 bulk insert for the seats, the counters
+# (viewers, rollups) are updated after the commit
+# the unique (screening, seat) constraint of SeatReserved is the real guard
+# against double booking, the check before the insert is only there to
+# report the conflicts per seat
+# seats held by another user (see holds.py) can not be reserved
+
+
+class SeatConflict(Exception):
+    def __init__(self, conflicts):
+        super().__init__('conflict on seats')
+        self.conflicts = conflicts  # list of {'seat': id, 'error': ...}
+
+    @property
+    def invalid(self):
+        return any(c['error'] == 'invalid' for c in self.conflicts)
+
+
+def taken_seats(screening, seatsIds):
+    return set(SeatReserved.objects.filter(
+        screening=screening, seatId__in=seatsIds).values_list('seatId', flat=True))
+
+
+def reserve_seats(user, screening, seatsIds):
+    seatsIds = list(dict.fromkeys(int(s) for s in seatsIds))
+    if not seatsIds:
+        raise ValueError('no seat selected')
+    seats = list(Seat.objects.filter(id__in=seatsIds, room=screening.roomId_id))
+    found = set(s.id for s in seats)
+    invalid = [{'seat': s, 'error': 'invalid'} for s in seatsIds if s not in found]
+    if invalid:
+        raise SeatConflict(invalid)
+    held = held_by_others(screening.id, seatsIds, user.id)
+    if held:
+        raise SeatConflict([{'seat': s, 'error': 'held'} for s in seatsIds if s in held])
+    try:
+        with transaction.atomic():
+            # the insert before the check : the write lock is taken first (sqlite
+            # can not turn the read lock of two concurrent bookings into a write lock)
+            reservation = Reservation(user=user, screeningId=screening, total=len(seats)*screening.price)
+            reservation._nb_seats = len(seats)  # counted in the rollups with the reservation
+            reservation.save()
+            taken = taken_seats(screening, seatsIds)
+            if taken:
+                raise SeatConflict([{'seat': s, 'error': 'taken'} for s in seatsIds if s in taken])
+            SeatReserved.objects.bulk_create([SeatReserved(
+                screening=screening, seatId=seat, reservation=reservation) for seat in seats])
+    except IntegrityError:
+        # another buyer committed one of the seats between the check and the insert
+        taken = taken_seats(screening, seatsIds)
+        if not taken:
+            raise
+        raise SeatConflict([{'seat': s, 'error': 'taken'} for s in seatsIds if s in taken])
+    # bulk_create does not send post_save ; the holds of the user become reserved seats
+    def reserved():
+        add_viewers(screening.id, len(seats))
+        invalidate_occupancy(screening.id)
+        release_holds(screening.id, seatsIds, user.id)
+        seats_changed(screening.id, [s.id for s in seats], True)
+    transaction.on_commit(reserved)
+    return reservation
+
+
+def hold_seats(user, screening, seatsIds):
+    # validation with the cached room layout, 1 query for the seats already taken
+    seatsIds = list(dict.fromkeys(int(s) for s in seatsIds))
+    if not seatsIds:
+        raise ValueError('no seat selected')
+    room = set(s[0] for s in get_layout(screening.roomId_id)['seats'])
+    invalid = [{'seat': s, 'error': 'invalid'} for s in seatsIds if s not in room]
+    if invalid:
+        raise SeatConflict(invalid)
+    taken = taken_seats(screening, seatsIds)
+    if taken:
+        raise SeatConflict([{'seat': s, 'error': 'taken'} for s in seatsIds if s in taken])
+    conflicts = place_holds(screening.id, seatsIds, user.id)
+    if conflicts:
+        raise SeatConflict(conflicts)
+    return seatsIds
@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+# persistent connections (CONN_MAX_AGE) : a connection dropped by the server
+# (restart, failover, idle timeout of a firewall) would only be seen when the
+# first query of a request fails. a connection idle for more than
+# DB_HEALTH_CHECK seconds is pinged (is_usable) before the request and
+# replaced if it is broken ; the busy connections are not checked, so the
+# cost is one round trip after an idle period only
+# the request threads use the signals, the async threads (aio.py) call
+# check_connections() / release_connections() around each job
+# cap of the connections of a worker (DB_MAX_CONNECTIONS, per database) :
+# - a request thread takes a permit (ConnectionLimitMiddleware, before the
+#   view) and keeps it as long as its connections stay open between the
+#   requests ; the permit is given back when they are closed (CONN_MAX_AGE,
+#   broken) or, at the end of a request, closed at once if another thread
+#   waits for a permit
+# - a thread without a permit waits DB_CONNECTION_WAIT seconds at most, then
+#   gets a 503
+# - the async views do not take one : their queries run in the
+#   ASYNC_DB_WORKERS threads of aio.py, which add that many connections
+
+DB_HEALTH_CHECK = getattr(settings, 'DB_HEALTH_CHECK', 30)    # seconds, None : never checked
+DB_MAX_CONNECTIONS = getattr(settings, 'DB_MAX_CONNECTIONS', None)     # None : no cap
+DB_CONNECTION_WAIT = getattr(settings, 'DB_CONNECTION_WAIT', 5)    # seconds
+
+_permits = threading.BoundedSemaphore(DB_MAX_CONNECTIONS) if DB_MAX_CONNECTIONS else None
+_waiting = [0]
+_lock = threading.Lock()
+_thread = threading.local()     # .permit : the thread holds one
+
+
+class ConnectionsBusy(Exception):
+    retry_after = 1     # seconds
+
+
+def _has_connections():
+    return any(conn.connection is not None for conn in connections.all())
+
+
+def acquire_connections():
+    if _permits is None or getattr(_thread, 'permit', False):
+        return
+    with _lock:
+        _waiting[0] += 1
+    try:
+        acquired = _permits.acquire(timeout=DB_CONNECTION_WAIT)
+    finally:
+        with _lock:
+            _waiting[0] -= 1
+    if not acquired:
+        raise ConnectionsBusy()
+    _thread.permit = True
+
+
+def give_back_connections():
+    if _permits is None or not getattr(_thread, 'permit', False):
+        return
+    if _waiting[0] and _has_connections():
+        for conn in connections.all():
+            conn.close()
+    if not _has_connections():
+        _thread.permit = False
+        _permits.release()
+
+
+def check_connections():
+    if DB_HEALTH_CHECK is None:
+        return
+    now = time.monotonic()
+    for conn in connections.all():
+        if conn.connection is None:
+            continue
+        if now - getattr(conn, '_idle_since', now) > DB_HEALTH_CHECK and not conn.is_usable():
+            conn.close()
+
+
+def release_connections():
+    # closes the connections too old (CONN_MAX_AGE) or in error, as Django does
+    # after a request, and notes when the others became idle
+    now = time.monotonic()
+    for conn in connections.all():
+        conn.close_if_unusable_or_obsolete()
+        if conn.connection is not None:
+            conn._idle_since = now
+
+
+@receiver(request_started)
+def request_started_check(sender, **kwargs):
+    # after close_old_connections (connected first by django.db)
+    check_connections()
+
+
+@receiver(request_finished)
+def request_finished_idle(sender, **kwargs):
+    # after close_old_connections too
+    give_back_connections()
+    now = time.monotonic()
+    for conn in connections.all():
+        if conn.connection is not None:
+            conn._idle_since = now
+
+
+# after InstrumentationMiddleware (which times the wait)
+class ConnectionLimitMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if _permits is None or asyncio.iscoroutinefunction(view_func):
+            return None
+        try:
+            acquire_connections()
+        except ConnectionsBusy as e:
+            response = HttpResponse(status=503)
+            response['Retry-After'] = e.retry_after
+            return response
+        return None
@@ -0,0 +1,213 @@
+import contextvars
+import functools
+import logging
+import random
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, InterfaceError, OperationalError, connections, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category, Movie, Reservation, Room, Screening, User
+from .responsecache import CATEGORIES, MOVIES, ROOMS, SCREENINGS
+
+# reads of the public lists and of the admin dashboards on the read replicas
+# (DATABASE_REPLICAS, see DATABASES in settings.py), everything else on default :
+# - the views opt in (read_replica / ReplicaMixin) : the router sends the
+#   reads to the replica chosen for the request, the writes always to default
+# - read-your-writes : a user who wrote a reservation or their profile reads
+#   from default for DB_REPLICA_PIN seconds (longer than the replication lag)
+# - a change of the catalogue pins its group of the response cache
+#   (responsecache.py) once per transaction, when it commits : the views
+#   depending on that group (cache_groups, every group for the views
+#   without) read from default for DB_REPLICA_PIN seconds, so that the
+#   invalidated responses are not filled again with the old data
+# - a replica which can not connect or loses its connection during the view
+#   (OperationalError, InterfaceError : not the errors of the query itself)
+#   is left aside for DB_REPLICA_RETRY seconds and the view runs again on
+#   default
+# the pins and the replicas left aside are kept in a shared cache
+# (DB_REPLICA_CACHE, read in one call per request) so that every worker
+# sees them
+# the async views (async_views.py) read from default
+
+logger = logging.getLogger(__name__)
+
+DATABASE_REPLICAS = getattr(settings, 'DATABASE_REPLICAS', [])
+DB_REPLICA_PIN = getattr(settings, 'DB_REPLICA_PIN', 5)         # seconds
+DB_REPLICA_RETRY = getattr(settings, 'DB_REPLICA_RETRY', 30)    # seconds
+DB_REPLICA_CACHE = getattr(settings, 'DB_REPLICA_CACHE', 'default')
+
+CATALOGUE = (MOVIES, SCREENINGS, CATEGORIES, ROOMS)
+CONNECTION_ERRORS = (OperationalError, InterfaceError)
+
+_replica = contextvars.ContextVar('replica', default=None)  # alias of the current view
+
+
+def _cache():
+    return caches[DB_REPLICA_CACHE]
+
+
+def user_pin_key(user_id):
+    return 'dbrouter:pin:user:%s' % user_id
+
+
+def group_pin_key(group):
+    return 'dbrouter:pin:group:%s' % group
+
+
+def down_key(alias):
+    return 'dbrouter:down:%s' % alias
+
+
+def pin_user(user_id):
+    if DATABASE_REPLICAS:
+        _cache().set(user_pin_key(user_id), 1, DB_REPLICA_PIN)
+
+
+class GroupPin:
+    # on_commit callback, equal for the same group : one per transaction
+    def __init__(self, group):
+        self.group = group
+
+    def __eq__(self, other):
+        return isinstance(other, GroupPin) and other.group == self.group
+
+    def __call__(self):
+        _cache().set(group_pin_key(self.group), 1, DB_REPLICA_PIN)
+
+
+def pin_group(group):
+    if not DATABASE_REPLICAS:
+        return
+    pin = GroupPin(group)
+    conn = transaction.get_connection()
+    if conn.in_atomic_block and any(entry[1] == pin for entry in conn.run_on_commit):
+        return
+    transaction.on_commit(pin)
+
+
+def mark_down(alias, error):
+    logger.warning('replica %s left aside for %ss : %s', alias, DB_REPLICA_RETRY, error)
+    _cache().set(down_key(alias), 1, DB_REPLICA_RETRY)
+    connections[alias].close()
+
+
+def choose_replica(aliases):
+    aliases = list(aliases)
+    random.shuffle(aliases)
+    for alias in aliases:
+        try:
+            connections[alias].ensure_connection()
+        except CONNECTION_ERRORS as e:
+            mark_down(alias, e)
+            continue
+        return alias
+    return None
+
+
+def on_replica(request, build, groups=CATALOGUE):
+    # build() with its reads on a replica if the request can use one : not
+    # pinned (the user, or a group the view depends on), a replica not left
+    # aside
+    if request.method not in ('GET', 'HEAD') or not DATABASE_REPLICAS:
+        return build()
+    pins = [group_pin_key(group) for group in groups]
+    if request.user is not None and request.user.is_authenticated:
+        pins.append(user_pin_key(request.user.pk))
+    found = _cache().get_many(pins + [down_key(alias) for alias in DATABASE_REPLICAS])
+    if any(key in found for key in pins):
+        return build()
+    alias = choose_replica(alias for alias in DATABASE_REPLICAS if down_key(alias) not in found)
+    if alias is None:
+        return build()
+    token = _replica.set(alias)
+    try:
+        return build()
+    except CONNECTION_ERRORS as e:
+        mark_down(alias, e)
+    finally:
+        _replica.reset(token)
+    return build()
+
+
+# for function views, under @api_view (and above @cache_response : its groups)
+def read_replica(view):
+    groups = getattr(view, 'cache_groups', CATALOGUE)
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        return on_replica(request, lambda: view(request, *args, **kwargs), groups)
+    return wrapper
+
+
+# for read only viewsets (with CachedResponseMixin : its groups)
+class ReplicaMixin:
+    def replica_groups(self):
+        return getattr(self, 'cache_groups', CATALOGUE)
+
+    def list(self, request, *args, **kwargs):
+        return on_replica(request, lambda: super(ReplicaMixin, self).list(request, *args, **kwargs),
+            self.replica_groups())
+
+    def retrieve(self, request, *args, **kwargs):
+        return on_replica(request, lambda: super(ReplicaMixin, self).retrieve(request, *args, **kwargs),
+            self.replica_groups())
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # same data everywhere
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replicas get the tables from the replication
+        return db not in DATABASE_REPLICAS
+
+# signals : pins
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def reservation_written(sender, instance=None, **kwargs):
+    pin_user(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def user_written(sender, instance=None, **kwargs):
+    pin_user(instance.pk)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+@receiver(m2m_changed, sender=Movie.categoriesId.through)
+def movie_written(sender, **kwargs):
+    pin_group(MOVIES)
+
+
+@receiver(post_save, sender=Screening)
+@receiver(post_delete, sender=Screening)
+def screening_written(sender, **kwargs):
+    pin_group(SCREENINGS)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_written(sender, **kwargs):
+    pin_group(CATEGORIES)
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def room_written(sender, **kwargs):
+    pin_group(ROOMS)
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.core.cache import caches
+
+# temporary holds on seats, kept in the cache (not in the database) :
+# - one key per held seat, taken with cache.add() so only one user can get it,
+#   the cache evicts it by itself after HOLD_TIMEOUT seconds
+# - the holds of a screening are read with one get_many on the keys of the
+#   seats of its room ; a marker per screening, set (not read and written
+#   back) with each hold for HOLD_TIMEOUT seconds, says if there may be any :
+#   without it nothing is read. there is no index of the holds of a
+#   screening, which two holds at the same time would have to read, change
+#   and write back (one of them would be lost)
+
+HOLDS_CACHE = getattr(settings, 'HOLDS_CACHE', 'default')
+HOLD_TIMEOUT = getattr(settings, 'HOLD_TIMEOUT', 5 * 60)
+
+
+def _cache():
+    return caches[HOLDS_CACHE]
+
+
+def hold_key(screening_id, seat_id):
+    return 'holds:seat:%s:%s' % (screening_id, seat_id)
+
+
+def active_key(screening_id):
+    return 'holds:active:%s' % screening_id
+
+
+def active_holds(screening_id, seatsIds):
+    # {seat id: user id} of the seats of seatsIds held (not expired)
+    if _cache().get(active_key(screening_id)) is None:
+        return {}
+    keys = {hold_key(screening_id, s): s for s in seatsIds}
+    return {keys[k]: holder for k, holder in _cache().get_many(keys.keys()).items()}
+
+
+def held_by_others(screening_id, seatsIds, user_id):
+    keys = {hold_key(screening_id, s): s for s in seatsIds}
+    holders = _cache().get_many(keys.keys())
+    return set(keys[k] for k, holder in holders.items() if holder != user_id)
+
+
+def place_holds(screening_id, seatsIds, user_id):
+    # all or nothing : returns the list of conflicts, empty if every seat is held
+    cache = _cache()
+    placed = []
+    conflicts = []
+    for seat in seatsIds:
+        key = hold_key(screening_id, seat)
+        if cache.add(key, user_id, HOLD_TIMEOUT):
+            placed.append(seat)
+        elif cache.get(key) == user_id:
+            cache.touch(key, HOLD_TIMEOUT)  # renew our own hold
+        else:
+            conflicts.append({'seat': seat, 'error': 'held'})
+    if conflicts:
+        cache.delete_many([hold_key(screening_id, s) for s in placed])
+        return conflicts
+    # after the seats : the marker lasts at least as long as they do
+    cache.set(active_key(screening_id), 1, HOLD_TIMEOUT)
+    return []
+
+
+def release_holds(screening_id, seatsIds, user_id):
+    keys = {hold_key(screening_id, s): s for s in seatsIds}
+    holders = _cache().get_many(keys.keys())
+    mine = [k for k, holder in holders.items() if holder == user_id]
+    _cache().delete_many(mine)
+    return set(keys[k] for k in mine)
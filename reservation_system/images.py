@@ -0,0 +1,160 @@
+import base64
+import hashlib
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+try:
+    from PIL import Image
+except ImportError:     # Pillow is optional : no resized variants without it
+    Image = None
+
+# images of the movies (image / landscape) :
+# - uploads (multipart) and base64 data urls are written by chunks to a
+#   temporary file, then renamed to <sha256 of the content>.<ext> : writes
+#   are atomic and the same image is only stored once
+# - only png, jpg, webp and gif are accepted, and the first bytes must be the
+#   ones of the format of the extension (ValueError otherwise, a 400 in the
+#   serializer)
+# - resized variants (<hash>_<variant>.<ext>) are made by a small pool of
+#   background threads, not in the request
+# - the movie only keeps the path 'images/<hash>.<ext>'
+
+logger = logging.getLogger(__name__)
+
+IMAGES_DIR = getattr(settings, 'IMAGES_DIR', os.path.join(settings.BASE_DIR, 'reservation_system', 'static'))
+IMAGES_URL_PREFIX = 'images/'
+IMAGE_VARIANTS = getattr(settings, 'IMAGE_VARIANTS', {'thumb': 300})    # name: max width
+IMAGE_WORKERS = getattr(settings, 'IMAGE_WORKERS', 2)
+CHUNK_SIZE = 64 * 1024
+
+# extension: signatures at the start of the file ('.' : any byte)
+IMAGE_SIGNATURES = {
+    'png': [b'\x89PNG\r\n\x1a\n'],
+    'jpg': [b'\xff\xd8\xff'],
+    'gif': [b'GIF87a', b'GIF89a'],
+    'webp': [b'RIFF....WEBP'],
+}
+SIGNATURE_SIZE = 12
+
+_executor = None
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='images')
+    return _executor
+
+
+def _extension(ext):
+    ext = ext.lower().lstrip('.')
+    if ext == 'jpeg':
+        ext = 'jpg'
+    if ext not in IMAGE_SIGNATURES:
+        raise ValueError('invalid image extension')
+    return ext
+
+
+def _check_signature(head, ext):
+    for signature in IMAGE_SIGNATURES[ext]:
+        if len(head) >= len(signature) and all(
+                s == ord('.') or s == h for s, h in zip(signature, head)):
+            return
+    raise ValueError('content is not a %s image' % ext)
+
+
+def _checked(chunks, ext):
+    # the chunks, once the first bytes are checked
+    head = b''
+    for chunk in chunks:
+        if head is None:
+            yield chunk
+            continue
+        head += chunk
+        if len(head) >= SIGNATURE_SIZE:
+            _check_signature(head, ext)
+            yield head
+            head = None
+    if head is not None:
+        _check_signature(head, ext)
+        yield head
+
+
+def variant_name(name, variant):
+    base, ext = os.path.splitext(name)
+    return '%s_%s%s' % (base, variant, ext)
+
+
+def _write_atomic(write, path):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _make_variants(path):
+    try:
+        with Image.open(path) as img:
+            for variant, width in IMAGE_VARIANTS.items():
+                target = variant_name(path, variant)
+                if os.path.exists(target):
+                    continue
+                copy = img.copy()
+                copy.thumbnail((width, width * 10))
+                _write_atomic(lambda f: copy.save(f, format=img.format), target)
+    except Exception:
+        logger.exception('could not make the variants of %s', path)
+
+
+def store_chunks(chunks, ext):
+    ext = _extension(ext)
+    os.makedirs(IMAGES_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=IMAGES_DIR, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in _checked(chunks, ext):
+                digest.update(chunk)
+                f.write(chunk)
+        name = digest.hexdigest() + '.' + ext
+        path = os.path.join(IMAGES_DIR, name)
+        if os.path.exists(path):
+            os.remove(tmp)  # same image already stored
+        else:
+            os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    if Image is not None and IMAGE_VARIANTS:
+        _pool().submit(_make_variants, path)
+    return IMAGES_URL_PREFIX + name
+
+
+def _base64_chunks(data):
+    if '\n' in data or '\r' in data:
+        data = ''.join(data.split())
+    step = CHUNK_SIZE // 3 * 4  # whole groups of 4 characters
+    for i in range(0, len(data), step):
+        yield base64.b64decode(data[i:i + step])
+
+
+def store_base64(value):
+    # value : data url 'data:image/png;base64,....' (binascii.Error, a
+    # ValueError, for invalid base64)
+    format, imgstr = value.split(';base64,', 1)
+    return store_chunks(_base64_chunks(imgstr), format.split('/')[-1])
+
+
+def store_upload(file):
+    ext = os.path.splitext(file.name)[1] or (file.content_type or '').split('/')[-1]
+    return store_chunks(file.chunks(CHUNK_SIZE), ext)
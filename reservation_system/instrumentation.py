@@ -0,0 +1,284 @@
+import asyncio
+import contextlib
+import logging
+import random
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from rest_framework import serializers
+
+# instrumentation of the requests (InstrumentationMiddleware, first of
+# MIDDLEWARE), numbers kept per route in the process :
+# - every request : wall time (histogram), serializer time (.data of the
+#   DRF serializers, without the queries run by it in the sampled requests),
+#   render time of the DRF / template responses, response size, errors
+# - a sample of the requests (INSTRUMENTATION_SAMPLE_RATE) : number and time
+#   of the queries on every database (the replicas too), and the same query
+#   run INSTRUMENTATION_DUPLICATES times or more in one request (N+1) is
+#   logged and counted
+# - Server-Timing header (total, db, serialize, render, app = the rest : the
+#   view)
+# - metrics_text() : Prometheus text format, report() : routes by time spent
+# the queries of the async views run in other threads (aio.py) and are not
+# counted
+
+logger = logging.getLogger(__name__)
+
+INSTRUMENTATION_SAMPLE_RATE = getattr(settings, 'INSTRUMENTATION_SAMPLE_RATE', 0.1)
+INSTRUMENTATION_DUPLICATES = getattr(settings, 'INSTRUMENTATION_DUPLICATES', 5)
+INSTRUMENTATION_SERVER_TIMING = getattr(settings, 'INSTRUMENTATION_SERVER_TIMING', True)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)    # seconds
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+class RouteStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.time = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.render = 0.0
+        self.serialize = 0.0
+        self.bytes = 0
+        self.sampled = 0
+        self.queries = 0
+        self.dbTime = 0.0
+        self.duplicates = 0
+        self.lastDuplicate = None
+
+
+_lock = threading.Lock()
+_routes = {}    # (route, method): RouteStats
+_request = threading.local()    # serialize (seconds), depth, recorder of the request of the thread
+
+
+class QueryRecorder:
+    # execute_wrapper() of every connection of a sampled request
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - start
+            self.count += 1
+            sql = IN_LIST.sub('IN (...)', sql)
+            self.statements[sql] = self.statements.get(sql, 0) + 1
+
+    def duplicates(self):
+        return [(sql, n) for sql, n in self.statements.items() if n >= INSTRUMENTATION_DUPLICATES]
+
+
+def _timed(data):
+    # .data of a serializer, timed when it is the outermost one of an
+    # instrumented request
+    def timed(self):
+        depth = getattr(_request, 'depth', None)
+        if depth is None or depth > 0:
+            return data.fget(self)
+        recorder = _request.recorder
+        dbStart = recorder.time if recorder is not None else 0.0
+        _request.depth = 1
+        start = time.perf_counter()
+        try:
+            return data.fget(self)
+        finally:
+            _request.depth = 0
+            db = recorder.time - dbStart if recorder is not None else 0.0
+            _request.serialize += time.perf_counter() - start - db
+    timed.instrumented = True
+    return property(timed)
+
+
+def time_serializers():
+    # called once (apps.py)
+    for serializerClass in (serializers.Serializer, serializers.ListSerializer):
+        data = serializerClass.__dict__['data']
+        if not getattr(data.fget, 'instrumented', False):
+            serializerClass.data = _timed(data)
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+def _response_size(response):
+    if response.streaming:
+        return 0
+    return len(response.content)
+
+
+def record(request, response, elapsed, recorder=None, serialize=0.0):
+    render = getattr(request, '_instrumentation_render', 0.0)
+    size = _response_size(response)
+    duplicates = recorder.duplicates() if recorder is not None else []
+    key = (_route(request), request.method)
+    with _lock:
+        stats = _routes.get(key)
+        if stats is None:
+            stats = _routes[key] = RouteStats()
+        stats.requests += 1
+        stats.errors += response.status_code >= 500
+        stats.time += elapsed
+        for i, bound in enumerate(BUCKETS):
+            if elapsed <= bound:
+                stats.buckets[i] += 1
+                break
+        stats.render += render
+        stats.serialize += serialize
+        stats.bytes += size
+        if recorder is not None:
+            stats.sampled += 1
+            stats.queries += recorder.count
+            stats.dbTime += recorder.time
+            if duplicates:
+                stats.duplicates += 1
+                stats.lastDuplicate = max(duplicates, key=lambda d: d[1])
+    for sql, n in duplicates:
+        logger.warning('%s %s : same query %d times (N+1 ?) : %s', request.method, key[0], n, sql)
+    if INSTRUMENTATION_SERVER_TIMING:
+        timings = ['total;dur=%.1f' % (elapsed * 1000)]
+        db = 0.0
+        if recorder is not None:
+            db = recorder.time
+            timings.append('db;dur=%.1f;desc="%d queries"' % (db * 1000, recorder.count))
+        if serialize:
+            timings.append('serialize;dur=%.1f' % (serialize * 1000))
+        if render:
+            timings.append('render;dur=%.1f' % (render * 1000))
+        timings.append('app;dur=%.1f' % (max(elapsed - db - serialize - render, 0) * 1000))
+        response['Server-Timing'] = ', '.join(timings)
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        recorder = QueryRecorder() if random.random() < INSTRUMENTATION_SAMPLE_RATE else None
+        _request.serialize, _request.depth, _request.recorder = 0.0, 0, recorder
+        try:
+            with contextlib.ExitStack() as stack:
+                if recorder is not None:
+                    for alias in connections:
+                        stack.enter_context(connections[alias].execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            serialize = _request.serialize
+            _request.depth = _request.recorder = None
+        record(request, response, time.perf_counter() - start, recorder, serialize)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        record(request, response, time.perf_counter() - start)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view
+        start = time.perf_counter()
+
+        def rendered(response):
+            request._instrumentation_render = time.perf_counter() - start
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def metrics_text():
+    with _lock:
+        routes = {key: vars(stats).copy() for key, stats in _routes.items()}
+    lines = []
+
+    def metric(name, kind, help, values):
+        lines.append('# HELP %s %s' % (name, help))
+        lines.append('# TYPE %s %s' % (name, kind))
+        lines.extend(values)
+
+    def labels(route, method, extra=''):
+        return '{route="%s",method="%s"%s}' % (_label(route), method, extra)
+
+    metric('cinema_requests_total', 'counter', 'Requests.',
+        ['cinema_requests_total%s %d' % (labels(r, m), s['requests']) for (r, m), s in routes.items()])
+    metric('cinema_request_errors_total', 'counter', 'Requests answered with a 5xx status.',
+        ['cinema_request_errors_total%s %d' % (labels(r, m), s['errors']) for (r, m), s in routes.items()])
+    values = []
+    for (r, m), s in routes.items():
+        total = 0
+        for bound, n in zip(BUCKETS, s['buckets']):
+            total += n
+            values.append('cinema_request_duration_seconds_bucket%s %d' % (labels(r, m, ',le="%s"' % bound), total))
+        values.append('cinema_request_duration_seconds_bucket%s %d' % (labels(r, m, ',le="+Inf"'), s['requests']))
+        values.append('cinema_request_duration_seconds_sum%s %f' % (labels(r, m), s['time']))
+        values.append('cinema_request_duration_seconds_count%s %d' % (labels(r, m), s['requests']))
+    metric('cinema_request_duration_seconds', 'histogram', 'Wall time of the requests.', values)
+    metric('cinema_serialize_seconds_total', 'counter', 'Time spent in the serializers, without their queries.',
+        ['cinema_serialize_seconds_total%s %f' % (labels(r, m), s['serialize']) for (r, m), s in routes.items()])
+    metric('cinema_render_seconds_total', 'counter', 'Time spent rendering the responses.',
+        ['cinema_render_seconds_total%s %f' % (labels(r, m), s['render']) for (r, m), s in routes.items()])
+    metric('cinema_response_bytes_total', 'counter', 'Size of the responses.',
+        ['cinema_response_bytes_total%s %d' % (labels(r, m), s['bytes']) for (r, m), s in routes.items()])
+    metric('cinema_sampled_requests_total', 'counter', 'Requests with their queries recorded.',
+        ['cinema_sampled_requests_total%s %d' % (labels(r, m), s['sampled']) for (r, m), s in routes.items()])
+    metric('cinema_db_queries_total', 'counter', 'Queries of the sampled requests.',
+        ['cinema_db_queries_total%s %d' % (labels(r, m), s['queries']) for (r, m), s in routes.items()])
+    metric('cinema_db_seconds_total', 'counter', 'Time in the database of the sampled requests.',
+        ['cinema_db_seconds_total%s %f' % (labels(r, m), s['dbTime']) for (r, m), s in routes.items()])
+    metric('cinema_duplicate_queries_total', 'counter', 'Sampled requests running the same query many times (N+1).',
+        ['cinema_duplicate_queries_total%s %d' % (labels(r, m), s['duplicates']) for (r, m), s in routes.items()])
+    return '\n'.join(lines) + '\n'
+
+
+def _percentile(stats, p):
+    # upper bound of the bucket holding the percentile
+    target = stats.requests * p / 100
+    total = 0
+    for bound, n in zip(BUCKETS, stats.buckets):
+        total += n
+        if total >= target:
+            return bound * 1000
+    return None     # above the last bucket
+
+
+def report():
+    # routes sorted by the time spent in them
+    with _lock:
+        routes = list(_routes.items())
+    result = []
+    for (route, method), stats in sorted(routes, key=lambda r: -r[1].time):
+        result.append({
+            'route': route,
+            'method': method,
+            'requests': stats.requests,
+            'errors': stats.errors,
+            'totalTime': stats.time,
+            'meanMs': stats.time / stats.requests * 1000,
+            'serializeMs': stats.serialize / stats.requests * 1000,
+            'p95Ms': _percentile(stats, 95),
+            'meanBytes': stats.bytes // stats.requests,
+            'queriesPerRequest': stats.queries / stats.sampled if stats.sampled else None,
+            'dbMsPerRequest': stats.dbTime / stats.sampled * 1000 if stats.sampled else None,
+            'duplicateQueries': stats.duplicates,
+            'lastDuplicate': stats.lastDuplicate,
+        })
+    return result
@@ -0,0 +1,156 @@
+import datetime
+import json
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from reservation_system import availability
+from reservation_system.management.commands.benchmark_http import percentile
+from reservation_system.models import User
+
+# end to end benchmark, in process (no server) with the configured database,
+# e.g. after generate_data :
+# - the booking flow of the documentation (urls.py) : sign-up -> login ->
+#   seats of a screening -> reservation, for --users new users
+# - the public catalogue and the admin dashboards, --repeat times each
+# latency percentiles, queries per request and requests/s (one client) per
+# endpoint, saved as JSON (--output) and compared to a previous run (--compare)
+# the users created are deleted at the end, with their reservations
+
+PASSWORD = 'bench-password'
+
+
+class Command(BaseCommand):
+    help = 'Replay the booking flow, the public catalogue and the admin dashboards and report the latency per endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='booking flows')
+        parser.add_argument('--repeat', type=int, default=20, help='requests per catalogue / dashboard endpoint')
+        parser.add_argument('--output', help='JSON file of the results')
+        parser.add_argument('--compare', help='JSON file of a previous run')
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def request(self, name, method, url, token=None, data=None):
+        headers = {'HTTP_AUTHORIZATION': 'Bearer ' + token} if token else {}
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            if method == 'post':
+                response = self.client.post(url, data=json.dumps(data), content_type='application/json', **headers)
+            else:
+                response = self.client.get(url, **headers)
+            elapsed = (time.perf_counter() - start) * 1000
+        self.results.setdefault(name, []).append((elapsed, len(queries), response.status_code))
+        return response
+
+    def signup_and_login(self, email, admin=False):
+        self.request('sign-up', 'post', '/public/request/sign-up/',
+            data={'email': email, 'password': PASSWORD, 'firstName': 'Bench', 'lastName': 'User'})
+        if admin:
+            User.objects.filter(email=email).update(is_admin=True, is_staff=True)
+        response = self.request('login', 'post', '/token/generate-token/', data={'email': email, 'password': PASSWORD})
+        return response.json()['token'] if response.status_code == 200 else None
+
+    def booking_flow(self, email, screenings):
+        token = self.signup_and_login(email)
+        if token is None or not screenings:
+            return
+        screening = self.rand.choice(screenings)
+        response = self.request('seats for screening', 'get', '/user/request/seats/screening/%d/' % screening, token)
+        free = [s['id'] for s in response.json() if not s['taken']] if response.status_code == 200 else []
+        if not free:
+            return
+        seats = self.rand.sample(free, min(len(free), self.rand.randint(1, 4)))
+        self.request('reservation', 'post', '/user/request/reservations/', token,
+            data={'screening': screening, 'seats_ids': seats})
+
+    def handle(self, *args, **options):
+        self.client = Client(HTTP_HOST=options['host'])
+        self.rand = random.Random(options['seed'])
+        self.results = {}
+        run = uuid.uuid4().hex[:8]
+        emails = []
+        screenings = list(availability.upcoming_screenings().values_list('id', flat=True)[:200])
+        movie = availability.available_movies().values_list('id', flat=True).first()
+        today = datetime.date.today()
+        public = [
+            ('movies', '/public/request/movies/'),
+            ('coming soon movies', '/public/request/movies/coming-soon/'),
+            ('screenings', '/public/request/screenings/'),
+            ('trending movies', '/public/request/movies/trending/'),
+            ('search movies', '/public/request/movies/search/?q=night'),
+            ('categories', '/public/request/categories/'),
+        ]
+        if movie is not None:
+            public.append(('screenings for movie', '/public/request/screenings/movie/%d/' % movie))
+        dashboards = [
+            ('admin trending movies', '/admin/request/movies/trending/'),
+            ('admin movies per category', '/admin/request/movies/per-categories/'),
+            ('admin number of users', '/admin/request/users/number-users/'),
+            ('admin loyal clients', '/admin/request/users/loyal-clients/'),
+            ('admin income', '/admin/request/reservations/total-numbers/'),
+            ('admin seats per category last week', '/admin/request/reservations/per-categories/last-week/'),
+            ('admin seats per category by month', '/admin/request/reservations/per-categories/series/?bucket=month&start=%s&end=%s' % (
+                today.replace(year=today.year - 1, day=1), today)),
+        ]
+        try:
+            for i in range(options['users']):
+                emails.append('bench-%s-%d@example.com' % (run, i))
+                self.booking_flow(emails[-1], screenings)
+            for name, url in public:
+                for i in range(options['repeat']):
+                    self.request(name, 'get', url)
+            emails.append('bench-%s-admin@example.com' % run)
+            adminToken = self.signup_and_login(emails[-1], admin=True)
+            for name, url in dashboards:
+                for i in range(options['repeat']):
+                    self.request(name, 'get', url, adminToken)
+        finally:
+            User.objects.filter(email__in=emails).delete()
+        report = self.report()
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write('results saved to %s' % options['output'])
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.compare(json.load(f), report)
+        self.stdout.write(self.style.SUCCESS('Benchmark done'))
+
+    def report(self):
+        endpoints = {}
+        self.stdout.write('%-40s %6s %6s %8s %8s %8s %8s %8s' % ('endpoint', 'count', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'req/s'))
+        for name, results in self.results.items():
+            latencies = [r[0] for r in results]
+            endpoint = {
+                'count': len(results),
+                'errors': sum(1 for r in results if r[2] >= 400),
+                'mean': statistics.mean(latencies),
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'max': max(latencies),
+                'queries': statistics.mean(r[1] for r in results),
+                'throughput': len(latencies) / (sum(latencies) / 1000),
+            }
+            endpoints[name] = endpoint
+            self.stdout.write('%-40s %6d %6d %8.1f %8.1f %8.1f %8.1f %8.1f' % (
+                name, endpoint['count'], endpoint['errors'], endpoint['p50'], endpoint['p95'],
+                endpoint['p99'], endpoint['queries'], endpoint['throughput']))
+        return {'date': datetime.datetime.now().isoformat(), 'database': connection.vendor, 'endpoints': endpoints}
+
+    def compare(self, previous, report):
+        self.stdout.write('%-40s %10s %10s %8s %12s' % ('endpoint', 'old p95', 'new p95', 'change', 'queries'))
+        for name, endpoint in report['endpoints'].items():
+            old = previous['endpoints'].get(name)
+            if old is None:
+                continue
+            change = (endpoint['p95'] - old['p95']) / old['p95'] * 100 if old['p95'] else 0
+            self.stdout.write('%-40s %10.1f %10.1f %+7.0f%% %5.1f -> %-5.1f' % (
+                name, old['p95'], endpoint['p95'], change, old['queries'], endpoint['queries']))
@@ -0,0 +1,55 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from reservation_system.models import User, UserManager
+from reservation_system.passwords import PASSWORD_WORKERS, PasswordPoolBusy, authenticate_user, hash_password
+
+PASSWORD = 'bench-password'
+
+
+class Command(BaseCommand):
+    help = 'Measure the sign-ups and logins per second (and per hashing core) of the password pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--concurrency', type=int, default=16, help='clients at the same time')
+
+    def handle(self, *args, **options):
+        run = uuid.uuid4().hex[:8]
+        emails = ['bench-%s-%d@example.com' % (run, i) for i in range(options['users'])]
+
+        # one connection per operation, like a request with CONN_MAX_AGE = 0
+        def signup(email):
+            try:
+                passwordHash = hash_password(PASSWORD)
+                UserManager().create_user(email, firstName='Bench', lastName='User', passwordHash=passwordHash)
+                return True
+            except PasswordPoolBusy:
+                return False
+            finally:
+                connections.close_all()
+
+        def login(email):
+            try:
+                return authenticate_user(email, PASSWORD) is not None
+            except PasswordPoolBusy:
+                return False
+            finally:
+                connections.close_all()
+
+        try:
+            for name, operation in (('sign-ups', signup), ('logins', login)):
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=options['concurrency']) as clients:
+                    done = sum(clients.map(operation, emails))
+                elapsed = time.perf_counter() - start
+                rate = done / elapsed
+                self.stdout.write('%s: %d ok, %d rejected, %.1f/s, %.1f/s per core (%d hashing threads)' % (
+                    name, done, len(emails) - done, rate, rate / PASSWORD_WORKERS, PASSWORD_WORKERS))
+        finally:
+            User.objects.filter(email__in=emails).delete()
+        self.stdout.write(self.style.SUCCESS('Benchmark done'))
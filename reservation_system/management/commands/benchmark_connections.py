@@ -0,0 +1,62 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from reservation_system.management.commands.benchmark_http import percentile
+from reservation_system.models import Category
+
+# cost of the connection per request with the configured database : the
+# request cycle of Django (request_started / request_finished signals, which
+# close or keep the connection) around one cheap query, run with
+# CONN_MAX_AGE = 0 (a connect / login per request) and with the persistent
+# connection of the settings
+
+
+class Command(BaseCommand):
+    help = 'Compare the latency of a cheap request with and without persistent database connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--max-age', type=int, default=600, help='CONN_MAX_AGE of the persistent run')
+
+    def run(self, maxAge, nb):
+        connection.close()
+        connection.settings_dict['CONN_MAX_AGE'] = maxAge
+        opened = []
+
+        def created(sender, connection, **kwargs):
+            opened.append(connection)
+        connection_created.connect(created)
+        latencies = []
+        try:
+            for i in range(nb):
+                start = time.perf_counter()
+                request_started.send(sender=self.__class__)
+                Category.objects.count()
+                request_finished.send(sender=self.__class__)
+                latencies.append((time.perf_counter() - start) * 1000)
+        finally:
+            connection_created.disconnect(created)
+        return latencies, len(opened)
+
+    def handle(self, *args, **options):
+        maxAge = connection.settings_dict['CONN_MAX_AGE']
+        self.stdout.write('%s database, %d requests per run' % (connection.vendor, options['requests']))
+        self.stdout.write('%-12s %8s %8s %8s %8s %12s' % ('CONN_MAX_AGE', 'mean ms', 'p50 ms', 'p95 ms', 'p99 ms', 'connections'))
+        means = []
+        try:
+            for age in (0, options['max_age']):
+                latencies, opened = self.run(age, options['requests'])
+                means.append(statistics.mean(latencies))
+                self.stdout.write('%-12s %8.2f %8.2f %8.2f %8.2f %12d' % (
+                    age, means[-1], percentile(latencies, 50), percentile(latencies, 95),
+                    percentile(latencies, 99), opened))
+        finally:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = maxAge
+        self.stdout.write('connection overhead : %.2f ms per request' % (means[0] - means[1]))
+        self.stdout.write(self.style.SUCCESS('Benchmark done'))
@@ -0,0 +1,64 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+# load test of a running server, e.g. the same urls on both deployments :
+#   uvicorn django_cinema.asgi:application --workers 4 --port 8001
+#   gunicorn django_cinema.wsgi:application --workers 4 --port 8002
+#   manage.py benchmark_http http://localhost:8001/public/request/async/catalogue/ ...
+#   manage.py benchmark_http http://localhost:8002/public/request/movies/ ...
+# (manage.py benchmark_servers starts both servers and compares them)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def load(url, requests, concurrency, headers=None):
+    # requests/s, errors and latencies (ms) of the requests that succeeded
+    def call(url):
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {})) as response:
+                response.read()
+            ok = True
+        except (urllib.error.URLError, ConnectionError):
+            ok = False
+        return ok, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        results = list(clients.map(call, [url] * requests))
+    elapsed = time.perf_counter() - start
+    latencies = [t * 1000 for ok, t in results if ok]
+    return len(latencies) / elapsed, len(results) - len(latencies), latencies
+
+
+class Command(BaseCommand):
+    help = 'Send requests to urls of a running server and report the requests/s and the latency percentiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+')
+        parser.add_argument('--requests', type=int, default=1000, help='requests per url')
+        parser.add_argument('--concurrency', type=int, default=64, help='clients at the same time')
+        parser.add_argument('--token', help='bearer token for the user endpoints')
+
+    def handle(self, *args, **options):
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = 'Bearer ' + options['token']
+
+        for url in options['urls']:
+            rate, errors, latencies = load(url, options['requests'], options['concurrency'], headers)
+            if not latencies:
+                self.stdout.write(self.style.ERROR('%s: %d errors' % (url, errors)))
+                continue
+            self.stdout.write('%s\n  %.1f requests/s, %d errors, latency ms : mean %.1f p50 %.1f p95 %.1f p99 %.1f max %.1f' % (
+                url, rate, errors, statistics.mean(latencies),
+                percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99), max(latencies)))
+        self.stdout.write(self.style.SUCCESS('Benchmark done'))
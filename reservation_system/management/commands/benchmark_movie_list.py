@@ -0,0 +1,79 @@
+import datetime
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from reservation_system import querysets
+from reservation_system.management.commands.benchmark_http import percentile
+from reservation_system.models import Movie, MovieStats
+from reservation_system.serializers import MovieListSerializer, MovieSerializer
+
+# pages of the movie list with the configured database, on movies with a long
+# description and large images (base64 data urls not converted to files for
+# a part of them, paths for the others) :
+# - before : every column read and sent (MovieSerializer)
+# - list : the list of the endpoints (querysets.movie_list, MovieListSerializer)
+# - fields : the list with ?fields=id,title,releaseDate
+# the movies are created for the run and deleted at the end
+
+
+class Command(BaseCommand):
+    help = 'Measure the payload and the latency of the movie list pages on thousands of movies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=5000)
+        parser.add_argument('--image-bytes', type=int, default=10000, help='size of a base64 image')
+        parser.add_argument('--legacy', type=float, default=0.5, help='part of the images still in base64')
+        parser.add_argument('--page', type=int, default=50)
+
+    def create_movies(self, options):
+        image = 'data:image/png;base64,' + 'A' * options['image_bytes']
+        legacy = int(options['movies'] * options['legacy'])
+        today = datetime.date.today()
+        movies = [Movie(title='bench movie %d' % i, director='bench', cast='bench', duration=100,
+                        description='bench ' * 400, releaseDate=today - datetime.timedelta(days=i % 3000),
+                        image=image if i < legacy else '/images/bench-%d.png' % i,
+                        landscape=image if i < legacy else '/images/bench-%d-landscape.png' % i)
+                  for i in range(options['movies'])]
+        Movie.objects.bulk_create(movies, batch_size=200)
+        ids = list(Movie.objects.filter(director='bench', title__startswith='bench movie ').values_list('id', flat=True))
+        MovieStats.objects.bulk_create([MovieStats(movie_id=id) for id in ids], batch_size=500)
+        return ids
+
+    def measure(self, ids, page, build, serializerClass, request):
+        latencies = []
+        sizes = []
+        for i in range(0, len(ids), page):
+            start = time.perf_counter()
+            movies = build(Movie.objects.filter(id__in=ids[i:i + page]), request)
+            data = serializerClass(list(movies), many=True, context={'request': request}).data
+            body = JSONRenderer().render(data)
+            latencies.append((time.perf_counter() - start) * 1000)
+            sizes.append(len(body))
+        return latencies, sizes
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        ids = self.create_movies(options)
+        try:
+            cases = (
+                ('before', lambda q, r: querysets.movies(q), MovieSerializer, Request(factory.get('/'))),
+                ('list', querysets.movie_list, MovieListSerializer, Request(factory.get('/'))),
+                ('fields', querysets.movie_list, MovieListSerializer,
+                    Request(factory.get('/', {'fields': 'id,title,releaseDate'}))),
+            )
+            self.stdout.write('%d movies, pages of %d' % (len(ids), options['page']))
+            self.stdout.write('%-8s %12s %10s %10s %10s' % ('case', 'bytes/page', 'mean ms', 'p50 ms', 'p95 ms'))
+            for name, build, serializerClass, request in cases:
+                latencies, sizes = self.measure(ids, options['page'], build, serializerClass, request)
+                self.stdout.write('%-8s %12d %10.2f %10.2f %10.2f' % (
+                    name, statistics.mean(sizes), statistics.mean(latencies),
+                    percentile(latencies, 50), percentile(latencies, 95)))
+        finally:
+            for i in range(0, len(ids), 500):
+                Movie.objects.filter(id__in=ids[i:i + 500]).delete()
+        self.stdout.write(self.style.SUCCESS('Benchmark done'))
@@ -0,0 +1,114 @@
+import datetime
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from reservation_system.management.commands.benchmark_http import percentile
+from reservation_system.models import (Movie, Room, Screening, ScreeningConflict, check_duration, check_timing,
+                                       screeningBounds)
+from reservation_system.scheduling import check_programme
+
+# conflict checks of the screenings with the configured database, in rooms
+# holding thousands of screenings (--per-day a day, every day) :
+# - before : the check before the start / end columns, the screenings of the
+#   room that day loaded with their movie (one query each)
+# - range : check_timing, one query on the (room, end) index
+# - programme : check_programme on a week of new screenings of every room,
+#   per screening
+# - duration : check_duration, a longer movie against the screenings of all
+#   its rooms
+# the rooms and the movie are created for the run and deleted at the end
+
+
+def before(instance):
+    screenings = Screening.objects.filter(date=instance.date, roomId=instance.roomId)
+    if screenings.count() != 0:
+        start = datetime.timedelta(hours=instance.time.hour, minutes=instance.time.minute)
+        end = start + datetime.timedelta(minutes=instance.movieId.duration)
+        for s in screenings:
+            start2 = datetime.timedelta(hours=s.time.hour, minutes=s.time.minute)
+            end2 = start2 + datetime.timedelta(minutes=s.movieId.duration)
+            if start < end2 and start2 < end:
+                raise ScreeningConflict('conflict in time')
+
+
+class Command(BaseCommand):
+    help = 'Measure the screening conflict checks on rooms with thousands of screenings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=3)
+        parser.add_argument('--screenings', type=int, default=5000, help='screenings per room')
+        parser.add_argument('--per-day', type=int, default=6)
+        parser.add_argument('--checks', type=int, default=200)
+
+    def measure(self, call, nb):
+        latencies = []
+        count = [0]
+
+        def counter(execute, sql, params, many, context):
+            count[0] += 1
+            return execute(sql, params, many, context)
+        with connection.execute_wrapper(counter):
+            for i in range(nb):
+                start = time.perf_counter()
+                call(i)
+                latencies.append((time.perf_counter() - start) * 1000)
+        return latencies, count[0] / nb
+
+    def report(self, case, latencies, queries):
+        self.stdout.write('%-10s %8.1f %8.2f %8.2f %8.2f' % (
+            case, queries, statistics.mean(latencies), percentile(latencies, 50), percentile(latencies, 95)))
+
+    def handle(self, *args, **options):
+        perDay = options['per_day']
+        gap = 24 * 60 // perDay     # minutes between two starts
+        movie = Movie.objects.create(title='bench', director='bench', cast='bench', duration=gap - 20,
+            description='', releaseDate=datetime.date.today())
+        rooms = [Room.objects.create(name='bench %d' % i, nbRows=1, nbColumns=1) for i in range(options['rooms'])]
+        try:
+            first = datetime.date.today() + datetime.timedelta(days=1)
+            days = options['screenings'] // perDay
+            times = [datetime.time(n * gap // 60, n * gap % 60) for n in range(perDay)]
+            screenings = []
+            for room in rooms:
+                for day in range(days):
+                    for t in times:
+                        s = Screening(movieId=movie, roomId=room, price=10, date=first + datetime.timedelta(days=day), time=t)
+                        s.startDateTime, s.endDateTime = screeningBounds(s.date, t, movie.duration)
+                        screenings.append(s)
+            Screening.objects.bulk_create(screenings, batch_size=500)
+            self.stdout.write('%d rooms, %d screenings per room' % (len(rooms), days * perDay))
+            self.stdout.write('%-10s %8s %8s %8s %8s' % ('check', 'queries', 'mean ms', 'p50 ms', 'p95 ms'))
+
+            # a new screening starting 10 minutes after an existing one : a conflict
+            def check(call, i):
+                start = datetime.datetime.combine(first, times[i % perDay]) + datetime.timedelta(minutes=10)
+                instance = Screening(movieId=movie, roomId=rooms[i % len(rooms)], price=10,
+                    date=start.date() + datetime.timedelta(days=i % days), time=start.time())
+                try:
+                    call(instance)
+                except ScreeningConflict:
+                    return True
+                raise AssertionError('conflict not found')
+
+            latencies, queries = self.measure(lambda i: check(before, i), options['checks'])
+            self.report('before', latencies, queries)
+            latencies, queries = self.measure(lambda i: check(lambda s: check_timing(Screening, s), i), options['checks'])
+            self.report('range', latencies, queries)
+
+            week = [Screening(movieId=movie, roomId=room, price=10,
+                              date=first + datetime.timedelta(days=days + day), time=t)
+                    for room in rooms for day in range(7) for t in times]
+            latencies, queries = self.measure(lambda i: check_programme(week), 5)
+            self.report('programme', [l / len(week) for l in latencies], queries / len(week))
+
+            movie.duration += 10
+            latencies, queries = self.measure(lambda i: check_duration(Movie, movie), 5)
+            self.report('duration', latencies, queries)
+        finally:
+            for room in rooms:
+                room.delete()
+            movie.delete()
+        self.stdout.write(self.style.SUCCESS('Benchmark done'))
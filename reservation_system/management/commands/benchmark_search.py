@@ -0,0 +1,107 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from rest_framework import filters
+from rest_framework.request import Request
+
+from reservation_system.management.commands.benchmark_http import percentile
+from reservation_system.models import Movie, MovieSearchTerm
+from reservation_system.search import MovieSearchFilter, movie_terms, search_movies
+
+# search of the movies with the configured database, on thousands of movies
+# with random words in title / director / cast, the same queries (prefixes of
+# one or two words) for every case :
+# - before : SearchFilter of rest_framework on the 3 fields (icontains, a
+#   full scan of the table)
+# - filter : MovieSearchFilter (?search= of the lists, prefix of the terms)
+# - ranked : search_movies (public/request/movies/search/?q=)
+# matches is the mean number of movies found : SearchFilter finds a word
+# anywhere in the text ('ark' finds 'dark'), the index only finds the words
+# starting with it
+# the movies are created for the run and deleted at the end
+
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+class Command(BaseCommand):
+    help = 'Measure the movie search with the index against the icontains SearchFilter'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=5000)
+        parser.add_argument('--words', type=int, default=2000, help='size of the vocabulary')
+        parser.add_argument('--queries', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def create_movies(self, rand, vocabulary, nb):
+        def text(n):
+            return ' '.join(rand.choice(vocabulary) for i in range(n))
+        today = datetime.date.today()
+        Movie.objects.bulk_create([Movie(title='bench ' + text(3), director='bench ' + text(2), cast=text(6),
+                                         duration=100, description='', releaseDate=today) for i in range(nb)],
+                                  batch_size=200)
+        # bulk_create does not send post_save : the terms are indexed here
+        movies = list(Movie.objects.filter(director__startswith='bench ', title__startswith='bench ').only(
+            'id', 'title', 'director', 'cast'))
+        MovieSearchTerm.objects.bulk_create([MovieSearchTerm(movie_id=movie.id, term=term, weight=weight)
+                                             for movie in movies for term, weight in movie_terms(movie).items()],
+                                            batch_size=500)
+        return [movie.id for movie in movies]
+
+    def measure(self, call, queries):
+        latencies = []
+        matches = []
+        count = [0]
+
+        def counter(execute, sql, params, many, context):
+            count[0] += 1
+            return execute(sql, params, many, context)
+        with connection.execute_wrapper(counter):
+            for query in queries:
+                start = time.perf_counter()
+                matches.append(call(query))
+                latencies.append((time.perf_counter() - start) * 1000)
+        return latencies, count[0] / len(queries), statistics.mean(matches)
+
+    def handle(self, *args, **options):
+        rand = random.Random(options['seed'])
+        vocabulary = list({''.join(rand.choice(LETTERS) for i in range(rand.randint(3, 9)))
+                           for n in range(options['words'])})
+        ids = self.create_movies(rand, vocabulary, options['movies'])
+        factory = RequestFactory()
+
+        def prefix(word):
+            return word[:rand.randint(2, len(word))]
+        queries = [prefix(rand.choice(vocabulary)) if i % 2 else
+                   prefix(rand.choice(vocabulary)) + ' ' + prefix(rand.choice(vocabulary))
+                   for i in range(options['queries'])]
+
+        class View:
+            search_fields = ['title', 'director', 'cast']
+
+        def filtered(backend):
+            def call(query):
+                request = Request(factory.get('/', {'search': query}))
+                return len(list(backend.filter_queryset(request, Movie.objects.only('id'), View())[:20]))
+            return call
+        try:
+            cases = (
+                ('before', filtered(filters.SearchFilter())),
+                ('filter', filtered(MovieSearchFilter())),
+                ('ranked', lambda query: len(search_movies(query))),
+            )
+            self.stdout.write('%d movies, %d words, first 20 results' % (len(ids), len(vocabulary)))
+            self.stdout.write('%-8s %8s %8s %8s %8s %8s' % ('case', 'queries', 'matches', 'mean ms', 'p50 ms', 'p95 ms'))
+            for name, call in cases:
+                latencies, nbQueries, matches = self.measure(call, queries)
+                self.stdout.write('%-8s %8.1f %8.1f %8.2f %8.2f %8.2f' % (
+                    name, nbQueries, matches, statistics.mean(latencies),
+                    percentile(latencies, 50), percentile(latencies, 95)))
+        finally:
+            for i in range(0, len(ids), 500):
+                Movie.objects.filter(id__in=ids[i:i + 500]).delete()
+        self.stdout.write(self.style.SUCCESS('Benchmark done'))
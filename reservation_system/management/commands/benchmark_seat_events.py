@@ -0,0 +1,51 @@
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from reservation_system.management.commands.benchmark_http import percentile
+from reservation_system.seatevents import broker, get_backend, seats_changed
+
+
+class Command(BaseCommand):
+    help = ('Simulate subscribers of the seat events of a screening and measure the time to '
+            'deliver bursts of seat changes to all of them (with the configured backend)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=5000)
+        parser.add_argument('--bursts', type=int, default=50)
+        parser.add_argument('--seats', type=int, default=20, help='seats changed per burst')
+        parser.add_argument('--screening', type=int, default=0)
+
+    def handle(self, *args, **options):
+        asyncio.run(self.simulate(**options))
+
+    async def simulate(self, subscribers, bursts, seats, screening, **options):
+        get_backend().start()
+        subscriptions = [broker.subscribe(screening) for i in range(subscribers)]
+        loop = asyncio.get_running_loop()
+        latencies = []
+        messages = 0
+        try:
+            for burst in range(bursts):
+                start = time.perf_counter()
+                # a burst of changes from another thread, as the request threads do
+                for seat in range(seats):
+                    await loop.run_in_executor(None, seats_changed, screening, [seat], burst % 2 == 0)
+                for subscription in subscriptions:
+                    await subscription.queue.get()
+                    messages += 1
+                    while not subscription.queue.empty():
+                        subscription.queue.get_nowait()
+                        messages += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+        finally:
+            for subscription in subscriptions:
+                broker.unsubscribe(subscription)
+        self.stdout.write('%d subscribers, %d bursts of %d seats : %d messages delivered (%.2f per subscriber and burst)' % (
+            subscribers, bursts, seats, messages, messages / subscribers / bursts))
+        self.stdout.write('time to reach every subscriber, ms : mean %.1f p50 %.1f p95 %.1f p99 %.1f max %.1f' % (
+            statistics.mean(latencies), percentile(latencies, 50), percentile(latencies, 95),
+            percentile(latencies, 99), max(latencies)))
+        self.stdout.write(self.style.SUCCESS('Benchmark done'))
@@ -0,0 +1,84 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from reservation_system.management.commands.benchmark_http import percentile
+from reservation_system.models import Movie, Reservation, Room, Screening, Seat, SeatReserved, User
+from reservation_system.seatmap import invalidate_occupancy, seat_map
+
+# seat map of rooms of growing size, with the configured database and cache :
+# - before : one query per seat (the seat map before the cached bitmap)
+# - cold : bitmap rebuilt (after a booking), warm : layout and bitmap cached
+# a room, a movie, a screening and a user are created for each size and
+# deleted at the end
+
+
+class Command(BaseCommand):
+    help = 'Measure the queries and the latency of the seat map for rooms up to 10k seats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='20x30,50x50,100x100', help='rows x columns of the rooms')
+        parser.add_argument('--fill', type=float, default=0.3, help='part of the seats reserved')
+        parser.add_argument('--requests', type=int, default=50, help='seat maps per size and case')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def measure(self, call, nb, before=None):
+        latencies = []
+        queries = []
+        for i in range(nb):
+            if before is not None:
+                before()
+            count = [0]
+
+            def counter(execute, sql, params, many, context):
+                count[0] += 1
+                return execute(sql, params, many, context)
+            with connection.execute_wrapper(counter):
+                start = time.perf_counter()
+                call()
+                latencies.append((time.perf_counter() - start) * 1000)
+            queries.append(count[0])
+        return latencies, statistics.mean(queries)
+
+    def report(self, size, case, latencies, queries):
+        self.stdout.write('%-10s %-8s %8.1f %8.2f %8.2f %8.2f' % (
+            size, case, queries, statistics.mean(latencies), percentile(latencies, 50), percentile(latencies, 95)))
+
+    def handle(self, *args, **options):
+        rand = random.Random(options['seed'])
+        self.stdout.write('%-10s %-8s %8s %8s %8s %8s' % ('room', 'case', 'queries', 'mean ms', 'p50 ms', 'p95 ms'))
+        for size in options['sizes'].split(','):
+            rows, columns = (int(n) for n in size.split('x'))
+            room = Room.objects.create(name='bench %s' % size, nbRows=rows, nbColumns=columns)
+            movie = Movie.objects.create(title='bench', director='bench', cast='bench', duration=90,
+                description='', releaseDate=datetime.date.today())
+            user = User.objects.create(email='bench-seatmap-%s@example.com' % size, firstName='Bench', lastName='User')
+            try:
+                screening = Screening.objects.create(movieId=movie, roomId=room, price=10,
+                    date=datetime.date.today() + datetime.timedelta(days=365), time=datetime.time(20))
+                seats = list(Seat.objects.filter(room=room).values_list('id', flat=True))
+                reservation = Reservation.objects.create(user=user, screeningId=screening, total=0)
+                SeatReserved.objects.bulk_create([
+                    SeatReserved(screening=screening, seatId_id=seat, reservation=reservation)
+                    for seat in rand.sample(seats, int(len(seats) * options['fill']))], batch_size=500)
+
+                def before():
+                    return [{'id': seat, 'taken': SeatReserved.objects.filter(
+                        screening=screening, seatId=seat).exists()} for seat in seats]
+                # the naive version is slow : a few runs only
+                latencies, queries = self.measure(before, min(options['requests'], 3))
+                self.report(size, 'before', latencies, queries)
+                latencies, queries = self.measure(lambda: seat_map(screening, user), options['requests'],
+                    lambda: invalidate_occupancy(screening.id))
+                self.report(size, 'cold', latencies, queries)
+                latencies, queries = self.measure(lambda: seat_map(screening, user), options['requests'])
+                self.report(size, 'warm', latencies, queries)
+            finally:
+                room.delete()
+                movie.delete()
+                user.delete()
+        self.stdout.write(self.style.SUCCESS('Benchmark done'))
@@ -0,0 +1,90 @@
+import importlib.util
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from reservation_system.management.commands.benchmark_http import load, percentile
+
+# the ASGI deployment against the WSGI one, on the same machine and database :
+# - wsgi : gunicorn django_cinema.wsgi (--workers processes of --threads
+#   threads), the sync views
+# - asgi sync : uvicorn django_cinema.asgi (--workers processes), the sync
+#   views (run by Django in a thread)
+# - asgi async : uvicorn, the async views (async_views.py)
+# both servers are started by the command (uvicorn and gunicorn must be
+# installed) with the settings of the command, and stopped at the end ;
+# after the first request of a worker the pages come from the response cache
+# (the cache of the settings), as in production
+
+PAGES = (
+    # sync view, async view
+    ('public/request/movies/', 'public/request/async/movies/'),
+    ('public/request/screenings/', 'public/request/async/screenings/'),
+    ('public/request/movies/trending/', 'public/request/async/movies/trending/'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Start uvicorn and gunicorn and compare the requests/s and latency of the sync and async views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='processes of each server')
+        parser.add_argument('--threads', type=int, default=8, help='threads of a gunicorn worker')
+        parser.add_argument('--requests', type=int, default=1000, help='requests per page and case')
+        parser.add_argument('--concurrency', type=int, default=64, help='clients at the same time')
+        parser.add_argument('--port', type=int, default=8701, help='uvicorn port, gunicorn on the next one')
+
+    def start(self, args, port):
+        server = subprocess.Popen([sys.executable, '-m'] + args, cwd=settings.BASE_DIR)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError('%s exited with %d' % (args[0], server.returncode))
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError('%s not listening on %d' % (args[0], port))
+
+    def handle(self, *args, **options):
+        for module in ('uvicorn', 'gunicorn'):
+            if importlib.util.find_spec(module) is None:
+                raise CommandError('%s is not installed' % module)
+        workers = str(options['workers'])
+        asgiPort, wsgiPort = options['port'], options['port'] + 1
+        servers = []
+        try:
+            servers.append(self.start(['uvicorn', 'django_cinema.asgi:application', '--workers', workers,
+                                       '--port', str(asgiPort), '--log-level', 'warning', '--no-access-log'], asgiPort))
+            servers.append(self.start(['gunicorn', 'django_cinema.wsgi:application', '--workers', workers,
+                                       '--threads', str(options['threads']), '--bind', '127.0.0.1:%d' % wsgiPort,
+                                       '--log-level', 'warning'], wsgiPort))
+            self.stdout.write('%s workers, %d clients, %d requests per case' % (
+                workers, options['concurrency'], options['requests']))
+            self.stdout.write('%-40s %-10s %8s %6s %8s %8s %8s %8s' % (
+                'page', 'case', 'req/s', 'errors', 'mean ms', 'p50 ms', 'p95 ms', 'p99 ms'))
+            for syncPage, asyncPage in PAGES:
+                for case, port, page in (('wsgi', wsgiPort, syncPage), ('asgi sync', asgiPort, syncPage),
+                                         ('asgi async', asgiPort, asyncPage)):
+                    url = 'http://127.0.0.1:%d/%s' % (port, page)
+                    load(url, options['workers'] * 4, 4)    # warm up : a cached page in each worker
+                    rate, errors, latencies = load(url, options['requests'], options['concurrency'])
+                    if not latencies:
+                        self.stdout.write(self.style.ERROR('%-40s %-10s %d errors' % (syncPage, case, errors)))
+                        continue
+                    self.stdout.write('%-40s %-10s %8.1f %6d %8.1f %8.1f %8.1f %8.1f' % (
+                        syncPage, case, rate, errors, statistics.mean(latencies),
+                        percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99)))
+        finally:
+            for server in servers:
+                server.terminate()
+            for server in servers:
+                server.wait()
+        self.stdout.write(self.style.SUCCESS('Benchmark done'))
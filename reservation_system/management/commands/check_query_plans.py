@@ -0,0 +1,118 @@
+import datetime
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from reservation_system import availability, querysets
+from reservation_system.models import DailyCategoryRollup, Movie, MovieSearchTerm, Reservation, Screening, Seat, SeatReserved
+from reservation_system.search import _matching
+from reservation_system.views import nbLoyalClients, nbTrendingMovies, nbTrendingMoviesAdmin
+
+# EXPLAIN of the main query of each endpoint (the query reading the rows of
+# the page, not the prefetches) : fails if one of them reads a whole table
+# instead of an index, e.g. after a new filter / ordering without its index
+# run against a large dataset (generate_data) : on a few rows the planner may
+# prefer a scan. --analyze updates the statistics of the planner first
+# sqlite and postgresql use Django's explain(), SQL Server SHOWPLAN_TEXT
+
+PAGE = 51   # page size + 1, as the cursor pagination reads it
+
+FULL_SCANS = {
+    # (pattern, group of the table name)
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(\w+)(?: AS \w+)?(?! USING)(?: |$)'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'microsoft': re.compile(r'(?:Table Scan|Clustered Index Scan)\(OBJECT:\(\[[^\]]*\]\.\[[^\]]*\]\.\[(\w+)\]'),
+}
+
+
+def endpoint_queries():
+    screening = availability.upcoming_screenings().first() or Screening.objects.first()
+    reservation = Reservation.objects.order_by('-id').first()
+    movie = Movie.objects.order_by('-id').first()
+    term = MovieSearchTerm.objects.values_list('term', flat=True).first()
+    if screening is None or reservation is None or movie is None or term is None:
+        raise CommandError('no data : run generate_data first')
+    seats = list(Seat.objects.filter(room=screening.roomId_id).values_list('id', flat=True)[:4])
+    user = reservation.user_id
+    today = datetime.date.today()
+    return [
+        ('available movies', querysets.movie_list(availability.available_movies()).order_by('-releaseDate', '-id')[:PAGE]),
+        ('coming soon movies', querysets.movie_list(availability.coming_soon_movies()).order_by('-releaseDate', '-id')[:PAGE]),
+        ('upcoming screenings', querysets.screenings(availability.upcoming_screenings())[:PAGE]),
+        ('screenings for movie', querysets.screenings(
+            availability.upcoming_screenings().filter(movieId__id=movie.id))[:PAGE]),
+        ('screenings for movie (admin)', querysets.screenings(
+            Screening.objects.filter(movieId__id=movie.id)).order_by('startDateTime', 'id')[:PAGE]),
+        ('seat layout', Seat.objects.filter(room__id=screening.roomId_id).order_by(
+            'row', 'number').values_list('id', 'row', 'number')),
+        ('seats taken', SeatReserved.objects.filter(screening__id=screening.id).values_list(
+            'seatId__row', 'seatId__number')),
+        ('booking conflicts', SeatReserved.objects.filter(
+            screening=screening, seatId__in=seats).values_list('seatId', flat=True)),
+        ('screening conflicts', Screening.objects.filter(
+            roomId__in=[screening.roomId_id], endDateTime__gt=screening.startDateTime,
+            startDateTime__lt=screening.endDateTime).order_by('startDateTime').values_list(
+            'roomId', 'startDateTime', 'endDateTime', 'id')),
+        ('user reservations', querysets.reservations(Reservation.objects.filter(user=user)).order_by('id')[:PAGE]),
+        ('reservation details', querysets.reservations(Reservation.objects.filter(user=user, id=reservation.id))[:1]),
+        ('search movies', _matching(term[:3]).values_list('movie', 'weight')),
+        ('seats per category', DailyCategoryRollup.objects.filter(
+            day__gte=today - datetime.timedelta(days=7), day__lt=today).values_list(
+            'category', 'seats')),
+        ('trending movies', querysets.trending_stats(availability.available_movies()).values_list(
+            'movie', flat=True)[:nbTrendingMovies]),
+        ('trending movies (admin)', querysets.trending_stats().values_list('movie', flat=True)[:nbTrendingMoviesAdmin]),
+        ('loyal clients', querysets.loyal_users_stats()[:nbLoyalClients]),
+    ]
+
+
+def _showplan(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('SET SHOWPLAN_TEXT ON')
+        try:
+            cursor.execute(sql, params)
+            rows = []
+            while True:
+                rows += [r[0] for r in cursor.fetchall()]
+                if not cursor.nextset():
+                    break
+        finally:
+            cursor.execute('SET SHOWPLAN_TEXT OFF')
+    return '\n'.join(rows)
+
+
+def plan(queryset):
+    if connection.vendor == 'microsoft':
+        return _showplan(queryset)
+    return queryset.explain()
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the main query of each endpoint and fail if one of them scans a whole table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true', help='update the statistics of the planner first')
+
+    def handle(self, *args, **options):
+        pattern = FULL_SCANS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError('query plans of %s are not supported' % connection.vendor)
+        if options['analyze'] and connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        failed = []
+        for name, queryset in endpoint_queries():
+            text = plan(queryset)
+            scans = sorted(set(m.group(1) for line in text.splitlines() for m in pattern.finditer(line)))
+            if scans:
+                failed.append(name)
+                self.stdout.write(self.style.ERROR('%-30s full scan of %s' % (name, ', '.join(scans))))
+            else:
+                self.stdout.write('%-30s ok' % name)
+            if options['verbosity'] > 1 or scans:
+                self.stdout.write('    ' + text.replace('\n', '\n    '))
+        if failed:
+            raise CommandError('%d queries scan a whole table : %s' % (len(failed), ', '.join(failed)))
+        self.stdout.write(self.style.SUCCESS('Every query uses an index'))
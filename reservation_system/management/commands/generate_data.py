@@ -0,0 +1,160 @@
+import bisect
+import datetime
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from reservation_system.models import (Category, Movie, Reservation, Room, Screening, Seat, SeatReserved,
+                                       User, screeningBounds)
+
+# synthetic data for the benchmarks, written with bulk inserts (no signal) :
+# the movie stats, the rollups and the search index are rebuilt at the end
+# e.g. manage.py generate_data --movies 5000 --rooms 40 --past-days 180 --fill 0.5
+# gives millions of seats reserved
+
+WORDS = ('night', 'city', 'lost', 'love', 'war', 'star', 'dark', 'river', 'king', 'last', 'secret', 'summer',
+         'ghost', 'road', 'blue', 'fire', 'dream', 'shadow', 'island', 'empire', 'storm', 'heart', 'silent',
+         'golden', 'wild', 'broken', 'little', 'final', 'hidden', 'iron')
+NAMES = ('Martin', 'Bernard', 'Dubois', 'Thomas', 'Robert', 'Richard', 'Petit', 'Durand', 'Leroy', 'Moreau',
+         'Simon', 'Laurent', 'Lefebvre', 'Michel', 'Garcia', 'David', 'Bertrand', 'Roux', 'Vincent', 'Fournier')
+CATEGORIES = ('Action', 'Adventure', 'Animation', 'Comedy', 'Crime', 'Documentary', 'Drama', 'Family',
+              'Fantasy', 'Horror', 'Romance', 'Science Fiction', 'Thriller', 'War')
+SLOTS = (datetime.time(10), datetime.time(13, 30), datetime.time(17), datetime.time(20, 30))
+BATCH_SIZE = 5000
+
+
+def _name(rand, words):
+    return ' '.join(rand.choice(WORDS) for i in range(words)).title()
+
+
+class Command(BaseCommand):
+    help = 'Generate movies, rooms, users, screenings and reservations for the benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=2000)
+        parser.add_argument('--rooms', type=int, default=20)
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--past-days', type=int, default=60, help='days of screenings before today')
+        parser.add_argument('--future-days', type=int, default=30, help='days of screenings from today')
+        parser.add_argument('--fill', type=float, default=0.3, help='part of the seats reserved')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rand = random.Random(options['seed'])
+        today = datetime.date.today()
+        categories = self.categories()
+        movies = self.movies(rand, options['movies'], categories, today, options['future_days'])
+        rooms = self.rooms(rand, options['rooms'])
+        users = self.users(rand, options['users'])
+        self.stdout.write('%d movies, %d rooms, %d users' % (len(movies), len(rooms), len(users)))
+        nbScreenings = nbSeats = 0
+        for offset in range(-options['past_days'], options['future_days']):
+            day = today + datetime.timedelta(days=offset)
+            with transaction.atomic():
+                screenings = self.screenings(rand, day, movies, rooms)
+                nbScreenings += len(screenings)
+                nbSeats += self.reservations(rand, screenings, rooms, users, options['fill'])
+        self.stdout.write('%d screenings, %d seats reserved' % (nbScreenings, nbSeats))
+        call_command('rebuild_movie_stats', stdout=self.stdout)
+        call_command('rebuild_rollups', stdout=self.stdout)
+        call_command('rebuild_search_index', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS('Data generated'))
+
+    def categories(self):
+        existing = set(Category.objects.values_list('name', flat=True))
+        Category.objects.bulk_create([Category(name=name) for name in CATEGORIES if name not in existing])
+        return list(Category.objects.values_list('id', flat=True))
+
+    def movies(self, rand, nb, categories, today, futureDays):
+        first = Movie.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        Movie.objects.bulk_create([Movie(
+            title='%s %d' % (_name(rand, rand.randint(1, 3)), first + i),
+            director='%s %s' % (rand.choice(NAMES), rand.choice(NAMES)),
+            cast=', '.join('%s %s' % (rand.choice(NAMES), rand.choice(NAMES)) for j in range(3)),
+            duration=rand.randint(80, 180),
+            description=' '.join(rand.choice(WORDS) for j in range(60)),
+            releaseDate=today + datetime.timedelta(days=rand.randint(-720, futureDays + 60)),
+        ) for i in range(nb)], batch_size=BATCH_SIZE)
+        movies = list(Movie.objects.filter(id__gt=first).only('id', 'duration', 'releaseDate'))
+        Through = Movie.categoriesId.through
+        Through.objects.bulk_create([
+            Through(movie_id=m.id, category_id=c)
+            for m in movies for c in rand.sample(categories, rand.randint(1, 3))], batch_size=BATCH_SIZE)
+        movies.sort(key=lambda m: m.releaseDate)
+        return movies
+
+    def rooms(self, rand, nb):
+        rooms = []
+        for i in range(nb):
+            # create_seats (post_save) adds the seats of the room
+            room = Room.objects.create(name='Room %d' % (i + 1), nbRows=rand.randint(8, 25), nbColumns=rand.randint(10, 30))
+            rooms.append((room, list(Seat.objects.filter(room=room).values_list('id', flat=True))))
+        return rooms
+
+    def users(self, rand, nb):
+        first = User.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        password = make_password('password')    # hashed once
+        User.objects.bulk_create([User(
+            email='user%d@example.com' % (first + i), firstName=rand.choice(NAMES), lastName=rand.choice(NAMES),
+            password=password) for i in range(nb)], batch_size=BATCH_SIZE)
+        users = list(User.objects.filter(id__gt=first).values_list('id', flat=True))
+        Token.objects.bulk_create([Token(key=Token.generate_key(), user_id=id) for id in users], batch_size=BATCH_SIZE)
+        return users
+
+    def screenings(self, rand, day, movies, rooms):
+        # 4 screenings a day in every room, 3h30 apart : no conflict in time
+        released = bisect.bisect_right([m.releaseDate for m in movies], day)
+        if not released:
+            return []
+        screenings = []
+        for room, seats in rooms:
+            for slot in SLOTS:
+                movie = movies[rand.randrange(released)]
+                start, end = screeningBounds(day, slot, movie.duration)
+                screenings.append(Screening(movieId=movie, roomId=room, price=rand.choice((6, 8, 10, 12)),
+                    date=day, time=slot, startDateTime=start, endDateTime=end))
+        Screening.objects.bulk_create(screenings)
+        return list(Screening.objects.filter(date=day, roomId__in=[r.id for r, s in rooms]).order_by('id'))
+
+    def reservations(self, rand, screenings, rooms, users, fill):
+        seatsOfRoom = {room.id: seats for room, seats in rooms}
+        groups = {}     # screening id: list of seats of each reservation
+        reservations = []
+        for screening in screenings:
+            seats = seatsOfRoom[screening.roomId_id]
+            taken = rand.sample(seats, int(len(seats) * fill))
+            groups[screening.id] = []
+            while taken:
+                size = rand.randint(1, 4)
+                group, taken = taken[:size], taken[size:]
+                groups[screening.id].append(group)
+                booked = screening.date - datetime.timedelta(days=rand.randint(0, 14))
+                reservations.append(Reservation(user_id=rand.choice(users), screeningId=screening,
+                    total=len(group) * screening.price, date=booked,
+                    time=datetime.time(rand.randint(8, 23), rand.randint(0, 59))))
+        if not reservations:
+            return 0
+        # date / time are auto_now_add : keep the generated ones
+        fields = [Reservation._meta.get_field('date'), Reservation._meta.get_field('time')]
+        try:
+            for field in fields:
+                field.auto_now_add = False
+            Reservation.objects.bulk_create(reservations, batch_size=BATCH_SIZE)
+        finally:
+            for field in fields:
+                field.auto_now_add = True
+        # the ids in the order of the inserts (not returned by every database)
+        ids = {}
+        for id, screening in Reservation.objects.filter(screeningId__in=groups.keys()).order_by(
+                'screeningId', 'id').values_list('id', 'screeningId'):
+            ids.setdefault(screening, []).append(id)
+        seatsReserved = []
+        for screening, reservationsGroups in groups.items():
+            for id, group in zip(ids.get(screening, []), reservationsGroups):
+                seatsReserved += [SeatReserved(screening_id=screening, seatId_id=seat, reservation_id=id) for seat in group]
+        SeatReserved.objects.bulk_create(seatsReserved, batch_size=BATCH_SIZE)
+        return len(seatsReserved)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from reservation_system.models import Movie
+
+
+class Command(BaseCommand):
+    help = 'Move the base64 images still stored in the movies table to image files'
+
+    def handle(self, *args, **options):
+        ids = list(Movie.objects.filter(
+            Q(image__contains=';base64,') | Q(landscape__contains=';base64,')).values_list('id', flat=True))
+        updated = 0
+        for id in ids:
+            # one movie at a time : save_images writes the files
+            try:
+                Movie.objects.get(id=id).save()
+                updated += 1
+            except ValueError as e:
+                self.stderr.write('movie %d : %s' % (id, e))
+        self.stdout.write(self.style.SUCCESS('%d movies updated' % updated))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from reservation_system.stats import rebuild_movie_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the viewers and the last screening date of every movie'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_movie_stats()
+        self.stdout.write(self.style.SUCCESS('Movie stats rebuilt'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from reservation_system.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily rollups and the totals of the reservations read by the dashboards'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS('Rollups rebuilt'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from reservation_system.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search index of the movies'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
@@ -0,0 +1,31 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from reservation_system.dbrouter import DATABASE_REPLICAS
+
+# the replication of the local setup : with sqlite, the replicas are copies
+# of the primary file made by this command (run it after migrate, then to
+# publish the writes). the other databases replicate by themselves
+
+
+class Command(BaseCommand):
+    help = 'Copy the sqlite primary database into the sqlite replicas'
+
+    def handle(self, *args, **options):
+        if not DATABASE_REPLICAS:
+            raise CommandError('no replica : set DB_REPLICAS')
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('only the sqlite replicas are copied, %s replicates by itself' % primary.vendor)
+        primary.ensure_connection()
+        for alias in DATABASE_REPLICAS:
+            connections[alias].close()
+            target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write('%s -> %s' % (primary.settings_dict['NAME'], connections[alias].settings_dict['NAME']))
+        self.stdout.write(self.style.SUCCESS('Replicas synced'))
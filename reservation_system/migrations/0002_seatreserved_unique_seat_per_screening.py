@@ -0,0 +1,55 @@
+import logging
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+CHUNK = 500     # ids per query, under the 2100 parameters of SQL Server
+
+logger = logging.getLogger(__name__)
+
+
+# a seat can only be reserved once per screening :
+# remove the double bookings made before the constraint existed (keep the first one),
+# recompute the total of the reservations which lost seats and log what was removed ;
+# the double bookings are found by the database (GROUP BY ... HAVING), only
+# their rows are read
+def remove_duplicate_seats_reserved(apps, schema_editor):
+    SeatReserved = apps.get_model('reservation_system', 'SeatReserved')
+    Reservation = apps.get_model('reservation_system', 'Reservation')
+    groups = SeatReserved.objects.values('screening', 'seatId').annotate(
+        Count('id'), first=Min('id')).filter(id__count__gt=1).values_list('screening', 'seatId', 'first')
+    duplicates = []
+    for screening, seat, first in groups:
+        duplicates.extend(SeatReserved.objects.filter(screening=screening, seatId=seat).exclude(id=first).values_list(
+            'id', 'screening', 'seatId', 'reservation'))
+    if not duplicates:
+        return
+    for id, screening, seat, reservation in duplicates:
+        logger.warning('double booking removed : seat reserved %s (screening %s, seat %s, reservation %s)',
+                       id, screening, seat, reservation)
+    ids = [d[0] for d in duplicates]
+    for i in range(0, len(ids), CHUNK):
+        SeatReserved.objects.filter(id__in=ids[i:i + CHUNK]).delete()
+    reservations = sorted(set(d[3] for d in duplicates))
+    for i in range(0, len(reservations), CHUNK):
+        rows = Reservation.objects.filter(id__in=reservations[i:i + CHUNK]).annotate(
+            nbSeats=Count('seatreserved')).values_list('id', 'total', 'nbSeats', 'screeningId__price')
+        for id, total, nbSeats, price in rows:
+            Reservation.objects.filter(id=id).update(total=nbSeats * price)
+            logger.warning('reservation %s : %s seats left, total %s -> %s', id, nbSeats, total, nbSeats * price)
+    logger.warning('%d double bookings removed, %d reservations updated', len(duplicates), len(reservations))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation_system', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_seats_reserved, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='seatreserved',
+            constraint=models.UniqueConstraint(fields=('screening', 'seatId'), name='unique_seat_per_screening'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.0 on 2026-10-18 00:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Max
+
+
+def fill_movie_stats(apps, schema_editor):
+    Movie = apps.get_model('reservation_system', 'Movie')
+    MovieStats = apps.get_model('reservation_system', 'MovieStats')
+    Screening = apps.get_model('reservation_system', 'Screening')
+    SeatReserved = apps.get_model('reservation_system', 'SeatReserved')
+    viewers = dict(SeatReserved.objects.values_list('screening__movieId').annotate(Count('id')).order_by())
+    last = dict(Screening.objects.values_list('movieId').annotate(Max('date')).order_by())
+    MovieStats.objects.bulk_create([
+        MovieStats(movie_id=id, viewers=viewers.get(id, 0), lastScreeningDate=last.get(id))
+        for id in Movie.objects.values_list('id', flat=True)], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation_system', '0002_seatreserved_unique_seat_per_screening'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieStats',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='reservation_system.Movie')),
+                ('viewers', models.IntegerField(default=0)),
+                ('lastScreeningDate', models.DateField(null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'movie stats',
+                'db_table': 'movie_stats',
+            },
+        ),
+        migrations.RunPython(fill_movie_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.0 on 2026-10-18 00:59
+
+import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_start_end(apps, schema_editor):
+    Screening = apps.get_model('reservation_system', 'Screening')
+    screenings = list(Screening.objects.select_related('movieId'))
+    for s in screenings:
+        s.startDateTime = timezone.make_aware(datetime.datetime.combine(s.date, s.time))
+        s.endDateTime = s.startDateTime + datetime.timedelta(minutes=s.movieId.duration)
+    Screening.objects.bulk_update(screenings, ['startDateTime', 'endDateTime'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation_system', '0003_moviestats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='screening',
+            name='endDateTime',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='screening',
+            name='startDateTime',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_start_end, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='screening',
+            index=models.Index(fields=['roomId', 'endDateTime'], name='screening_room_end_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.0 on 2026-10-18 01:02
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def fill_last_screening_start(apps, schema_editor):
+    MovieStats = apps.get_model('reservation_system', 'MovieStats')
+    Screening = apps.get_model('reservation_system', 'Screening')
+    last = Screening.objects.values_list('movieId').annotate(Max('startDateTime')).order_by()
+    for movie, start in last:
+        MovieStats.objects.filter(movie_id=movie).update(lastScreeningStart=start)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation_system', '0004_screening_start_end'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='moviestats',
+            name='lastScreeningStart',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(fill_last_screening_start, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='moviestats',
+            name='lastScreeningDate',
+        ),
+        migrations.AddIndex(
+            model_name='screening',
+            index=models.Index(fields=['startDateTime'], name='screening_start_idx'),
+        ),
+    ]
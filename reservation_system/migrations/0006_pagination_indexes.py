@@ -0,0 +1,29 @@
+# Generated by Django 3.0 on 2026-10-18 01:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation_system', '0005_upcoming_screenings'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='screening',
+            name='screening_start_idx',
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['releaseDate', 'id'], name='movie_release_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['user', 'id'], name='reservation_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='screening',
+            index=models.Index(fields=['startDateTime', 'id'], name='screening_start_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.0 on 2026-10-18 01:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+import re
+import unicodedata
+
+
+def tokenize(text):
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return [t[:50] for t in re.findall(r'\w+', text)]
+
+
+def fill_search_index(apps, schema_editor):
+    Movie = apps.get_model('reservation_system', 'Movie')
+    MovieSearchTerm = apps.get_model('reservation_system', 'MovieSearchTerm')
+    terms = []
+    for movie in Movie.objects.only('id', 'title', 'director', 'cast'):
+        weights = {}
+        for field, weight in (('title', 3), ('director', 2), ('cast', 1)):
+            for term in tokenize(getattr(movie, field)):
+                weights[term] = max(weights.get(term, 0), weight)
+        terms += [MovieSearchTerm(movie_id=movie.id, term=t, weight=w) for t, w in weights.items()]
+    MovieSearchTerm.objects.bulk_create(terms, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation_system', '0006_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieSearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=50)),
+                ('weight', models.IntegerField()),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='reservation_system.Movie')),
+            ],
+            options={
+                'db_table': 'movie_search_terms',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='moviesearchterm',
+            index=models.Index(fields=['term', 'movie'], name='search_term_idx'),
+        ),
+        migrations.RunPython(fill_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.0 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation_system', '0007_moviesearchterm'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['date'], name='reservation_date_idx'),
+        ),
+    ]
@@ -0,0 +1,153 @@
+# Generated by Django 3.0 on 2026-10-18 10:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+
+
+def fill_rollups(apps, schema_editor):
+    Reservation = apps.get_model('reservation_system', 'Reservation')
+    SeatReserved = apps.get_model('reservation_system', 'SeatReserved')
+
+    def grouped(reservationFields, seatFields):
+        result = {}
+        for row in Reservation.objects.values_list(*reservationFields).annotate(Count('id'), Sum('total')).order_by():
+            result[row[:-2]] = {'reservations': row[-2], 'seats': 0, 'income': row[-1] or 0}
+        for row in SeatReserved.objects.values_list(*seatFields).annotate(Count('id')).order_by():
+            result.setdefault(row[:-1], {'reservations': 0, 'seats': 0, 'income': 0})['seats'] = row[-1]
+        return result
+
+    rollups = (
+        ('DailyMovieRollup', 'movie_id', 'screeningId__movieId', 'screening__movieId'),
+        ('DailyCategoryRollup', 'category_id', 'screeningId__movieId__categoriesId', 'screening__movieId__categoriesId'),
+        ('DailyScreeningRollup', 'screening_id', 'screeningId', 'screening'),
+        ('DailyUserRollup', 'user_id', 'user', 'reservation__user'),
+    )
+    for name, field, reservationField, seatField in rollups:
+        model = apps.get_model('reservation_system', name)
+        rows = grouped(('date', reservationField), ('reservation__date', seatField))
+        model.objects.bulk_create([
+            model(day=day, **{field: id}, **values)
+            for (day, id), values in rows.items() if id is not None], batch_size=500)
+    UserStats = apps.get_model('reservation_system', 'UserStats')
+    UserStats.objects.bulk_create([
+        UserStats(user_id=id, **values)
+        for (id,), values in grouped(('user',), ('reservation__user',)).items()], batch_size=500)
+    ReservationTotals = apps.get_model('reservation_system', 'ReservationTotals')
+    totals = Reservation.objects.aggregate(reservations=Count('id'), income=Sum('total'))
+    ReservationTotals.objects.create(id=1, reservations=totals['reservations'],
+        income=totals['income'] or 0, seats=SeatReserved.objects.count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation_system', '0008_reservation_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMovieRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('reservations', models.IntegerField(default=0)),
+                ('seats', models.IntegerField(default=0)),
+                ('income', models.FloatField(default=0)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reservation_system.Movie')),
+            ],
+            options={
+                'db_table': 'rollup_movies_daily',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyCategoryRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('reservations', models.IntegerField(default=0)),
+                ('seats', models.IntegerField(default=0)),
+                ('income', models.FloatField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reservation_system.Category')),
+            ],
+            options={
+                'db_table': 'rollup_categories_daily',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyUserRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('reservations', models.IntegerField(default=0)),
+                ('seats', models.IntegerField(default=0)),
+                ('income', models.FloatField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'rollup_users_daily',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyScreeningRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('reservations', models.IntegerField(default=0)),
+                ('seats', models.IntegerField(default=0)),
+                ('income', models.FloatField(default=0)),
+                ('screening', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reservation_system.Screening')),
+            ],
+            options={
+                'db_table': 'rollup_screenings_daily',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('reservations', models.IntegerField(default=0)),
+                ('seats', models.IntegerField(default=0)),
+                ('income', models.FloatField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'user stats',
+                'db_table': 'user_stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='ReservationTotals',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reservations', models.IntegerField(default=0)),
+                ('seats', models.IntegerField(default=0)),
+                ('income', models.FloatField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'reservation totals',
+                'db_table': 'reservation_totals',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailymovierollup',
+            constraint=models.UniqueConstraint(fields=('day', 'movie'), name='unique_movie_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycategoryrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'category'), name='unique_category_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyuserrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'user'), name='unique_user_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyscreeningrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'screening'), name='unique_screening_day'),
+        ),
+        migrations.AddIndex(
+            model_name='userstats',
+            index=models.Index(fields=['reservations'], name='user_stats_reservations_idx'),
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.0 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation_system', '0009_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='screening',
+            index=models.Index(fields=['movieId', 'startDateTime', 'id'], name='screening_movie_start_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='seat',
+            constraint=models.UniqueConstraint(fields=('room', 'row', 'number'), name='unique_seat_position'),
+        ),
+    ]
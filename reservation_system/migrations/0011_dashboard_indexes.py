@@ -0,0 +1,25 @@
+# Generated by Django 3.0 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation_system', '0010_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='userstats',
+            name='user_stats_reservations_idx',
+        ),
+        migrations.AddIndex(
+            model_name='userstats',
+            index=models.Index(fields=['reservations', 'user'], name='user_stats_loyal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='moviestats',
+            index=models.Index(fields=['viewers', 'movie'], name='movie_stats_viewers_idx'),
+        ),
+    ]
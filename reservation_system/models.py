@@ -1,20 +1,22 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.conf import settings
 from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
-from django.db.models import Q
+from django.db.models import Exists, F, OuterRef, Q
 import datetime
-import base64
+
+from .images import store_base64
 
 # models for authentication
 
 
 class UserManager(BaseUserManager):
-    def create_user(self, email, password=None, firstName=None, lastName=None):
+    def create_user(self, email, password=None, firstName=None, lastName=None, passwordHash=None):
+        # passwordHash : password already hashed (see passwords.py)
         if not email:
             raise ValueError('The given email must be set')
         user_model = get_user_model()
@@ -22,8 +24,13 @@ class UserManager(BaseUserManager):
         #user= self.model(email = self.normalize_email(email))
         user.firstName = firstName
         user.lastName = lastName
-        user.set_password(password)
-        user.save(using=self._db)
+        if passwordHash is not None:
+            user.password = passwordHash
+        else:
+            user.set_password(password)
+        # the user and its token (create_auth_token) are inserted together
+        with transaction.atomic(using=self._db):
+            user.save(using=self._db)
         return user
 
     def create_superuser(self, email, password, firstName=None, lastName=None):
@@ -108,6 +115,37 @@ class Movie(models.Model):
     class Meta:
         db_table = "movies"
         ordering = ["-releaseDate"]
+        indexes = [
+            models.Index(fields=['releaseDate', 'id'], name='movie_release_idx'),
+        ]
+
+
+# precomputed numbers of a movie, kept up to date by the signals of stats.py
+class MovieStats(models.Model):
+    movie = models.OneToOneField(
+        Movie, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    viewers = models.IntegerField(default=0)
+    lastScreeningStart = models.DateTimeField(null=True)
+
+    class Meta:
+        db_table = "movie_stats"
+        verbose_name_plural = "movie stats"
+        indexes = [
+            models.Index(fields=['viewers', 'movie'], name='movie_stats_viewers_idx'),
+        ]
+
+
+# inverted index of the movies for the search (see search.py)
+class MovieSearchTerm(models.Model):
+    term = models.CharField(max_length=50)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.IntegerField()
+
+    class Meta:
+        db_table = "movie_search_terms"
+        indexes = [
+            models.Index(fields=['term', 'movie'], name='search_term_idx'),
+        ]
 
 
 class Room(models.Model):
@@ -126,6 +164,18 @@ class Seat(models.Model):
 
     class Meta:
         db_table = "seats"
+        constraints = [
+            # one seat per position, in the order of the seat map
+            models.UniqueConstraint(fields=['room', 'row', 'number'], name='unique_seat_position'),
+        ]
+
+
+class ScreeningQuerySet(models.QuerySet):
+    # screenings which have not started yet : one range scan on startDateTime
+    def upcoming(self, now=None):
+        if now is None:
+            now = timezone.now()
+        return self.filter(startDateTime__gte=now)
 
 
 class Screening(models.Model):
@@ -134,6 +184,11 @@ class Screening(models.Model):
     price = models.FloatField()
     date = models.DateField()
     time = models.TimeField()
+    # computed from date, time and the duration of the movie (see check_timing)
+    startDateTime = models.DateTimeField(null=True, editable=False)
+    endDateTime = models.DateTimeField(null=True, editable=False)
+
+    objects = ScreeningQuerySet.as_manager()
 
     @property
     def status(self):
@@ -150,6 +205,11 @@ class Screening(models.Model):
     class Meta:
         db_table = "screenings"
         ordering = ["date", "time"]
+        indexes = [
+            models.Index(fields=['roomId', 'endDateTime'], name='screening_room_end_idx'),
+            models.Index(fields=['startDateTime', 'id'], name='screening_start_idx'),
+            models.Index(fields=['movieId', 'startDateTime', 'id'], name='screening_movie_start_idx'),
+        ]
 
 
 class Reservation(models.Model):
@@ -174,6 +234,10 @@ class Reservation(models.Model):
     class Meta:
         db_table = "reservations"
         ordering = ["date", "time"]
+        indexes = [
+            models.Index(fields=['user', 'id'], name='reservation_user_idx'),
+            models.Index(fields=['date'], name='reservation_date_idx'),
+        ]
 
 
 class SeatReserved(models.Model):
@@ -183,113 +247,243 @@ class SeatReserved(models.Model):
 
     @property
     def seat(self):
-        return Seat.objects.get(id=self.seatId.id)
+        return self.seatId
 
     class Meta:
         db_table = "seats_reserved"
         verbose_name_plural = "seats reserved"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['screening', 'seatId'], name='unique_seat_per_screening'),
+        ]
+
+
+# daily summaries of the reservations, read by the dashboards (see rollups.py)
+class DailyRollup(models.Model):
+    day = models.DateField()
+    reservations = models.IntegerField(default=0)
+    seats = models.IntegerField(default=0)
+    income = models.FloatField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class DailyMovieRollup(DailyRollup):
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
+
+    class Meta:
+        db_table = "rollup_movies_daily"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'movie'], name='unique_movie_day'),
+        ]
+
+
+class DailyCategoryRollup(DailyRollup):
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+
+    class Meta:
+        db_table = "rollup_categories_daily"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='unique_category_day'),
+        ]
+
+
+class DailyUserRollup(DailyRollup):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    class Meta:
+        db_table = "rollup_users_daily"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'user'], name='unique_user_day'),
+        ]
+
+
+class DailyScreeningRollup(DailyRollup):
+    screening = models.ForeignKey(Screening, on_delete=models.CASCADE)
+
+    class Meta:
+        db_table = "rollup_screenings_daily"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'screening'], name='unique_screening_day'),
+        ]
+
+
+# totals of a user since the beginning (loyal clients)
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    reservations = models.IntegerField(default=0)
+    seats = models.IntegerField(default=0)
+    income = models.FloatField(default=0)
+
+    class Meta:
+        db_table = "user_stats"
+        verbose_name_plural = "user stats"
+        indexes = [
+            models.Index(fields=['reservations', 'user'], name='user_stats_loyal_idx'),
+        ]
+
+
+# totals of all the reservations, split in ROLLUP_TOTALS_SHARDS rows (see rollups.py)
+class ReservationTotals(models.Model):
+    reservations = models.IntegerField(default=0)
+    seats = models.IntegerField(default=0)
+    income = models.FloatField(default=0)
+
+    class Meta:
+        db_table = "reservation_totals"
+        verbose_name_plural = "reservation totals"
 
 # methods to add info (properties) to models
 
 
+def getStatsOfMovie(movie):
+    try:
+        return movie.stats
+    except MovieStats.DoesNotExist:
+        return None
+
+
+# a movie / screening is available until the start of its (last) screening
 def setStatusToMovie(movie):
-    today = datetime.datetime.combine(datetime.date.today(), datetime.time.min)
-    query = Screening.objects.filter(movieId=movie.id)
-    query = query.filter(Q(date__gt=today.date()) | (
-        Q(date=today.date()) & Q(time__gte=today.time())))
-    if query.count() > 0:
+    stats = getStatsOfMovie(movie)
+    if stats is not None:
+        if stats.lastScreeningStart is not None and stats.lastScreeningStart >= timezone.now():
+            return 'AVAILABLE'
+        return 'NOT_AVAILABLE'
+    if Screening.objects.filter(movieId=movie.id).upcoming().exists():
         return 'AVAILABLE'
     return 'NOT_AVAILABLE'
 
 
 def setStatusToScreening(screening):
-    today = datetime.datetime.combine(datetime.date.today(), datetime.time.min)
-    if screening.date > today.date():
-        return 'AVAILABLE'
-    if screening.date == today.date() and screening.time >= today.time():
+    start = screening.startDateTime
+    if start is None:
+        start = timezone.make_aware(datetime.datetime.combine(screening.date, screening.time))
+    if start >= timezone.now():
         return 'AVAILABLE'
     return 'NOT_AVAILABLE'
 
 
+def screeningBounds(date, time, duration):
+    start = timezone.make_aware(datetime.datetime.combine(date, time))
+    return start, start + datetime.timedelta(minutes=duration)
+
+
 def setViewersToMovie(movie):
+    stats = getStatsOfMovie(movie)
+    if stats is not None:
+        return stats.viewers
     return SeatReserved.objects.filter(screening__movieId=movie.id).count()
 
 
+# uses the seats prefetched by querysets.reservations() if any
 def seatReservedForReservation(reservation):
-    return SeatReserved.objects.filter(reservation__id=reservation.id)
+    return reservation.seatreserved_set.all()
 
 
+# uses the count annotated by querysets.users() if any
 def setNbReservationsForUser(user):
+    if hasattr(user, 'reservations_count'):
+        return user.reservations_count
     return Reservation.objects.filter(user=user).count()
 
 # signals
 
 
-# after creating a room, automatically create seats
+class RoomResizeError(Exception):
+    pass
+
+
+# rows of 3 parameters : stays under the 2100 parameters of SQL Server
+SEATS_BATCH_SIZE = 500
+
+
+# a room can not lose seats that are already reserved
+@receiver(pre_save, sender=Room)
+def check_resize(sender, instance=None, **kwargs):
+    if instance.pk is not None:
+        removed = SeatReserved.objects.filter(seatId__room=instance.pk).filter(
+            Q(seatId__row__gt=instance.nbRows) | Q(seatId__number__gt=instance.nbColumns))
+        if removed.exists():
+            raise RoomResizeError('reserved seats can not be removed')
+
+
+# after creating or resizing a room, automatically create (or remove) seats
 @receiver(post_save, sender=Room)
-def create_seats(sender, instance=None, created=False, **kwargs):
-    if created:
-        i = 0
-        while i != instance.nbRows:
-            i = i + 1
-            j = 0
-            while j != instance.nbColumns:
-                j = j + 1
-                seat = Seat(room=instance, row=i, number=j)
-                seat.save()
+def create_seats(sender, instance=None, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    existing = set()
+    if not created:
+        existing = set(Seat.objects.filter(room=instance).values_list('row', 'number'))
+    with transaction.atomic():
+        Seat.objects.bulk_create([
+            Seat(room=instance, row=i, number=j)
+            for i in range(1, instance.nbRows + 1)
+            for j in range(1, instance.nbColumns + 1)
+            if (i, j) not in existing], batch_size=SEATS_BATCH_SIZE)
+        if any(i > instance.nbRows or j > instance.nbColumns for i, j in existing):
+            Seat.objects.filter(room=instance).filter(
+                Q(row__gt=instance.nbRows) | Q(number__gt=instance.nbColumns)).delete()
+
+
+class ScreeningConflict(Exception):
+    pass
 
 
 # check if there is another screening in the same room at the same time
+# (one query on the (room, end) index, works across midnight)
 @receiver(pre_save, sender=Screening)
 def check_timing(sender, instance=None, **kwargs):
-    screenings = Screening.objects.filter(
-        date=instance.date, roomId=instance.roomId)
-    if screenings.count() != 0:
-        start = datetime.timedelta(
-            hours=instance.time.hour, minutes=instance.time.minute)
-        end = start + datetime.timedelta(minutes=instance.movieId.duration)
-        for s in screenings:
-            start2 = datetime.timedelta(
-                hours=s.time.hour, minutes=s.time.minute)
-            end2 = start2 + datetime.timedelta(minutes=s.movieId.duration)
-            if start == start2:
-                raise Exception('conflict in time')
-            if end == end2:
-                raise Exception('conflict in time')
-            if start >= start2 and start < end2:
-                raise Exception('conflict in time')
-            if end >= start2 and end < end2:
-                raise Exception('conflict in time')
-            if start < start2 and end > end2:
-                raise Exception('conflict in time')
+    instance.startDateTime, instance.endDateTime = screeningBounds(
+        instance.date, instance.time, instance.movieId.duration)
+    screenings = Screening.objects.filter(roomId=instance.roomId_id,
+        endDateTime__gt=instance.startDateTime, startDateTime__lt=instance.endDateTime)
+    if instance.pk is not None:
+        screenings = screenings.exclude(pk=instance.pk)
+    if screenings.exists():
+        raise ScreeningConflict('conflict in time')
+
+
+# a longer movie must not make its screenings overlap the next ones in their
+# rooms (one query : the screenings of the movie with another one starting in
+# the room during the new duration, a range of the start index ; the ones
+# before already end before it)
+@receiver(pre_save, sender=Movie)
+def check_duration(sender, instance=None, raw=False, **kwargs):
+    if instance.pk is None or raw:
+        return
+    old = Movie.objects.filter(pk=instance.pk).values_list('duration', flat=True).first()
+    if old is None or instance.duration <= old:
+        return
+    others = Screening.objects.filter(roomId=OuterRef('roomId'), startDateTime__gte=OuterRef('startDateTime'),
+        startDateTime__lt=OuterRef('startDateTime') + datetime.timedelta(minutes=instance.duration)).exclude(
+        pk=OuterRef('pk'))
+    if Screening.objects.filter(movieId=instance.pk).filter(Exists(others)).exists():
+        raise ScreeningConflict('conflict in time')
+
+
+# the end of the screenings depends on the duration of the movie
+@receiver(post_save, sender=Movie)
+def update_screenings_end(sender, instance=None, created=False, **kwargs):
+    if not created:
+        Screening.objects.filter(movieId=instance).update(
+            endDateTime=F('startDateTime') + datetime.timedelta(minutes=instance.duration))
 
 
 # receiver for adding a movie pre_save : base64->file for image and landscape
+# (see images.py), an empty value keeps the current image
 @receiver(pre_save, sender=Movie)
 def save_images(sender, instance=None, **kwargs):
-    if instance.image != '' and instance.image is not None:
-        if ';base64,' in instance.image:
-            format, imgstr = instance.image.split(';base64,')
-            ext = format.split('/')[-1]
-            name = str(instance.id) + 'Image.' + ext
-            file = open('reservation_system/static/'+name, 'wb')
-            file.write(base64.b64decode(imgstr))
-            file.close()
-            instance.image = 'images/' + name
-    else:
-        movie = Movie.objects.filter(pk=instance.id).first()
-        if movie is not None:
-            instance.image = movie.image
-    if instance.landscape != '' and instance.landscape is not None:
-        if ';base64,' in instance.landscape:
-            format, imgstr = instance.landscape.split(';base64,')
-            ext = format.split('/')[-1]
-            name = str(instance.id) + 'Landscape.' + ext
-            file = open('reservation_system/static/'+name, 'wb')
-            file.write(base64.b64decode(imgstr))
-            file.close()
-            instance.landscape = 'images/' + name
-    else:
-        movie = Movie.objects.filter(pk=instance.id).first()
-        if movie is not None:
-            instance.landscape = movie.landscape
\ No newline at end of file
+    old = None
+    for field in ('image', 'landscape'):
+        value = getattr(instance, field)
+        if value != '' and value is not None:
+            if ';base64,' in value:
+                setattr(instance, field, store_base64(value))
+        elif instance.pk is not None:
+            if old is None:
+                old = Movie.objects.filter(pk=instance.pk).values('image', 'landscape').first() or {}
+            setattr(instance, field, old.get(field))
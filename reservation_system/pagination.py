@@ -0,0 +1,97 @@
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+# cursor pagination for every list : the cursor holds the position in the
+# ordering, so page N is read with the same index range scan as page 1
+# (an offset would make the database skip all the rows before the page)
+# the position is the value of every ordering field (DRF's cursor only keeps
+# the first one and skips the ties with an offset) : the last field must be
+# unique (id), the page starts strictly after the position
+# ?page_size= is accepted up to MAX_PAGE_SIZE
+
+MAX_PAGE_SIZE = getattr(settings, 'MAX_PAGE_SIZE', 200)
+
+
+class CinemaCursorPagination(CursorPagination):
+    ordering = ('id',)
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            name = field.lstrip('-')
+            values.append(str(instance[name] if isinstance(instance, dict) else getattr(instance, name)))
+        return json.dumps(values)
+
+    def _after(self, ordering, values):
+        # rows after the position : a <= x and (a < x or (b <= y and (b < y or ...))),
+        # the first condition is the range of the index
+        field, value = ordering[0], values[0]
+        name = field.lstrip('-')
+        lookup = '__lt' if field.startswith('-') else '__gt'
+        if len(ordering) == 1:
+            return Q(**{name + lookup: value})
+        return Q(**{name + lookup + 'e': value}) & (
+            Q(**{name + lookup: value}) | self._after(ordering[1:], values[1:]))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor is not None else None
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            try:
+                values = json.loads(position)
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+            if not isinstance(values, list) or len(values) != len(ordering):
+                raise NotFound(self.invalid_cursor_message)
+            queryset = queryset.filter(self._after(ordering, values))
+
+        # one more row tells if there is a page after this one
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following = None
+        if len(results) > len(self.page):
+            following = self._get_position_from_instance(results[-1], self.ordering)
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next, self.next_position = position is not None, position
+            self.has_previous, self.previous_position = following is not None, following
+        else:
+            self.has_next, self.next_position = following is not None, following
+            self.has_previous, self.previous_position = position is not None, position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+
+# reservations are created in (date, time) order : the id gives the same order
+class ReservationPagination(CinemaCursorPagination):
+    ordering = ('id',)
+
+
+# (startDateTime, id) is the (date, time, id) order
+class ScreeningPagination(CinemaCursorPagination):
+    ordering = ('startDateTime', 'id')
+
+
+# many movies share a release date : the id makes the position unique
+class MoviePagination(CinemaCursorPagination):
+    ordering = ('-releaseDate', '-id')
+
+
+class UserPagination(CinemaCursorPagination):
+    ordering = ('id',)
@@ -0,0 +1,80 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as WaitTimeout
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, identify_hasher, make_password
+
+# the password hashing (PBKDF2, ~100 ms of CPU) of the login and sign-up runs
+# in a bounded pool of threads (hashlib releases the GIL, so the threads hash
+# in parallel) :
+# - at most PASSWORD_WORKERS hashes at the same time, whatever the number of
+#   requests
+# - at most PASSWORD_QUEUE more requests wait for a thread : the others get
+#   PasswordPoolBusy (503) at once (the slots are taken without blocking)
+#   instead of piling up on the workers during a sign-up burst
+# - a request waits PASSWORD_WAIT seconds at most for its hash, then gets a
+#   503 too (its hash is cancelled if not started ; a slot is released when
+#   its hash is done or cancelled, not when the request gives up)
+# the iterations of PBKDF2 can be set with PASSWORD_ITERATIONS, the passwords
+# hashed with another number are re-hashed at the next login
+
+PASSWORD_WORKERS = getattr(settings, 'PASSWORD_WORKERS', None) or os.cpu_count() or 1
+PASSWORD_QUEUE = getattr(settings, 'PASSWORD_QUEUE', 4 * PASSWORD_WORKERS)
+PASSWORD_WAIT = getattr(settings, 'PASSWORD_WAIT', 2)     # seconds
+PASSWORD_ITERATIONS = getattr(settings, 'PASSWORD_ITERATIONS', None)
+
+_executor = None
+_slots = threading.BoundedSemaphore(PASSWORD_WORKERS + PASSWORD_QUEUE)
+
+
+class PasswordPoolBusy(Exception):
+    retry_after = 1     # seconds
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    iterations = PASSWORD_ITERATIONS or PBKDF2PasswordHasher.iterations
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix='passwords')
+    return _executor
+
+
+def run(func, *args):
+    if not _slots.acquire(blocking=False):
+        raise PasswordPoolBusy()
+    try:
+        future = _pool().submit(func, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda f: _slots.release())
+    try:
+        return future.result(timeout=PASSWORD_WAIT)
+    except WaitTimeout:
+        future.cancel()
+        raise PasswordPoolBusy()
+
+
+def hash_password(password):
+    return run(make_password, password)
+
+
+def authenticate_user(email, password):
+    # authenticate() of the ModelBackend, with the hashing in the pool
+    UserModel = get_user_model()
+    try:
+        user = UserModel._default_manager.get_by_natural_key(email)
+    except UserModel.DoesNotExist:
+        hash_password(password)     # as long as a wrong password
+        return None
+    if not run(check_password, password, user.password) or not user.is_active:
+        return None
+    if identify_hasher(user.password).must_update(user.password):
+        user.password = hash_password(password)
+        user.save(update_fields=['password'])
+    return user
@@ -0,0 +1,89 @@
+from django.db.models import Case, Count, F, Prefetch, TextField, Value, When
+
+from .serializers import requested_fields
+from .models import Movie, MovieStats, Reservation, Screening, SeatReserved, User, UserStats
+
+# querysets loading everything the serializers need in a fixed number of
+# queries (no query per row) :
+# - MovieSerializer : stats (viewers, status) + categories
+# - ScreeningSerializer : movie + room
+# - ReservationSerializer : screening + seats reserved with their seat
+# - UserSerializer : number of reservations (counted, or from the rollups)
+# the dashboards (trending movies, loyal clients) read the top of an index of
+# the stats tables (MovieStats.viewers, UserStats.reservations), then only the
+# rows they show
+# the lists of movies (MovieListSerializer, also nested in the screenings and
+# the reservations) never load the description nor the image columns : the
+# database sends the path of the images instead (imagePath, landscapePath),
+# null for a base64 data url not converted to a file yet, and only for the
+# images in ?fields=
+
+# large columns of a movie, the description is never sent in lists
+LARGE_MOVIE_FIELDS = ('image', 'landscape')
+
+
+def movies(queryset=None):
+    if queryset is None:
+        queryset = Movie.objects.all()
+    return queryset.select_related('stats').prefetch_related('categoriesId')
+
+
+def image_path(field):
+    return Case(When(**{field + '__startswith': 'data:'}, then=Value(None)),
+                default=F(field), output_field=TextField())
+
+
+def movie_list(queryset=None, request=None):
+    fields = requested_fields(request)
+    paths = {field + 'Path': image_path(field) for field in LARGE_MOVIE_FIELDS
+             if fields is None or field in fields}
+    return movies(queryset).defer('description', *LARGE_MOVIE_FIELDS).annotate(**paths)
+
+
+def screenings(queryset=None):
+    if queryset is None:
+        queryset = Screening.objects.all()
+    return queryset.select_related('roomId').prefetch_related(Prefetch('movieId', queryset=movie_list()))
+
+
+def reservations(queryset=None):
+    if queryset is None:
+        queryset = Reservation.objects.all()
+    return queryset.select_related('screeningId__roomId').prefetch_related(
+        Prefetch('screeningId__movieId', queryset=movie_list()),
+        Prefetch('seatreserved_set', queryset=SeatReserved.objects.select_related('seatId')))
+
+
+def users(queryset=None):
+    if queryset is None:
+        queryset = User.objects.all()
+    return queryset.annotate(reservations_count=Count('reservation'))
+
+
+def trending_stats(queryset=None):
+    # MovieStats of the movies of queryset, most viewers first
+    stats = MovieStats.objects.order_by('-viewers', '-movie_id')
+    if queryset is not None:
+        stats = stats.filter(movie__in=queryset.values('id'))
+    return stats
+
+
+def trending(queryset=None, request=None, limit=10):
+    ids = list(trending_stats(queryset).values_list('movie', flat=True)[:limit])
+    movies = movie_list(Movie.objects.filter(id__in=ids), request).in_bulk()
+    return [movies[id] for id in ids if id in movies]
+
+
+def loyal_users_stats():
+    # UserStats of the clients, most reservations first
+    return UserStats.objects.filter(user__is_staff=False, user__is_admin=False).select_related(
+        'user').order_by('-reservations', '-user_id')
+
+
+def loyal_users(limit=10):
+    # number of reservations read from the rollups (UserStats), not counted
+    users = []
+    for stats in loyal_users_stats()[:limit]:
+        stats.user.reservations_count = stats.reservations
+        users.append(stats.user)
+    return users
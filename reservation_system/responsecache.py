@@ -0,0 +1,177 @@
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import Category, Movie, Room, Screening
+
+# cache of the responses of the public (anonymous, read only) endpoints
+# - the key is made of the url (with the host : the pagination links are
+#   absolute), the query parameters and the generation of every group of data
+#   the endpoint depends on
+# - a signal on a model bumps the generation of its group : the responses
+#   built with the old generation are never read again and expire
+# - the seats reserved (viewers of the movies) change at every booking : their
+#   generation is a period of RESPONSE_CACHE_SEATS_REFRESH seconds instead, the
+#   viewers in the cached responses may be late by this much
+# - the ETag is a hash of the data, a request with a matching If-None-Match
+#   gets a 304 without body
+
+RESPONSE_CACHE = getattr(settings, 'RESPONSE_CACHE', 'default')
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 5 * 60)
+RESPONSE_CACHE_SEATS_REFRESH = getattr(settings, 'RESPONSE_CACHE_SEATS_REFRESH', 60)
+
+MOVIES = 'movies'
+SCREENINGS = 'screenings'
+CATEGORIES = 'categories'
+ROOMS = 'rooms'
+SEATS = 'seats'     # seats reserved : viewers of the movies, refreshed on a timer
+
+
+def _cache():
+    return caches[RESPONSE_CACHE]
+
+
+def generation_key(group):
+    return 'responsecache:generation:%s' % group
+
+
+def bump(*groups):
+    for group in groups:
+        try:
+            _cache().incr(generation_key(group))
+        except ValueError:
+            # start from the time so a lost generation never comes back to an old value
+            _cache().set(generation_key(group), int(time.time() * 1000), None)
+
+
+def _count(name):
+    key = 'responsecache:%s' % name
+    if not _cache().add(key, 1, None):
+        try:
+            _cache().incr(key)
+        except ValueError:
+            pass
+
+
+def cache_stats():
+    hits = _cache().get('responsecache:hits', 0)
+    misses = _cache().get('responsecache:misses', 0)
+    return {'hits': hits, 'misses': misses}
+
+
+def _generations(groups):
+    generations = _cache().get_many([generation_key(g) for g in groups if g != SEATS])
+    return [int(time.time() // RESPONSE_CACHE_SEATS_REFRESH) if g == SEATS else generations.get(generation_key(g))
+            for g in groups]
+
+
+def response_key(request, groups):
+    params = sorted(request.query_params.lists())
+    raw = '%s?%s|%s' % (request.build_absolute_uri(request.path), params, _generations(groups))
+    return 'responsecache:response:%s' % hashlib.md5(raw.encode()).hexdigest()
+
+
+def etag_matches(request, etag):
+    # If-None-Match : * or a list of ETags (weak ones compared without W/)
+    etags = [e[2:] if e.startswith('W/') else e for e in parse_etags(request.headers.get('If-None-Match', ''))]
+    return '*' in etags or etag in etags
+
+
+def _response(request, data, etag, hit):
+    if etag_matches(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+    response['ETag'] = etag
+    response['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
+
+def lookup(request, groups):
+    # (key, entry or None), entry : {'data': .., 'etag': ..}
+    key = response_key(request, groups)
+    entry = _cache().get(key)
+    _count('hits' if entry is not None else 'misses')
+    return key, entry
+
+
+def store(key, data):
+    etag = '"%s"' % hashlib.md5(JSONRenderer().render(data)).hexdigest()
+    _cache().set(key, {'data': data, 'etag': etag}, RESPONSE_CACHE_TIMEOUT)
+    return etag
+
+
+def cached_response(request, groups, build):
+    # only the anonymous GET : an authenticated user (e.g. an admin on the
+    # admin lists) gets a fresh response
+    if request.method != 'GET' or request.user.is_authenticated:
+        return build()
+    key, entry = lookup(request, groups)
+    if entry is not None:
+        return _response(request, entry['data'], entry['etag'], True)
+    response = build()
+    if response.status_code != status.HTTP_200_OK:
+        return response
+    etag = store(key, response.data)
+    return _response(request, response.data, etag, False)
+
+
+# for function views, under @api_view
+def cache_response(*groups):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return cached_response(request, groups, lambda: view(request, *args, **kwargs))
+        wrapper.cache_groups = groups
+        return wrapper
+    return decorator
+
+
+# for read only viewsets
+class CachedResponseMixin:
+    cache_groups = ()
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(request, self.cache_groups,
+            lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(request, self.cache_groups,
+            lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs))
+
+# signals : invalidation
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+@receiver(m2m_changed, sender=Movie.categoriesId.through)
+def movie_changed(sender, **kwargs):
+    bump(MOVIES)
+
+
+@receiver(post_save, sender=Screening)
+@receiver(post_delete, sender=Screening)
+def screening_changed(sender, **kwargs):
+    bump(SCREENINGS)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, **kwargs):
+    bump(CATEGORIES)
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def room_changed(sender, **kwargs):
+    bump(ROOMS)
+
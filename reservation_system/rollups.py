@@ -0,0 +1,159 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import (DailyCategoryRollup, DailyMovieRollup, DailyScreeningRollup, DailyUserRollup,
+                     Reservation, ReservationTotals, Screening, SeatReserved, UserStats)
+
+# rollups of the reservations for the dashboards : daily summaries per movie,
+# category, user and screening (number of reservations, seats and income),
+# the totals of every user (UserStats) and the totals of all the reservations
+# (ReservationTotals). The dashboards only read these tables, so they do not
+# depend on the size of the history.
+# - a created reservation adds itself to its rows (created by the first one),
+#   with the seats bulk created with it (_nb_seats, see booking.py)
+# - a seat reserved / released alone adds / removes one seat
+# - a deleted reservation removes itself and its seats, the seats deleted with
+#   it (cascade) are not removed a second time : when the transaction commits
+#   their reservation does not exist anymore. its movie and categories are
+#   read before the delete (pre_delete) : after the commit a deleted
+#   screening / movie (cascade) is not there anymore to find them
+# - the updates run after the commit of the reservation (on_commit), out of
+#   its transaction : a booking does not wait for the locks of the rollup rows
+#   of the day, and a rolled back booking is never counted
+# - the totals are split in ROLLUP_TOTALS_SHARDS rows (by user) summed by the
+#   dashboard, so that two bookings rarely update the same row
+# - the command rebuild_rollups recomputes everything
+
+ROLLUP_TOTALS_SHARDS = getattr(settings, 'ROLLUP_TOTALS_SHARDS', 16)
+
+
+def totals_shard(user_id):
+    return user_id % ROLLUP_TOTALS_SHARDS + 1
+
+
+def _add(model, delta, **key):
+    changes = {name: F(name) + value for name, value in delta.items()}
+    if model.objects.filter(**key).update(**changes) or min(delta.values()) < 0:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **delta)
+    except IntegrityError:
+        # created by a concurrent reservation
+        model.objects.filter(**key).update(**changes)
+
+
+def catalogue(screening_id):
+    # (movie id, [category ids]) of a screening, (None, []) if it does not exist
+    rows = list(Screening.objects.filter(id=screening_id).values_list('movieId', 'movieId__categoriesId'))
+    if not rows:
+        return None, []
+    return rows[0][0], [category for movie, category in rows if category is not None]
+
+
+def _apply(day, screening_id, user_id, delta, movieCategories=None):
+    movie, categories = movieCategories or catalogue(screening_id)
+    for category in categories:
+        _add(DailyCategoryRollup, delta, day=day, category_id=category)
+    if movie is not None:
+        _add(DailyMovieRollup, delta, day=day, movie_id=movie)
+    _add(DailyScreeningRollup, delta, day=day, screening_id=screening_id)
+    _add(DailyUserRollup, delta, day=day, user_id=user_id)
+    _add(UserStats, delta, user_id=user_id)
+    _add(ReservationTotals, delta, id=totals_shard(user_id))
+
+
+def add_reservation(reservation, reservations, seats, income, movieCategories=None):
+    # the values are read now, the rows are updated after the commit (the movie
+    # and categories too when movieCategories is None)
+    delta = {'reservations': reservations, 'seats': seats, 'income': income}
+    day, screening_id, user_id = reservation.date, reservation.screeningId_id, reservation.user_id
+    transaction.on_commit(lambda: _apply(day, screening_id, user_id, delta, movieCategories))
+
+
+def reservation_totals():
+    totals = ReservationTotals.objects.aggregate(reservations=Sum('reservations'), income=Sum('income'))
+    return {'totalNumber': totals['reservations'] or 0, 'totalIncome': totals['income'] or 0}
+
+
+def _grouped(reservationFields, seatFields):
+    # {(fields..): {'reservations': .., 'seats': .., 'income': ..}}
+    result = {}
+    rows = Reservation.objects.values_list(*reservationFields).annotate(
+        Count('id'), Sum('total')).order_by()
+    for row in rows:
+        result[row[:-2]] = {'reservations': row[-2], 'seats': 0, 'income': row[-1] or 0}
+    rows = SeatReserved.objects.values_list(*seatFields).annotate(Count('id')).order_by()
+    for row in rows:
+        result.setdefault(row[:-1], {'reservations': 0, 'seats': 0, 'income': 0})['seats'] = row[-1]
+    return result
+
+
+ROLLUPS = (
+    (DailyMovieRollup, 'movie_id', 'screeningId__movieId', 'screening__movieId'),
+    (DailyCategoryRollup, 'category_id', 'screeningId__movieId__categoriesId', 'screening__movieId__categoriesId'),
+    (DailyScreeningRollup, 'screening_id', 'screeningId', 'screening'),
+    (DailyUserRollup, 'user_id', 'user', 'reservation__user'),
+)
+
+
+def rebuild_rollups():
+    for model, field, reservationField, seatField in ROLLUPS:
+        rows = _grouped(('date', reservationField), ('reservation__date', seatField))
+        model.objects.all().delete()
+        model.objects.bulk_create([
+            model(day=day, **{field: id}, **values)
+            for (day, id), values in rows.items() if id is not None], batch_size=500)
+    rows = _grouped(('user',), ('reservation__user',))
+    UserStats.objects.all().delete()
+    UserStats.objects.bulk_create([
+        UserStats(user_id=id, **values) for (id,), values in rows.items()], batch_size=500)
+    shards = {}
+    for (id,), values in rows.items():
+        totals = shards.setdefault(totals_shard(id), {'reservations': 0, 'seats': 0, 'income': 0})
+        for name, value in values.items():
+            totals[name] += value
+    ReservationTotals.objects.all().delete()
+    ReservationTotals.objects.bulk_create([
+        ReservationTotals(id=id, **values) for id, values in shards.items()])
+
+# signals
+
+
+@receiver(post_save, sender=Reservation)
+def reservation_created(sender, instance=None, created=False, raw=False, **kwargs):
+    if created and not raw:
+        add_reservation(instance, 1, getattr(instance, '_nb_seats', 0), instance.total)
+
+
+@receiver(post_save, sender=SeatReserved)
+def seat_reserved_created(sender, instance=None, created=False, raw=False, **kwargs):
+    if created and not raw:
+        add_reservation(instance.reservation, 0, 1, 0)
+
+
+# pre_delete is sent for every object before anything is deleted
+@receiver(pre_delete, sender=Reservation)
+def reservation_before_delete(sender, instance=None, **kwargs):
+    instance._nb_seats = SeatReserved.objects.filter(reservation=instance).count()
+    instance._catalogue = catalogue(instance.screeningId_id)
+
+
+@receiver(post_delete, sender=SeatReserved)
+def seat_reserved_deleted(sender, instance=None, **kwargs):
+    # after the commit : removed with its reservation if it does not exist anymore
+    def removed():
+        reservation = Reservation.objects.filter(id=instance.reservation_id).first()
+        if reservation is not None:
+            _apply(reservation.date, reservation.screeningId_id, reservation.user_id,
+                   {'reservations': 0, 'seats': -1, 'income': 0})
+    transaction.on_commit(removed)
+
+
+@receiver(post_delete, sender=Reservation)
+def reservation_deleted(sender, instance=None, **kwargs):
+    add_reservation(instance, -1, -getattr(instance, '_nb_seats', 0), -instance.total,
+                    getattr(instance, '_catalogue', None))
@@ -0,0 +1,117 @@
+import codecs
+import csv
+import datetime
+import json
+
+from django.db import transaction
+
+from .models import Movie, Room, Screening, screeningBounds
+from .responsecache import SCREENINGS, bump
+from .scheduling import check_programme
+from .stats import refresh_movie_stats
+
+# bulk import of screenings from a CSV (header movie,room,price,date,time) or
+# JSON lines ({"movie": .., "room": .., "price": .., "date": .., "time": ..})
+# stream : the rows are read one by one and handled by chunks, so the file is
+# never held in memory. For each chunk the unknown movies / rooms are loaded
+# with one query each, the time conflicts are checked with check_programme()
+# and the valid rows are inserted with one bulk_create.
+
+IMPORT_CHUNK_SIZE = 500
+
+
+def read_csv(stream):
+    return csv.DictReader(codecs.iterdecode(stream, 'utf-8'))
+
+
+def read_json_lines(stream):
+    for line in stream:
+        if line.strip():
+            yield line
+
+
+def parse_row(item):
+    if isinstance(item, (bytes, str)):
+        item = json.loads(item)
+    return {
+        'movie': int(item['movie']),
+        'room': int(item['room']),
+        'price': float(item['price']),
+        'date': datetime.date.fromisoformat(str(item['date'])),
+        'time': datetime.time.fromisoformat(str(item['time'])),
+    }
+
+
+def _load_references(rows, movies, rooms):
+    # movies : {id: Movie or None}, rooms : {id: True / False}, filled chunk by chunk
+    ids = set(r['movie'] for r in rows) - movies.keys()
+    if ids:
+        found = Movie.objects.filter(id__in=ids).only('id', 'duration')
+        movies.update({m.id: m for m in found})
+        movies.update({id: None for id in ids if id not in movies})
+    ids = set(r['room'] for r in rows) - rooms.keys()
+    if ids:
+        found = set(Room.objects.filter(id__in=ids).values_list('id', flat=True))
+        rooms.update({id: id in found for id in ids})
+
+
+def _import_chunk(chunk, movies, rooms, result):
+    errors = []
+    rows = []
+    for number, item in chunk:
+        try:
+            rows.append((number, parse_row(item)))
+        except (KeyError, TypeError, ValueError):
+            errors.append({'row': number, 'error': 'invalid row'})
+    _load_references([r for n, r in rows], movies, rooms)
+
+    numbers = []
+    screenings = []
+    for number, r in rows:
+        if movies[r['movie']] is None:
+            errors.append({'row': number, 'error': 'unknown movie'})
+        elif not rooms[r['room']]:
+            errors.append({'row': number, 'error': 'unknown room'})
+        else:
+            numbers.append(number)
+            screenings.append(Screening(movieId=movies[r['movie']], roomId_id=r['room'],
+                price=r['price'], date=r['date'], time=r['time']))
+
+    conflicts = check_programme(screenings)
+    valid = []
+    for i, s in enumerate(screenings):
+        if i in conflicts:
+            kind, other = conflicts[i]
+            if kind == 'row':
+                other = numbers[other]
+            errors.append({'row': numbers[i], 'error': 'conflict in time with %s %s' % (kind, other)})
+        else:
+            # bulk_create does not send pre_save : check_timing is not called
+            s.startDateTime, s.endDateTime = screeningBounds(s.date, s.time, s.movieId.duration)
+            valid.append(s)
+    with transaction.atomic():
+        Screening.objects.bulk_create(valid)
+    result['created'] += len(valid)
+    result['errors'] += sorted(errors, key=lambda e: e['row'])
+    return set(s.movieId_id for s in valid)
+
+
+def import_programme(items):
+    result = {'created': 0, 'errors': []}
+    movies = {}
+    rooms = {}
+    touched = set()
+    chunk = []
+    for number, item in enumerate(items, start=1):
+        chunk.append((number, item))
+        if len(chunk) == IMPORT_CHUNK_SIZE:
+            touched |= _import_chunk(chunk, movies, rooms, result)
+            chunk = []
+    if chunk:
+        touched |= _import_chunk(chunk, movies, rooms, result)
+    # bulk_create does not send post_save either
+    for movie_id in touched:
+        refresh_movie_stats(movie_id)
+    if touched:
+        bump(SCREENINGS)
+    return result
@@ -0,0 +1,46 @@
+from bisect import bisect_right
+
+from .models import Screening, screeningBounds
+
+# validation of a whole programme (e.g. a week of screenings) at once :
+# the existing screenings of the rooms in the period are loaded with one query,
+# then the new screenings are sorted by (room, start) and each one is checked
+# with a binary search in the existing ones of its room and against the last
+# new screening accepted in the room : O(n log n)
+# when two new screenings overlap, the one starting first is kept
+
+
+def check_programme(screenings):
+    # screenings : list of unsaved Screening with movieId set
+    # returns {index in the list: ('screening', id) or ('row', index)} of the conflicts
+    rows = []
+    for i, s in enumerate(screenings):
+        start, end = screeningBounds(s.date, s.time, s.movieId.duration)
+        rows.append((s.roomId_id, start, end, i))
+    if not rows:
+        return {}
+    rooms = set(r[0] for r in rows)
+    first = min(r[1] for r in rows)
+    last = max(r[2] for r in rows)
+    existing = {}
+    screeningsInPeriod = Screening.objects.filter(
+        roomId__in=rooms, endDateTime__gt=first, startDateTime__lt=last).order_by(
+        'startDateTime').values_list('roomId', 'startDateTime', 'endDateTime', 'id')
+    for room, start, end, id in screeningsInPeriod:
+        starts, ends, ids = existing.setdefault(room, ([], [], []))
+        starts.append(start)
+        ends.append(end)
+        ids.append(id)
+
+    conflicts = {}
+    lastAccepted = {}
+    for room, start, end, i in sorted(rows, key=lambda r: (r[0], r[1])):
+        starts, ends, ids = existing.get(room, ([], [], []))
+        k = bisect_right(ends, start)   # first existing screening ending after the start
+        if k < len(ends) and starts[k] < end:
+            conflicts[i] = ('screening', ids[k])
+        elif room in lastAccepted and start < lastAccepted[room][0]:
+            conflicts[i] = ('row', lastAccepted[room][1])
+        else:
+            lastAccepted[room] = (end, i)
+    return conflicts
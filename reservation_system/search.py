@@ -0,0 +1,116 @@
+import re
+import unicodedata
+
+from django.db.models import Max
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from rest_framework import filters
+
+from .models import Movie, MovieSearchTerm
+
+# search of the movies with an inverted index (MovieSearchTerm) instead of
+# icontains on title / director / cast :
+# - every word of these fields is stored lowercased, without accents, with
+#   the weight of its field ; the index is updated when a movie is saved
+# - every word of the query must match the beginning of a term (typeahead),
+#   a LIKE 'word%' on term (an index seek on SQL Server)
+# - a change for the clients of ?search= : SearchFilter matched a substring
+#   anywhere in the fields ('ark' found 'The Dark Knight'), the index only
+#   matches the start of the words ('dar' finds it, 'ark' does not)
+# - manage.py benchmark_search compares it with SearchFilter
+# - search_movies() ranks the movies by the sum of the best weight matched
+#   by each word, MovieSearchFilter only filters (the lists keep their order)
+
+SEARCH_WEIGHTS = {'title': 3, 'director': 2, 'cast': 1}
+TERM_MAX_LENGTH = 50
+
+
+def tokenize(text):
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return [t[:TERM_MAX_LENGTH] for t in re.findall(r'\w+', text)]
+
+
+def query_terms(query):
+    # one letter words only narrow down a longer query
+    terms = list(dict.fromkeys(tokenize(query)))
+    if len(terms) > 1:
+        terms = [t for t in terms if len(t) > 1] or terms[:1]
+    return terms
+
+
+def movie_terms(movie):
+    weights = {}
+    for field, weight in SEARCH_WEIGHTS.items():
+        for term in tokenize(getattr(movie, field)):
+            weights[term] = max(weights.get(term, 0), weight)
+    return weights
+
+
+def index_movie(movie):
+    MovieSearchTerm.objects.filter(movie=movie).delete()
+    MovieSearchTerm.objects.bulk_create([
+        MovieSearchTerm(movie=movie, term=term, weight=weight)
+        for term, weight in movie_terms(movie).items()])
+
+
+def rebuild_search_index():
+    MovieSearchTerm.objects.all().delete()
+    terms = []
+    for movie in Movie.objects.only('id', *SEARCH_WEIGHTS).iterator():
+        terms += [MovieSearchTerm(movie_id=movie.id, term=term, weight=weight)
+                  for term, weight in movie_terms(movie).items()]
+        if len(terms) >= 1000:
+            MovieSearchTerm.objects.bulk_create(terms)
+            terms = []
+    MovieSearchTerm.objects.bulk_create(terms)
+
+
+def _matching(term, category=None):
+    # the terms starting with term : LIKE 'term%' is the same prefix whatever
+    # the collation of the column (a range up to the next character is not :
+    # the order of the characters depends on the collation)
+    query = MovieSearchTerm.objects.filter(term__startswith=term)
+    if category is not None:
+        query = query.filter(movie__categoriesId=category)
+    return query
+
+
+def search_movies(query, category=None, limit=20):
+    # ids of the best movies, best first
+    scores = None
+    for term in query_terms(query):
+        weights = dict(_matching(term, category).values_list('movie').annotate(Max('weight')).order_by())
+        if scores is None:
+            scores = weights
+        else:
+            scores = {id: scores[id] + w for id, w in weights.items() if id in scores}
+        if not scores:
+            return []
+    if scores is None:
+        return []
+    return sorted(scores, key=lambda id: (-scores[id], id))[:limit]
+
+
+# ?search= (and ?category=) for the lists of movies
+class MovieSearchFilter(filters.BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        category = request.query_params.get('category')
+        if category:
+            try:
+                queryset = queryset.filter(categoriesId=int(category))
+            except ValueError:
+                return queryset.none()
+        for term in query_terms(request.query_params.get('search', '')):
+            queryset = queryset.filter(id__in=_matching(term).values('movie'))
+        return queryset
+
+# signals
+
+
+@receiver(post_save, sender=Movie)
+def movie_saved(sender, instance=None, raw=False, **kwargs):
+    if not raw:
+        index_movie(instance)
@@ -0,0 +1,353 @@
+import asyncio
+import json
+import re
+import secrets
+import threading
+from urllib.parse import parse_qs
+
+from corsheaders.conf import conf as cors
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework import exceptions
+
+from .aio import run
+from .models import Screening, SeatReserved
+from .seatmap import seat_map
+from .token import BearerAuthentication
+
+try:
+    import redis
+except ImportError:     # redis is optional : only needed by RedisBackend
+    redis = None
+
+# push of the seats taken / released of a screening (Server-Sent Events) :
+# - a reserved / released seat is added to the changes of its screening when
+#   the transaction commits ; the changes are coalesced for
+#   SEATEVENTS_INTERVAL seconds (the last state of a seat wins) and sent as one
+#   message per screening
+# - the backend carries the messages to every worker : LocalBackend in the
+#   process, RedisBackend (pub/sub) between the workers
+# - the broker of each worker encodes the message once and gives it to every
+#   subscriber of the screening (one call per event loop, not per subscriber)
+# - a client first gets the whole seat map (event "snapshot"), then the
+#   changes (event "seats") ; a client too slow to read its queue gets a new
+#   snapshot instead of the changes it missed
+# - only the reservations are pushed, not the holds : a seat held by another
+#   user is shown as taken by the snapshots only
+# the stream is served by the ASGI application (django_cinema/asgi.py), not
+# by a WSGI server (there the clients poll the seat map,
+# user/request/seats/screening/<id>/) :
+#   GET /user/request/events/seats/screening/<id>/ with the bearer token in the
+#   Authorization header, or a ticket in ?ticket= (EventSource can not send
+#   headers, and a token in the url would be in the access logs) : POST
+#   .../<id>/ticket/ gives a ticket, valid once for SEATEVENTS_TICKET_TIMEOUT
+#   seconds (a client reconnecting asks for a new one)
+# the CORS headers are the ones of the corsheaders settings (the stream does
+# not go through the middlewares)
+
+SEATEVENTS_BACKEND = getattr(settings, 'SEATEVENTS_BACKEND', 'reservation_system.seatevents.LocalBackend')
+SEATEVENTS_REDIS_URL = getattr(settings, 'SEATEVENTS_REDIS_URL', 'redis://localhost:6379/0')
+SEATEVENTS_INTERVAL = getattr(settings, 'SEATEVENTS_INTERVAL', 0.2)     # seconds
+SEATEVENTS_QUEUE = getattr(settings, 'SEATEVENTS_QUEUE', 64)            # messages per subscriber
+SEATEVENTS_KEEPALIVE = getattr(settings, 'SEATEVENTS_KEEPALIVE', 15)    # seconds
+SEATEVENTS_CACHE = getattr(settings, 'SEATEVENTS_CACHE', 'default')
+SEATEVENTS_TICKET_TIMEOUT = getattr(settings, 'SEATEVENTS_TICKET_TIMEOUT', 30)  # seconds
+
+SSE_PATH = re.compile(r'/user/request/events/seats/screening/(\d+)/')
+
+
+def encode(event, data):
+    return ('event: %s\ndata: %s\n\n' % (event, json.dumps(data, separators=(',', ':')))).encode()
+
+
+class Subscription:
+    def __init__(self, screening_id, loop):
+        self.screening_id = screening_id
+        self.loop = loop
+        self.queue = asyncio.Queue(SEATEVENTS_QUEUE)
+        self.lagging = False
+
+    def put(self, payload):
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.lagging = True
+
+
+def _deliver(subscriptions, payload):
+    # in the event loop of the subscriptions
+    for subscription in subscriptions:
+        subscription.put(payload)
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}    # screening id: set of Subscription
+
+    def subscribe(self, screening_id):
+        subscription = Subscription(screening_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.setdefault(screening_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.screening_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.screening_id, None)
+
+    def count(self, screening_id=None):
+        with self._lock:
+            if screening_id is not None:
+                return len(self._subscriptions.get(screening_id, ()))
+            return sum(len(s) for s in self._subscriptions.values())
+
+    def dispatch(self, screening_id, seats):
+        # from any thread
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(screening_id, ()))
+        if not subscriptions:
+            return
+        payload = encode('seats', {'screening': screening_id, 'seats': seats})
+        byLoop = {}
+        for subscription in subscriptions:
+            byLoop.setdefault(subscription.loop, []).append(subscription)
+        for loop, subscriptions in byLoop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver, subscriptions, payload)
+            except RuntimeError:    # loop closed
+                for subscription in subscriptions:
+                    self.unsubscribe(subscription)
+
+
+broker = Broker()
+
+
+class LocalBackend:
+    # only the subscribers of this process
+    def publish(self, screening_id, seats):
+        broker.dispatch(screening_id, seats)
+
+    def start(self):
+        pass
+
+
+class RedisBackend:
+    # every worker publishes to and listens on one pub/sub channel
+    channel = 'seatevents'
+
+    def __init__(self):
+        if redis is None:
+            raise ImproperlyConfigured('RedisBackend needs the redis package')
+        self.client = redis.Redis.from_url(SEATEVENTS_REDIS_URL)
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def publish(self, screening_id, seats):
+        self.client.publish(self.channel, json.dumps({'screening': screening_id, 'seats': seats}))
+
+    def _listen(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        for message in pubsub.listen():
+            data = json.loads(message['data'])
+            broker.dispatch(data['screening'], data['seats'])
+
+    def start(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='seatevents', daemon=True)
+                self._listener.start()
+
+
+class Coalescer:
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = {}  # screening id: {seat id: taken}
+        self._timer = None
+
+    def add(self, screening_id, seatsIds, taken):
+        with self._lock:
+            changes = self._pending.setdefault(screening_id, {})
+            for seat in seatsIds:
+                changes[seat] = taken
+            if self._timer is None:
+                self._timer = threading.Timer(self.interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._timer = None
+        for screening_id, changes in pending.items():
+            seats = [{'id': seat, 'taken': taken} for seat, taken in changes.items()]
+            get_backend().publish(screening_id, seats)
+
+
+_backend = None
+_coalescer = Coalescer(SEATEVENTS_INTERVAL)
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(SEATEVENTS_BACKEND)()
+    return _backend
+
+
+def seats_changed(screening_id, seatsIds, taken):
+    _coalescer.add(screening_id, seatsIds, taken)
+
+# tickets of the streams
+
+
+def ticket_key(ticket):
+    return 'seatevents:ticket:%s' % ticket
+
+
+def stream_ticket(key, screening_id):
+    # key : bearer token of the user
+    ticket = secrets.token_urlsafe(24)
+    caches[SEATEVENTS_CACHE].set(ticket_key(ticket), (key, screening_id), SEATEVENTS_TICKET_TIMEOUT)
+    return ticket
+
+
+def use_ticket(ticket, screening_id):
+    # the token of a ticket, once : only the request deleting it gets it
+    cache = caches[SEATEVENTS_CACHE]
+    entry = cache.get(ticket_key(ticket))
+    if entry is None or not cache.delete(ticket_key(ticket)):
+        return None
+    key, ticketScreening = entry
+    return key if ticketScreening == screening_id else None
+
+# server-sent events (ASGI)
+
+
+def _snapshot(screening_id, key):
+    try:
+        user, token = BearerAuthentication().authenticate_credentials(key)
+    except exceptions.AuthenticationFailed:
+        return 401, None
+    screening = Screening.objects.only('id', 'roomId').filter(id=screening_id).first()
+    if screening is None:
+        return 404, None
+    return 200, seat_map(screening, user)
+
+
+def _header(scope, header):
+    for name, value in scope.get('headers', []):
+        if name == header:
+            return value.decode('latin1')
+    return None
+
+
+def _token(scope, screening_id):
+    parts = (_header(scope, b'authorization') or '').split()
+    if len(parts) == 2 and parts[0] == BearerAuthentication.keyword:
+        return parts[1]
+    ticket = parse_qs(scope.get('query_string', b'').decode()).get('ticket', [None])[0]
+    if ticket:
+        return use_ticket(ticket, screening_id)
+    return None
+
+
+def _cors_headers(scope, preflight=False):
+    # as corsheaders.middleware.CorsMiddleware
+    origin = _header(scope, b'origin')
+    if origin is None or not (cors.CORS_ALLOW_ALL_ORIGINS or origin in cors.CORS_ALLOWED_ORIGINS or any(
+            re.match(regex, origin) for regex in cors.CORS_ALLOWED_ORIGIN_REGEXES)):
+        return []
+    allowOrigin = '*' if cors.CORS_ALLOW_ALL_ORIGINS and not cors.CORS_ALLOW_CREDENTIALS else origin
+    headers = [(b'access-control-allow-origin', allowOrigin.encode('latin1')), (b'vary', b'origin')]
+    if cors.CORS_ALLOW_CREDENTIALS:
+        headers.append((b'access-control-allow-credentials', b'true'))
+    if preflight:
+        headers += [(b'access-control-allow-headers', ', '.join(cors.CORS_ALLOW_HEADERS).encode()),
+                    (b'access-control-allow-methods', b'GET, OPTIONS')]
+        if cors.CORS_PREFLIGHT_MAX_AGE:
+            headers.append((b'access-control-max-age', str(cors.CORS_PREFLIGHT_MAX_AGE).encode()))
+    return headers
+
+
+async def _send_status(send, code, headers=()):
+    await send({'type': 'http.response.start', 'status': code,
+                'headers': [(b'content-type', b'text/plain')] + list(headers)})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def sse_application(scope, receive, send):
+    screening_id = int(SSE_PATH.fullmatch(scope['path']).group(1))
+    if scope['method'] == 'OPTIONS':
+        return await _send_status(send, 200, _cors_headers(scope, preflight=True))
+    corsHeaders = _cors_headers(scope)
+    if scope['method'] != 'GET':
+        return await _send_status(send, 405, corsHeaders)
+    key = await run(_token, scope, screening_id)
+    if key is None:
+        return await _send_status(send, 401, corsHeaders)
+    # subscribed before the snapshot : no change can be missed between them
+    subscription = broker.subscribe(screening_id)
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        code, seats = await run(_snapshot, screening_id, key)
+        if code != 200:
+            return await _send_status(send, code, corsHeaders)
+        await run(get_backend().start)
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no')] + corsHeaders})
+        await send({'type': 'http.response.body', 'body': encode('snapshot', seats), 'more_body': True})
+        while True:
+            get = asyncio.ensure_future(subscription.queue.get())
+            done, pending = await asyncio.wait(
+                {get, disconnected}, timeout=SEATEVENTS_KEEPALIVE, return_when=asyncio.FIRST_COMPLETED)
+            if get not in done:
+                get.cancel()
+            if disconnected in done:
+                break
+            if subscription.lagging:
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.lagging = False
+                code, seats = await run(_snapshot, screening_id, key)
+                if code != 200:
+                    break
+                body = encode('snapshot', seats)
+            elif get in done:
+                body = get.result()
+            else:
+                body = b': keepalive\n\n'
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        if not disconnected.done():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        broker.unsubscribe(subscription)
+        disconnected.cancel()
+
+# signals : the changes are sent when the transaction commits
+
+
+@receiver(post_save, sender=SeatReserved)
+def seat_reserved_created(sender, instance=None, created=False, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(lambda: seats_changed(instance.screening_id, [instance.seatId_id], True))
+
+
+@receiver(post_delete, sender=SeatReserved)
+def seat_reserved_deleted(sender, instance=None, **kwargs):
+    transaction.on_commit(lambda: seats_changed(instance.screening_id, [instance.seatId_id], False))
@@ -0,0 +1,149 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .holds import active_holds
+from .models import Room, Screening, Seat, SeatReserved
+
+# seat map of a screening = layout of the room (cached per room)
+#                         + occupancy bitmap (cached per screening)
+# the seat (row, number) is bit (row-1)*columns + (number-1) of the bitmap
+# the bitmap is cached under a generation of its screening : a reserved /
+# released seat increments the generation (atomic incr, once the transaction
+# is committed) and the next read rebuilds the bitmap with one query. the
+# bitmap is never patched in place (a read-modify-write of the cache would
+# lose one of two concurrent bookings), and a bitmap built from the state
+# before a commit is stored under the old generation, which is not read again
+
+SEATMAP_CACHE = getattr(settings, 'SEATMAP_CACHE', 'default')
+SEATMAP_TIMEOUT = getattr(settings, 'SEATMAP_TIMEOUT', 60 * 60)
+
+
+def _cache():
+    return caches[SEATMAP_CACHE]
+
+
+def layout_key(room_id):
+    return 'seatmap:layout:%s' % room_id
+
+
+def generation_key(screening_id):
+    return 'seatmap:generation:%s' % screening_id
+
+
+def occupancy_key(screening_id, generation):
+    return 'seatmap:occupancy:%s:%s' % (screening_id, generation)
+
+
+def _generation(screening_id):
+    key = generation_key(screening_id)
+    generation = _cache().get(key)
+    if generation is None:
+        # start from the time so a lost generation never comes back to an old value
+        _cache().add(key, int(time.time() * 1000), None)
+        generation = _cache().get(key)
+    return generation
+
+
+def get_layout(room_id):
+    layout = _cache().get(layout_key(room_id))
+    if layout is None:
+        seats = list(Seat.objects.filter(room__id=room_id).order_by(
+            'row', 'number').values_list('id', 'row', 'number'))
+        rows = max((s[1] for s in seats), default=0)
+        columns = max((s[2] for s in seats), default=0)
+        layout = {'rows': rows, 'columns': columns, 'seats': seats}
+        _cache().set(layout_key(room_id), layout, SEATMAP_TIMEOUT)
+    return layout
+
+
+def invalidate_layout(room_id):
+    _cache().delete(layout_key(room_id))
+
+
+def _position(columns, row, number):
+    return (row - 1) * columns + (number - 1)
+
+
+def _set_bits(bitmap, columns, seats):
+    for row, number in seats:
+        pos = _position(columns, row, number)
+        if 0 <= pos < len(bitmap) * 8:
+            bitmap[pos >> 3] |= 1 << (pos & 7)
+
+
+def get_occupancy(screening_id, layout):
+    # cached value is (columns, bitmap) : rebuilt if the room was resized
+    columns = layout['columns']
+    size = (layout['rows'] * columns + 7) // 8
+    key = occupancy_key(screening_id, _generation(screening_id))
+    cached = _cache().get(key)
+    if cached is not None and cached[0] == columns and len(cached[1]) == size:
+        return cached[1]
+    bitmap = bytearray(size)
+    taken = SeatReserved.objects.filter(screening__id=screening_id).values_list(
+        'seatId__row', 'seatId__number')
+    _set_bits(bitmap, columns, taken)
+    bitmap = bytes(bitmap)
+    _cache().set(key, (columns, bitmap), SEATMAP_TIMEOUT)
+    return bitmap
+
+
+def invalidate_occupancy(screening_id):
+    key = generation_key(screening_id)
+    try:
+        _cache().incr(key)
+    except ValueError:
+        _cache().set(key, int(time.time() * 1000), None)
+
+
+def seat_map(screening, user=None):
+    # seats held by other users are shown as taken
+    layout = get_layout(screening.roomId_id)
+    bitmap = get_occupancy(screening.id, layout)
+    holds = active_holds(screening.id, [s[0] for s in layout['seats']])
+    user_id = user.id if user is not None else None
+    columns = layout['columns']
+    seatResponse = []
+    for id, row, number in layout['seats']:
+        pos = _position(columns, row, number)
+        taken = bool(bitmap[pos >> 3] & (1 << (pos & 7)))
+        if not taken and id in holds:
+            taken = holds[id] != user_id
+        seatResponse.append({'id': id, 'row': row, 'number': number, 'taken': taken})
+    return seatResponse
+
+# signals : keep the cached layouts and bitmaps up to date
+
+
+@receiver(post_save, sender=SeatReserved)
+def seat_reserved_created(sender, instance=None, created=False, **kwargs):
+    if created:
+        transaction.on_commit(lambda: invalidate_occupancy(instance.screening_id))
+
+
+@receiver(post_delete, sender=SeatReserved)
+def seat_reserved_deleted(sender, instance=None, **kwargs):
+    transaction.on_commit(lambda: invalidate_occupancy(instance.screening_id))
+
+
+@receiver(post_save, sender=Seat)
+@receiver(post_delete, sender=Seat)
+def seat_changed(sender, instance=None, **kwargs):
+    invalidate_layout(instance.room_id)
+
+
+# seats of a room are created / removed with bulk queries (no signal per seat)
+@receiver(post_save, sender=Room)
+def room_changed(sender, instance=None, **kwargs):
+    invalidate_layout(instance.id)
+
+
+@receiver(post_save, sender=Screening)
+def screening_changed(sender, instance=None, created=False, **kwargs):
+    if not created:
+        invalidate_occupancy(instance.id)
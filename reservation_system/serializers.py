@@ -1,5 +1,7 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from.models import Reservation, Room, Screening, Seat, SeatReserved, User, Category, Movie
+from .images import store_base64, store_upload
 
 class UserSerializer(serializers.ModelSerializer):
     date_joined = serializers.ReadOnlyField()
@@ -15,7 +17,42 @@ class CategorySerializer(serializers.ModelSerializer):
         model = Category
         fields = '__all__'
 
-class MovieSerializer(serializers.ModelSerializer):
+# ?fields=id,title,... : names of the fields to return, None if not given
+def requested_fields(request):
+    if request is None or not request.query_params.get('fields'):
+        return None
+    return set(f.strip() for f in request.query_params['fields'].split(',') if f.strip())
+
+# sparse fieldsets for the serializer used at the top of a response (reads
+# only, a write validates every field)
+class SparseFieldsMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self._context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        fields = requested_fields(request)
+        if fields:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+# path of an image, base64 data url or uploaded file (multipart), stored
+# here so that an invalid image is a 400
+class MovieImageField(serializers.CharField):
+    default_error_messages = {'image': 'Not a valid png, jpg, webp or gif image.'}
+    def to_internal_value(self, data):
+        try:
+            if hasattr(data, 'chunks'):
+                return store_upload(data)
+            if isinstance(data, str) and ';base64,' in data:
+                return store_base64(data)
+        except ValueError:
+            self.fail('image')
+        return super().to_internal_value(data)
+
+class MovieSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    image = MovieImageField(allow_null=True, required=False)
+    landscape = MovieImageField(allow_null=True, required=False)
     status = serializers.CharField(max_length = 100, read_only = True)
     categories = CategorySerializer(many = True, read_only=True)
     viewers = serializers.IntegerField(read_only=True)
@@ -24,6 +61,30 @@ class MovieSerializer(serializers.ModelSerializer):
         fields = '__all__'
         extra_kwargs = {'categoriesId': {'write_only': True}}
 
+# path of an image of a movie in lists : annotated by querysets.movie_list()
+# (the column is not read), an image not converted to a file yet is not sent
+def listed_image(movie, field):
+    if hasattr(movie, field + 'Path'):
+        return getattr(movie, field + 'Path')
+    value = getattr(movie, field)
+    if value and value.startswith('data:'):
+        return None
+    return value
+
+# movie in lists (and nested in screenings / reservations) : no description
+class MovieListSerializer(MovieSerializer):
+    image = serializers.SerializerMethodField()
+    landscape = serializers.SerializerMethodField()
+    class Meta(MovieSerializer.Meta):
+        fields = None
+        exclude = ('description',)
+
+    def get_image(self, movie):
+        return listed_image(movie, 'image')
+
+    def get_landscape(self, movie):
+        return listed_image(movie, 'landscape')
+
 class SeatSerializer(serializers.ModelSerializer):
     class Meta:
         model = Seat
@@ -36,7 +97,7 @@ class RoomSerializer(serializers.ModelSerializer):
 
 class ScreeningSerializer(serializers.ModelSerializer):
     status = serializers.CharField(max_length = 100, read_only=True)
-    movie = MovieSerializer(read_only=True)
+    movie = MovieListSerializer(read_only=True)
     room = RoomSerializer(read_only=True)
     class Meta:
         model = Screening
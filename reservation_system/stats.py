@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Movie, MovieStats, Screening, SeatReserved
+
+# MovieStats holds the viewers and the start of the last screening of a movie
+# so that Movie.viewers and Movie.status do not need a COUNT per movie :
+# - a reserved / released seat adds / removes one viewer, after the commit
+#   (the row of the movie is not locked by the transaction of the booking)
+# - a saved / deleted screening recomputes the stats of its movie
+# - the command rebuild_movie_stats recomputes everything
+
+
+def add_viewers(screening_id, nb):
+    MovieStats.objects.filter(movie__screening=screening_id).update(viewers=F('viewers') + nb)
+
+
+def refresh_movie_stats(movie_id):
+    viewers = SeatReserved.objects.filter(screening__movieId=movie_id).count()
+    last = Screening.objects.filter(movieId=movie_id).aggregate(last=Max('startDateTime'))['last']
+    MovieStats.objects.filter(movie_id=movie_id).update(viewers=viewers, lastScreeningStart=last)
+
+
+def rebuild_movie_stats():
+    viewers = dict(SeatReserved.objects.values_list('screening__movieId').annotate(Count('id')).order_by())
+    last = dict(Screening.objects.values_list('movieId').annotate(Max('startDateTime')).order_by())
+    MovieStats.objects.all().delete()
+    MovieStats.objects.bulk_create([
+        MovieStats(movie_id=id, viewers=viewers.get(id, 0), lastScreeningStart=last.get(id))
+        for id in Movie.objects.values_list('id', flat=True)], batch_size=500)
+
+# signals
+
+
+@receiver(post_save, sender=Movie)
+def movie_created(sender, instance=None, created=False, raw=False, **kwargs):
+    if created and not raw:
+        MovieStats.objects.get_or_create(movie=instance)
+
+
+@receiver(post_save, sender=SeatReserved)
+def seat_reserved_created(sender, instance=None, created=False, **kwargs):
+    if created:
+        transaction.on_commit(lambda: add_viewers(instance.screening_id, 1))
+
+
+@receiver(post_delete, sender=SeatReserved)
+def seat_reserved_deleted(sender, instance=None, **kwargs):
+    transaction.on_commit(lambda: add_viewers(instance.screening_id, -1))
+
+
+# the movie of a screening can be changed : remember the old one
+@receiver(pre_save, sender=Screening)
+def screening_movie_before_save(sender, instance=None, **kwargs):
+    instance._old_movie_id = None
+    if instance.pk is not None:
+        instance._old_movie_id = Screening.objects.filter(
+            pk=instance.pk).values_list('movieId', flat=True).first()
+
+
+@receiver(post_save, sender=Screening)
+def screening_saved(sender, instance=None, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_movie_stats(instance.movieId_id)
+    old = getattr(instance, '_old_movie_id', None)
+    if old is not None and old != instance.movieId_id:
+        refresh_movie_stats(old)
+
+
+@receiver(post_delete, sender=Screening)
+def screening_deleted(sender, instance=None, **kwargs):
+    refresh_movie_stats(instance.movieId_id)
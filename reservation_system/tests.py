@@ -1,3 +1,1039 @@
-from django.test import TestCase
+import base64
+import datetime
+import json
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.db import connection, connections
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from . import dbconnections, dbrouter, holds, images, instrumentation, token
+from .booking import reserve_seats
+from .models import (Category, DailyCategoryRollup, DailyMovieRollup, DailyScreeningRollup, DailyUserRollup, Movie,
+                     MovieStats, Reservation, ReservationTotals, Room, Screening, ScreeningConflict, Seat, SeatReserved,
+                     User, UserStats)
+from .pagination import MAX_PAGE_SIZE
+from .rollups import rebuild_rollups
+from .search import search_movies
+from .seatevents import sse_application
+from .stats import rebuild_movie_stats
+
+# the tests run on the database of the settings, e.g. DB_ENGINE=sqlite
+# python manage.py test reservation_system (a test database file with sqlite,
+# the booking threads need a database shared by their connections)
+
+NB_CLIENTS = 200
+FAST_HASHER = ['django.contrib.auth.hashers.MD5PasswordHasher']   # users created in setUp
+
+
+def create_screening(rows=5, columns=6):
+    room = Room.objects.create(name='room', nbRows=rows, nbColumns=columns)
+    movie = Movie.objects.create(title='movie', director='director', cast='cast', duration=100,
+        description='description', releaseDate=datetime.date.today())
+    screening = Screening.objects.create(movieId=movie, roomId=room, price=8,
+        date=datetime.date.today() + datetime.timedelta(days=1), time=datetime.time(20))
+    return screening
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHER)
+class ConcurrentBookingTest(TransactionTestCase):
+    # NB_CLIENTS users booking at the same time :
+    # - the same seats : one of them gets the seats, the others a conflict,
+    #   and the seats are reserved once
+    # - each their own seat : all of them get it, and the bookings per second
+    #   stay about the same as with a few users (no collapse under contention)
+
+    def setUp(self):
+        self.screening = create_screening(rows=20, columns=20)
+        self.seats = list(Seat.objects.filter(room=self.screening.roomId).order_by(
+            'row', 'number').values_list('id', flat=True))
+        self.users = [User.objects.create_user('client%d@example.com' % i, 'pw', 'Client', str(i))
+                      for i in range(NB_CLIENTS)]
+
+    def book(self, user, seats, barrier, results, latencies):
+        client = client_for(user)
+        try:
+            barrier.wait()
+            start = time.perf_counter()
+            response = client.post('/user/request/reservations/', {
+                'screening': self.screening.id, 'seats_ids': seats}, format='json')
+            latencies.append((time.perf_counter() - start) * 1000)
+            results.append(response.status_code)
+        finally:
+            connection.close()
+
+    def run_clients(self, users, seats):
+        # seats[i] booked by users[i], all at the same time ; returns the status
+        # codes, the bookings per second and the latencies
+        barrier = threading.Barrier(len(users))
+        results = []
+        latencies = []
+        threads = [threading.Thread(target=self.book, args=(user, userSeats, barrier, results, latencies))
+                   for user, userSeats in zip(users, seats)]
+        for thread in threads:
+            thread.start()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return results, len(users) / (time.perf_counter() - start), latencies
+
+    def test_same_seats_booked_once(self):
+        seats = self.seats[:3]
+        results, rate, latencies = self.run_clients(self.users, [seats] * NB_CLIENTS)
+        self.assertEqual(sorted(results), [201] + [409] * (NB_CLIENTS - 1))
+        self.assertEqual(Reservation.objects.count(), 1)
+        self.assertEqual(SeatReserved.objects.filter(screening=self.screening).count(), len(seats))
+        sys.stderr.write('\n%d concurrent bookings of the same seats : mean %.1f ms, max %.1f ms\n' % (
+            NB_CLIENTS, statistics.mean(latencies), max(latencies)))
+
+    def test_throughput_stays_flat(self):
+        few = NB_CLIENTS // 8
+        results, fewRate, latencies = self.run_clients(self.users[:few], [[s] for s in self.seats[:few]])
+        self.assertEqual(results, [201] * few)
+        results, rate, latencies = self.run_clients(self.users, [[s] for s in self.seats[few:few + NB_CLIENTS]])
+        self.assertEqual(results, [201] * NB_CLIENTS)
+        self.assertEqual(SeatReserved.objects.filter(screening=self.screening).count(), few + NB_CLIENTS)
+        sys.stderr.write('\n%d concurrent bookings : %.0f/s (%.0f/s with %d), mean %.1f ms, max %.1f ms\n' % (
+            NB_CLIENTS, rate, fewRate, few, statistics.mean(latencies), max(latencies)))
+        self.assertGreater(rate, fewRate / 2)
+
+
+class AsyncViewTest(TransactionTestCase):
+    # the async views (their queries run in the threads of aio.py) return the
+    # data of the sync ones
+
+    def setUp(self):
+        caches['default'].clear()
+        self.screening = create_screening()
+
+    def check(self, url, asyncUrl):
+        expected = APIClient().get(url).json()
+        caches['default'].clear()
+        response = async_to_sync(AsyncClient().get)(asyncUrl)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), expected)
+
+    def test_screenings(self):
+        self.check('/public/request/screenings/', '/public/request/async/screenings/')
+
+    def test_movies(self):
+        self.check('/public/request/movies/', '/public/request/async/movies/')
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHER)
+class SeatEventsTest(TransactionTestCase):
+    # the stream (ASGI) with a ticket instead of the token in the url
+
+    def setUp(self):
+        caches['default'].clear()
+        self.screening = create_screening()
+        user = User.objects.create_user('client@example.com', 'pw', 'Client', 'User')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token.login_token(user).key)
+
+    def ticket(self):
+        response = self.client.post('/user/request/events/seats/screening/%d/ticket/' % self.screening.id)
+        self.assertEqual(response.status_code, 201)
+        return response.data['ticket']
+
+    def stream(self, query, method='GET', headers=()):
+        # the messages sent until the client (gone at once) is disconnected
+        messages = []
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+        scope = {'type': 'http', 'method': method, 'path': '/user/request/events/seats/screening/%d/' % self.screening.id,
+                 'query_string': query.encode(), 'headers': [(b'origin', b'http://localhost:3000')] + list(headers)}
+        async_to_sync(sse_application)(scope, receive, send)
+        return messages
+
+    def test_ticket_used_once(self):
+        ticket = self.ticket()
+        messages = self.stream('ticket=' + ticket)
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertIn(b'event: snapshot', messages[1]['body'])
+        self.assertIn((b'access-control-allow-origin', b'http://localhost:3000'), messages[0]['headers'])
+        self.assertEqual(self.stream('ticket=' + ticket)[0]['status'], 401)
+
+    def test_no_token_in_url(self):
+        self.assertEqual(self.stream('token=' + self.client._credentials['HTTP_AUTHORIZATION'].split()[1])[0]['status'], 401)
+
+    def test_preflight(self):
+        start = self.stream('', 'OPTIONS', [(b'access-control-request-method', b'GET')])[0]
+        self.assertEqual(start['status'], 200)
+        self.assertIn(b'access-control-allow-headers', dict(start['headers']))
+
+
+ROLLUP_KEYS = (
+    (DailyMovieRollup, ('day', 'movie')),
+    (DailyCategoryRollup, ('day', 'category')),
+    (DailyScreeningRollup, ('day', 'screening')),
+    (DailyUserRollup, ('day', 'user')),
+    (UserStats, ('user',)),
+    (ReservationTotals, ('id',)),
+)
+
+
+def movie_stats():
+    return {movie: (viewers, last) for movie, viewers, last in MovieStats.objects.values_list(
+        'movie', 'viewers', 'lastScreeningStart')}
+
+
+def rollup_rows():
+    # the rows of every rollup, without the empty ones (left by the deletes)
+    rows = {}
+    for model, key in ROLLUP_KEYS:
+        rows[model.__name__] = sorted(
+            row[:-1] + (round(row[-1], 2),) for row in model.objects.values_list(*key, 'reservations', 'seats', 'income')
+            if any(row[-3:]))
+    return rows
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHER)
+class RollupTest(TransactionTestCase):
+    # the rollups updated by the signals (after the commits) are the ones
+    # rebuild_rollups() computes, after each change
+
+    def setUp(self):
+        self.screening = create_screening()
+        room, self.movie = self.screening.roomId, self.screening.movieId
+        self.categories = [Category.objects.create(name='category %d' % i) for i in range(2)]
+        self.movie.categoriesId.set(self.categories)
+        self.other = Screening.objects.create(movieId=self.movie, roomId=room, price=6,
+            date=self.screening.date + datetime.timedelta(days=1), time=datetime.time(20))
+        self.users = [User.objects.create_user('client%d@example.com' % i, 'pw', 'Client', str(i)) for i in range(2)]
+        self.seats = list(Seat.objects.filter(room=room).values_list('id', flat=True))
+
+    def check_rollups(self):
+        incremental = rollup_rows()
+        rebuild_rollups()
+        self.assertEqual(incremental, rollup_rows())
+
+    def test_rollups_match_rebuild(self):
+        reservations = [reserve_seats(user, screening, self.seats[i * 5:i * 5 + 2 + i])
+                        for i, (user, screening) in enumerate([(self.users[0], self.screening),
+                            (self.users[1], self.screening), (self.users[0], self.other), (self.users[1], self.other)])]
+        self.check_rollups()
+        reservations[0].delete()
+        SeatReserved.objects.filter(reservation=reservations[1]).first().delete()
+        self.check_rollups()
+        self.screening.delete()
+        self.check_rollups()
+        self.movie.delete()
+        self.check_rollups()
+        self.assertFalse(Reservation.objects.exists())
+
+
+class ConnectionLimitTest(TransactionTestCase):
+    # DB_MAX_CONNECTIONS = 1 : one thread at a time holds connections
+
+    def setUp(self):
+        for name, value in (('_permits', threading.BoundedSemaphore(1)), ('DB_CONNECTION_WAIT', 0.2)):
+            patcher = mock.patch.object(dbconnections, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, dbconnections._thread, 'permit', False)
+        self.url = '/public/request/categories/'
+
+    def in_thread(self, target):
+        def run():
+            try:
+                target()
+            finally:
+                connection.close()
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_over_the_cap(self):
+        held = threading.Event()
+        done = threading.Event()
+
+        def other():
+            # a request of another thread, its connection kept (nobody waits)
+            dbconnections.acquire_connections()
+            connection.ensure_connection()
+            dbconnections.give_back_connections()
+            held.set()
+            done.wait(5)
+            connection.close()
+            dbconnections.give_back_connections()
+        thread = self.in_thread(other)
+        held.wait(5)
+        response = APIClient().get(self.url)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        done.set()
+        thread.join()
+        self.assertEqual(APIClient().get(self.url).status_code, 200)
+
+    def test_given_to_a_waiting_thread(self):
+        # the connection of this thread, kept after its request, is closed at
+        # the end of the next one when another thread waits
+        self.assertEqual(APIClient().get(self.url).status_code, 200)
+        self.assertIsNotNone(connection.connection)
+        results = []
+
+        def waiting():
+            dbconnections.acquire_connections()
+            results.append(Category.objects.count())
+            connection.close()
+            dbconnections.give_back_connections()
+        with mock.patch.object(dbconnections, 'DB_CONNECTION_WAIT', 5):
+            thread = self.in_thread(waiting)
+            while not dbconnections._waiting[0]:
+                time.sleep(0.01)
+            self.assertEqual(APIClient().get(self.url).status_code, 200)
+            thread.join()
+        self.assertEqual(results, [0])
+        self.assertIsNone(connection.connection)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHER)
+class ReplicaRouterTest(TransactionTestCase):
+    # a replica in a second sqlite file, a copy of the test database made by
+    # sync() (as manage.py sync_replicas) : the changes made after the copy
+    # tell which database answered
+
+    def setUp(self):
+        caches['default'].clear()
+        self.directory = tempfile.mkdtemp()
+        self.category = Category.objects.create(name='old')
+        self.add_replica(self.directory + '/replica.sqlite3')
+        self.sync()
+        # not seen by the replica, no signal (no pin)
+        Category.objects.filter(id=self.category.id).update(name='new')
+        patcher = mock.patch.object(dbrouter, 'DATABASE_REPLICAS', ['replica_test'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        connections['replica_test'].close()
+        del connections['replica_test']
+        del connections.settings['replica_test']
+        shutil.rmtree(self.directory)
+
+    def add_replica(self, name):
+        connections.settings['replica_test'] = dict(connections['default'].settings_dict, NAME=name)
+
+    def sync(self):
+        target = sqlite3.connect(connections['replica_test'].settings_dict['NAME'])
+        try:
+            connection.ensure_connection()
+            connection.connection.backup(target)
+        finally:
+            target.close()
+
+    def category_name(self, client=None):
+        # a new url each time : never a cached response
+        self.requests = getattr(self, 'requests', 0) + 1
+        response = (client or APIClient()).get('/public/request/categories/%d/?n=%d' % (
+            self.category.id, self.requests))
+        return response.data['name']
+
+    def test_reads_on_the_replica(self):
+        with CaptureQueriesContext(connections['replica_test']) as replica:
+            self.assertEqual(self.category_name(), 'old')
+        self.assertEqual(len(replica), 1)
+        # the views which did not opt in read from default
+        admin = client_for(User.objects.create_superuser('admin@example.com', 'pw', 'Admin', 'User'))
+        self.assertEqual(admin.get('/admin/request/movies/per-categories/').status_code, 200)
+
+    def test_reads_after_a_write_on_default(self):
+        user = User.objects.create_user('client@example.com', 'pw', 'Client', 'User')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + token.login_token(user).key)
+        caches['default'].delete(dbrouter.user_pin_key(user.id))
+        self.assertEqual(self.category_name(client), 'old')
+        reserve_seats(user, create_screening(), list(Seat.objects.values_list('id', flat=True)[:1]))
+        # the user who wrote reads from default, the others still from the replica
+        self.assertEqual(self.category_name(client), 'new')
+        self.assertEqual(self.category_name(), 'old')
+        # a change of the catalogue : every reader of the group on default
+        Category.objects.create(name='other')
+        self.assertEqual(self.category_name(), 'new')
+
+    def test_replica_failing(self):
+        # connects (sqlite creates the file) but fails in the view : no table
+        connections['replica_test'].close()
+        del connections['replica_test']
+        self.add_replica(self.directory + '/empty.sqlite3')
+        with self.assertLogs('reservation_system.dbrouter', 'WARNING'):
+            self.assertEqual(self.category_name(), 'new')
+        self.assertIsNotNone(caches['default'].get(dbrouter.down_key('replica_test')))
+        with CaptureQueriesContext(connections['replica_test']) as replica:
+            self.assertEqual(self.category_name(), 'new')
+        self.assertEqual(len(replica), 0)
+
+    def test_replica_not_connecting(self):
+        connections['replica_test'].close()
+        del connections['replica_test']
+        self.add_replica(self.directory + '/missing/replica.sqlite3')
+        with self.assertLogs('reservation_system.dbrouter', 'WARNING'):
+            self.assertEqual(self.category_name(), 'new')
+        self.assertIsNotNone(caches['default'].get(dbrouter.down_key('replica_test')))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHER)
+class MovieStatsTest(TestCase):
+
+    def setUp(self):
+        self.screening = create_screening()
+        self.movie = self.screening.movieId
+        self.other = Movie.objects.create(title='other', director='director', cast='cast', duration=90,
+                                          description='', releaseDate=datetime.date.today())
+        self.user = User.objects.create_user('client@example.com', 'pw', 'Client', 'User')
+        self.seats = list(Seat.objects.filter(room=self.screening.roomId).values_list('id', flat=True))
+
+    def viewers_and_status(self, movie):
+        # a fresh instance : the stats are a cached relation
+        movie = Movie.objects.get(id=movie.id)
+        return movie.viewers, movie.status
+
+    def check_rebuild(self):
+        stats = movie_stats()
+        rebuild_movie_stats()
+        self.assertEqual(movie_stats(), stats)
+
+    def test_refresh(self):
+        self.assertEqual(self.viewers_and_status(self.movie), (0, 'AVAILABLE'))
+        self.assertEqual(self.viewers_and_status(self.other), (0, 'NOT_AVAILABLE'))
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation = reserve_seats(self.user, self.screening, self.seats[:3])
+        self.assertEqual(self.viewers_and_status(self.movie), (3, 'AVAILABLE'))
+        self.check_rebuild()
+        # the screening moves to the other movie, with its viewers
+        self.screening.movieId = self.other
+        self.screening.save()
+        self.assertEqual(self.viewers_and_status(self.movie), (0, 'NOT_AVAILABLE'))
+        self.assertEqual(self.viewers_and_status(self.other), (3, 'AVAILABLE'))
+        self.check_rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation.delete()
+        self.assertEqual(self.viewers_and_status(self.other), (0, 'AVAILABLE'))
+        self.check_rebuild()
+        # a screening in the past
+        self.screening.date = datetime.date.today() - datetime.timedelta(days=1)
+        self.screening.save()
+        self.assertEqual(self.viewers_and_status(self.other), (0, 'NOT_AVAILABLE'))
+        self.screening.delete()
+        self.assertEqual(movie_stats()[self.other.id], (0, None))
+        self.check_rebuild()
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHER)
+class ScreeningConflictTest(TestCase):
+
+    def setUp(self):
+        self.screening = create_screening()    # tomorrow 20:00 - 21:40
+        self.movie, self.room = self.screening.movieId, self.screening.roomId
+        self.day = self.screening.date
+        self.client = client_for(User.objects.create_superuser('admin@example.com', 'pw', 'Admin', 'User'))
+
+    def create(self, day, hour, minute=0, room=None):
+        return Screening.objects.create(movieId=self.movie, roomId=room or self.room, price=8, date=day,
+                                        time=datetime.time(hour, minute))
+
+    def test_overlaps(self):
+        for hour, minute in ((19, 0), (20, 0), (21, 39), (18, 21)):
+            with self.assertRaises(ScreeningConflict):
+                self.create(self.day, hour, minute)
+        self.create(self.day, 21, 40)   # right after
+        self.create(self.day, 18, 20)   # right before
+        self.create(self.day, 20, 30, Room.objects.create(name='other', nbRows=1, nbColumns=1))
+        # saved again at the same time : not a conflict with itself
+        self.screening.price = 9
+        self.screening.save()
+        with self.assertRaises(ScreeningConflict):
+            self.screening.time = datetime.time(21)
+            self.screening.save()
+
+    def test_across_midnight(self):
+        nextDay = self.day + datetime.timedelta(days=1)
+        self.create(self.day, 23, 30)   # until 01:10
+        with self.assertRaises(ScreeningConflict):
+            self.create(nextDay, 0, 30)
+        self.create(nextDay, 1, 10)
+
+    def test_api(self):
+        data = {'movieId': self.movie.id, 'roomId': self.room.id, 'price': 8, 'date': self.day.isoformat()}
+        response = self.client.post('/admin/request/screenings/', dict(data, time='21:00'), format='json')
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post('/admin/request/screenings/', dict(data, time='22:00'), format='json')
+        self.assertEqual(response.status_code, 201)
+        # a longer movie would overlap the screening at 22:00
+        response = self.client.patch('/admin/request/movies/%d/' % self.movie.id, {'duration': 130}, format='json')
+        self.assertEqual(response.status_code, 409)
+        response = self.client.patch('/admin/request/movies/%d/' % self.movie.id, {'duration': 120}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.screening.refresh_from_db()
+        self.assertEqual(self.screening.endDateTime, self.screening.startDateTime + datetime.timedelta(minutes=120))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHER)
+class SeatsPerCategoryTest(TestCase):
+
+    def setUp(self):
+        drama, comedy = Category.objects.create(name='drama'), Category.objects.create(name='comedy')
+        Category.objects.create(name='horror')
+        first = create_screening()
+        first.movieId.categoriesId.set([drama, comedy])
+        second = create_screening()
+        second.movieId.categoriesId.set([comedy])
+        user = User.objects.create_user('client@example.com', 'pw', 'Client', 'User')
+        for screening, nb, day in ((first, 2, '2026-03-02'), (second, 3, '2026-03-04'), (first, 1, '2026-03-10')):
+            seats = Seat.objects.filter(room=screening.roomId).exclude(
+                seatreserved__screening=screening).values_list('id', flat=True)[:nb]
+            reservation = reserve_seats(user, screening, list(seats))
+            Reservation.objects.filter(id=reservation.id).update(date=day)
+        rebuild_rollups()
+        self.client = client_for(User.objects.create_superuser('admin@example.com', 'pw', 'Admin', 'User'))
+
+    def series(self, **params):
+        response = self.client.get('/admin/request/reservations/per-categories/series/', params)
+        self.assertEqual(response.status_code, 200)
+        return {category['name']: [(str(point['name']), point['value']) for point in category['series']]
+                for category in response.data}
+
+    def test_days(self):
+        self.assertEqual(self.series(start='2026-03-02', end='2026-03-05'), {
+            'drama': [('2026-03-02', 2), ('2026-03-03', 0), ('2026-03-04', 0)],
+            'comedy': [('2026-03-02', 2), ('2026-03-03', 0), ('2026-03-04', 3)],
+            'horror': [('2026-03-02', 0), ('2026-03-03', 0), ('2026-03-04', 0)],
+        })
+
+    def test_weeks_and_months(self):
+        weeks = self.series(start='2026-03-04', end='2026-03-16', bucket='week')
+        # the first week starts on monday, before start : only the days of the range count
+        self.assertEqual(weeks['drama'], [('2026-03-02', 0), ('2026-03-09', 1)])
+        self.assertEqual(weeks['comedy'], [('2026-03-02', 3), ('2026-03-09', 1)])
+        months = self.series(start='2026-02-01', end='2026-04-01', bucket='month')
+        self.assertEqual(months['drama'], [('2026-02-01', 0), ('2026-03-01', 3)])
+        self.assertEqual(months['comedy'], [('2026-02-01', 0), ('2026-03-01', 6)])
+
+    def test_invalid_range(self):
+        for params in ({'bucket': 'year'}, {'start': '2026-03-05', 'end': '2026-03-01'}, {'start': 'march'}):
+            response = self.client.get('/admin/request/reservations/per-categories/series/', params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHER)
+class BookingTest(TestCase):
+
+    def setUp(self):
+        self.screening = create_screening()
+        self.user = User.objects.create_user('client@example.com', 'pw', 'Client', 'User')
+        self.client = client_for(self.user)
+
+    def test_no_seat_selected(self):
+        response = self.client.post('/user/request/reservations/', {
+            'screening': self.screening.id, 'seats_ids': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_unknown_screening(self):
+        response = self.client.post('/user/request/reservations/', {
+            'screening': 0, 'seats_ids': [1]}, format='json')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post('/user/request/reservations/', {
+            'screening': 'x', 'seats_ids': [1]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHER)
+class HoldTest(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.screening = create_screening()
+        self.seats = list(Seat.objects.filter(room=self.screening.roomId).order_by('id').values_list('id', flat=True))
+        self.user = User.objects.create_user('client@example.com', 'pw', 'Client', 'User')
+        self.other = User.objects.create_user('other@example.com', 'pw', 'Other', 'User')
+        self.client = client_for(self.user)
+        self.url = '/user/request/holds/screening/%d/' % self.screening.id
+
+    def taken(self, client):
+        response = client.get('/user/request/seats/screening/%d/' % self.screening.id)
+        return set(seat['id'] for seat in response.data if seat['taken'])
+
+    def test_hold(self):
+        response = self.client.post(self.url, {'seats_ids': self.seats[:2]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.taken(self.client), set())
+        self.assertEqual(self.taken(client_for(self.other)), set(self.seats[:2]))
+        # the holds of two users are both kept
+        response = client_for(self.other).post(self.url, {'seats_ids': self.seats[2:3]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.taken(self.client), set(self.seats[2:3]))
+        self.assertEqual(self.client.delete(self.url, {}, format='json').status_code, 204)
+        self.assertEqual(self.taken(client_for(self.other)), set())
+
+    def test_conflicting_hold(self):
+        self.client.post(self.url, {'seats_ids': self.seats[:2]}, format='json')
+        response = client_for(self.other).post(self.url, {'seats_ids': self.seats[1:3]}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['conflicts'], [{'seat': self.seats[1], 'error': 'held'}])
+        # all or nothing : the free seat of the request is not held
+        self.assertEqual(self.taken(self.client), set())
+        response = client_for(self.other).post('/user/request/reservations/', {
+            'screening': self.screening.id, 'seats_ids': self.seats[1:2]}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+    def test_expiry(self):
+        with mock.patch.object(holds, 'HOLD_TIMEOUT', 1):
+            self.client.post(self.url, {'seats_ids': self.seats[:2]}, format='json')
+            self.assertEqual(self.taken(client_for(self.other)), set(self.seats[:2]))
+            time.sleep(1.2)
+            self.assertEqual(self.taken(client_for(self.other)), set())
+            response = client_for(self.other).post(self.url, {'seats_ids': self.seats[:2]}, format='json')
+            self.assertEqual(response.status_code, 201)
+
+    def test_hold_then_reservation(self):
+        self.client.post(self.url, {'seats_ids': self.seats[:2]}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/user/request/reservations/', {
+                'screening': self.screening.id, 'seats_ids': self.seats[:2]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        # the holds are released, the seats are reserved
+        self.assertEqual(holds.active_holds(self.screening.id, self.seats), {})
+        self.assertEqual(self.taken(self.client), set(self.seats[:2]))
+        response = client_for(self.other).post(self.url, {'seats_ids': self.seats[:1]}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['conflicts'], [{'seat': self.seats[0], 'error': 'taken'}])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.post('/user/request/holds/screening/0/', {'seats_ids': self.seats[:1]},
+                                          format='json').status_code, 404)
+        self.assertEqual(self.client.get('/user/request/seats/screening/0/').status_code, 404)
+        self.assertEqual(self.client.post(self.url, [self.seats[0]], format='json').status_code, 400)
+        self.assertEqual(self.client.delete(self.url, [self.seats[0]], format='json').status_code, 400)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHER)
+class MovieImageTest(TestCase):
+    # the images are checked before they are stored : a 400, not a 500
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        patcher = mock.patch.object(images, 'IMAGES_DIR', self.dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = client_for(User.objects.create_superuser('admin@example.com', 'pw', 'Admin', 'User'))
+        self.category = Category.objects.create(name='category')
+
+    def create(self, image):
+        return self.client.post('/admin/request/movies/', {
+            'title': 'movie', 'director': 'director', 'cast': 'cast', 'duration': 100, 'description': 'description',
+            'releaseDate': str(datetime.date.today()), 'categoriesId': [self.category.id], 'image': image}, format='json')
+
+    def data_url(self, format, content):
+        return 'data:image/%s;base64,%s' % (format, base64.b64encode(content).decode())
+
+    def test_valid_image(self):
+        response = self.create(self.data_url('png', b'\x89PNG\r\n\x1a\n' + b'\0' * 100))
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertTrue(Movie.objects.get().image.startswith(images.IMAGES_URL_PREFIX))
+
+    def test_invalid_base64(self):
+        self.assertEqual(self.create('data:image/png;base64,not base64!').status_code, 400)
+        self.assertFalse(Movie.objects.exists())
+
+    def test_extension_not_allowed(self):
+        self.assertEqual(self.create(self.data_url('svg+xml', b'<svg></svg>')).status_code, 400)
+
+    def test_content_not_an_image(self):
+        self.assertEqual(self.create(self.data_url('gif', b'<html>' * 10)).status_code, 400)
+        self.assertEqual(self.create(self.data_url('png', b'\xff\xd8\xff' + b'\0' * 100)).status_code, 400)
+        self.assertEqual(self.create(self.data_url('png', b'')).status_code, 400)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHER)
+class TokenCacheTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('client@example.com', 'pw', 'Client', 'User')
+        self.token = token.login_token(self.user)
+        token.invalidate_token(self.token.key)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.token.key)
+
+    def test_password_not_cached(self):
+        self.assertEqual(self.client.get('/user/request/profile/').status_code, 200)
+        entry = caches[token.TOKEN_CACHE].get(token.cache_key(self.token.key))
+        self.assertIsNotNone(entry)
+        self.assertNotIn(self.user.password, repr(entry))
+
+    def test_cached_user_saved(self):
+        # the user of the shared cache (the query is the number of reservations
+        # of the profile) is saved without its password
+        self.client.get('/user/request/profile/')
+        token._local.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get('/user/request/profile/')
+        self.assertEqual(response.status_code, 200)
+        user = response.wsgi_request.user
+        user.firstName = 'Changed'
+        user.save()
+        self.assertTrue(User.objects.get(id=self.user.id).check_password('pw'))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHER)
+class ResponseCacheTest(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.screening = create_screening()
+        self.category = Category.objects.create(name='drama')
+        self.client = APIClient()
+
+    def get(self, url, **headers):
+        response = self.client.get(url, **headers)
+        return response, response.get('X-Cache')
+
+    def test_a_save_changes_the_response(self):
+        screenings = '/public/request/screenings/'
+        for instance, field, value, url in (
+                (self.screening.movieId, 'title', 'new title', screenings),
+                (self.screening, 'price', 12, screenings),
+                (self.screening.roomId, 'name', 'new room', screenings),
+                (self.category, 'name', 'comedy', '/public/request/categories/')):
+            before, cache = self.get(url)
+            self.assertEqual(self.get(url)[1], 'HIT')
+            setattr(instance, field, value)
+            instance.save()
+            after, cache = self.get(url)
+            self.assertEqual(cache, 'MISS', field)
+            self.assertNotEqual(before.content, after.content)
+
+    def test_if_none_match(self):
+        url = '/public/request/screenings/'
+        response, cache = self.get(url)
+        etag = response['ETag']
+        response, cache = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, cache), (304, 'HIT'))
+        self.assertEqual(response.content, b'')
+        response, cache = self.get(url, HTTP_IF_NONE_MATCH='"other", W/%s' % etag)
+        self.assertEqual(response.status_code, 304)
+        response, cache = self.get(url, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.screening.price = 12
+        self.screening.save()
+        response, cache = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_authenticated_and_other_methods_not_cached(self):
+        url = '/public/request/screenings/'
+        user = User.objects.create_user('client@example.com', 'pw', 'Client', 'User')
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token.login_token(user).key)
+        for i in range(2):
+            response, cache = self.get(url)
+            self.assertEqual((response.status_code, cache), (200, None))
+        self.client.credentials()
+        self.assertEqual(self.client.head(url).get('X-Cache'), None)
+        self.assertEqual(self.client.post(url, {}).status_code, 405)
+        self.assertEqual(self.get(url)[1], 'MISS')
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHER)
+class RoomResizeTest(TestCase):
+
+    def setUp(self):
+        self.screening = create_screening(rows=5, columns=6)
+        self.room = self.screening.roomId
+        self.client = client_for(User.objects.create_superuser('admin@example.com', 'pw', 'Admin', 'User'))
+        self.url = '/admin/request/rooms/%d/' % self.room.id
+
+    def seats(self):
+        return set(Seat.objects.filter(room=self.room).values_list('row', 'number'))
+
+    def test_grow_and_shrink(self):
+        ids = set(Seat.objects.filter(room=self.room).values_list('id', flat=True))
+        response = self.client.patch(self.url, {'nbRows': 6, 'nbColumns': 8}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.seats(), {(r, n) for r in range(1, 7) for n in range(1, 9)})
+        # the seats of the room are kept (with their reservations)
+        self.assertTrue(ids <= set(Seat.objects.filter(room=self.room).values_list('id', flat=True)))
+        response = self.client.patch(self.url, {'nbRows': 4, 'nbColumns': 3}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.seats(), {(r, n) for r in range(1, 5) for n in range(1, 4)})
+
+    def test_reserved_seats_not_removed(self):
+        user = User.objects.create_user('client@example.com', 'pw', 'Client', 'User')
+        seat = Seat.objects.get(room=self.room, row=5, number=1)
+        reserve_seats(user, self.screening, [seat.id])
+        response = self.client.patch(self.url, {'nbRows': 4}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.nbRows, 5)
+        self.assertEqual(len(self.seats()), 30)
+        # the reserved seat stays in the room : other seats can go
+        response = self.client.patch(self.url, {'nbColumns': 2}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.seats(), {(r, n) for r in range(1, 6) for n in range(1, 3)})
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHER)
+class ScheduleImportTest(TestCase):
+
+    def setUp(self):
+        self.screening = create_screening()    # tomorrow 20:00, 100 minutes
+        self.client = client_for(User.objects.create_superuser('admin@example.com', 'pw', 'Admin', 'User'))
+        movie, room, day = self.screening.movieId_id, self.screening.roomId_id, self.screening.date.isoformat()
+        self.rows = [
+            (movie, room, 8, day, '10:00'),
+            (0, room, 8, day, '12:00'),
+            (movie, 0, 8, day, '12:00'),
+            (movie, room, 'free', day, '12:00'),
+            (movie, room, 8, day, '21:00'),
+            (movie, room, 8, day, '10:30'),
+            (movie, room, 9.5, day, '14:00'),
+        ]
+
+    def check_result(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'created': 2, 'errors': [
+            {'row': 2, 'error': 'unknown movie'},
+            {'row': 3, 'error': 'unknown room'},
+            {'row': 4, 'error': 'invalid row'},
+            {'row': 5, 'error': 'conflict in time with screening %d' % self.screening.id},
+            {'row': 6, 'error': 'conflict in time with row 1'},
+        ]})
+        times = Screening.objects.exclude(id=self.screening.id).order_by('time').values_list('time', 'price')
+        self.assertEqual(list(times), [(datetime.time(10), 8), (datetime.time(14), 9.5)])
+
+    def test_csv(self):
+        body = 'movie,room,price,date,time\n' + ''.join('%s,%s,%s,%s,%s\n' % row for row in self.rows)
+        self.check_result(self.client.post('/admin/request/screenings/import/', body.encode(),
+                                           content_type='text/csv'))
+
+    def test_json_lines(self):
+        keys = ('movie', 'room', 'price', 'date', 'time')
+        body = ''.join(json.dumps(dict(zip(keys, row))) + '\n\n' for row in self.rows)
+        self.check_result(self.client.post('/admin/request/screenings/import/', body.encode(),
+                                           content_type='application/x-ndjson'))
+
+    def test_not_json(self):
+        response = self.client.post('/admin/request/screenings/import/', b'{"movie": 1',
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.data, {'created': 0, 'errors': [{'row': 1, 'error': 'invalid row'}]})
+        response = self.client.post('/admin/request/screenings/import/', b'[]', content_type='application/json')
+        self.assertEqual(response.status_code, 415)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHER)
+class PaginationTest(TestCase):
+
+    def setUp(self):
+        self.client = client_for(User.objects.create_superuser('admin@example.com', 'pw', 'Admin', 'User'))
+        today = datetime.date.today()
+        # 3 release dates, 4 movies each : the pages cut through the ties
+        Movie.objects.bulk_create([Movie(title='movie %d' % i, director='director', cast='cast', duration=100,
+                                         description='', releaseDate=today - datetime.timedelta(days=i % 3))
+                                   for i in range(12)])
+        self.expected = list(Movie.objects.order_by('-releaseDate', '-id').values_list('id', flat=True))
+
+    def follow(self, url, link):
+        ids = []
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([movie['id'] for movie in response.data['results']])
+            ids += pages[-1]
+            url = response.data[link]
+        return ids, pages
+
+    def test_next_and_previous(self):
+        ids, pages = self.follow('/admin/request/movies/?page_size=5', 'next')
+        self.assertEqual(ids, self.expected)
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        # back from the last page
+        response = self.client.get('/admin/request/movies/?page_size=5')
+        response = self.client.get(response.data['next'])
+        last = self.client.get(response.data['next'])
+        self.assertIsNone(last.data['next'])
+        ids, pages = self.follow(last.data['previous'], 'previous')
+        self.assertEqual(pages, [self.expected[5:10], self.expected[:5]])
+
+    def test_page_size_capped(self):
+        Movie.objects.bulk_create([Movie(title='more %d' % i, director='director', cast='cast', duration=100,
+                                         description='', releaseDate=datetime.date.today())
+                                   for i in range(MAX_PAGE_SIZE)])
+        response = self.client.get('/admin/request/movies/?page_size=%d' % (MAX_PAGE_SIZE * 10))
+        self.assertEqual(len(response.data['results']), MAX_PAGE_SIZE)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_invalid_cursor(self):
+        for cursor in ('nonsense', base64.b64encode(b'p=not json').decode(),
+                       base64.b64encode(b'p=["1"]').decode()):
+            response = self.client.get('/admin/request/movies/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+
+
+class SearchTest(TestCase):
+
+    def test_prefix_of_the_words(self):
+        today = datetime.date.today()
+        dark = Movie.objects.create(title='The Dark Knight', director='Christopher Nolan', cast='Christian Bale',
+                                    duration=150, description='', releaseDate=today)
+        darko = Movie.objects.create(title='Donnie Darko', director='Richard Kelly', cast='Jake Gyllenhaal',
+                                     duration=113, description='', releaseDate=today)
+        self.assertEqual(search_movies('dar'), [dark.id, darko.id])
+        self.assertEqual(search_movies('DARK kni'), [dark.id])
+        self.assertEqual(search_movies('darkz'), [])
+        self.assertEqual(search_movies('ark'), [])
+        self.assertEqual(search_movies('christ'), [dark.id])
+
+
+class InstrumentationTest(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        create_screening()
+        patcher = mock.patch.object(instrumentation, 'INSTRUMENTATION_SAMPLE_RATE', 1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_server_timing(self):
+        response = APIClient().get('/public/request/screenings/')
+        timings = dict(t.split(';')[0:2] for t in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timings), {'total', 'db', 'serialize', 'render', 'app'})
+        self.assertIn('3 queries', response['Server-Timing'])
+        stats = [r for r in instrumentation.report() if r['route'].startswith('public/request/screenings/')][0]
+        self.assertGreater(stats['serializeMs'], 0)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHER)
+class QueryCountTest(TestCase):
+    # the number of queries of an endpoint does not depend on the number of rows
+
+    def setUp(self):
+        caches['default'].clear()
+        self.screening = create_screening()
+        room, movie = self.screening.roomId, self.screening.movieId
+        self.category = Category.objects.create(name='category')
+        self.movies = [movie] + [Movie.objects.create(title='movie %d' % i, director='director', cast='cast',
+            duration=100, description='description', releaseDate=datetime.date.today()) for i in range(3)]
+        for i, movie in enumerate(self.movies):
+            movie.categoriesId.add(self.category)
+            if i:
+                Screening.objects.create(movieId=movie, roomId=room, price=8,
+                    date=datetime.date.today() + datetime.timedelta(days=i + 1), time=datetime.time(20))
+        Movie.objects.filter(id=self.movies[3].id).update(releaseDate=datetime.date.today() + datetime.timedelta(days=30))
+        self.user = User.objects.create_user('client@example.com', 'pw', 'Client', 'User')
+        self.admin = User.objects.create_superuser('admin@example.com', 'pw', 'Admin', 'User')
+        seats = list(Seat.objects.filter(room=room).values_list('id', flat=True))
+        self.reservations = [reserve_seats(self.user, screening, seats[:2])
+                             for screening in Screening.objects.all()]
+        self.public = APIClient()
+        self.client = client_for(self.user)
+        self.adminClient = client_for(self.admin)
+
+    def check(self, client, url, queries):
+        with self.assertNumQueries(queries):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_public_categories(self):
+        self.check(self.public, '/public/request/categories/', 1)
+
+    def test_public_movies(self):
+        self.check(self.public, '/public/request/movies/', 2)
+
+    def test_public_movie(self):
+        self.check(self.public, '/public/request/movies/%d/' % self.movies[1].id, 2)
+
+    def test_public_coming_soon(self):
+        self.check(self.public, '/public/request/movies/coming-soon/', 2)
+
+    def test_public_screenings(self):
+        self.check(self.public, '/public/request/screenings/', 3)
+
+    def test_public_screening(self):
+        self.check(self.public, '/public/request/screenings/%d/' % self.screening.id, 3)
+
+    def test_public_screenings_for_movie(self):
+        self.check(self.public, '/public/request/screenings/movie/%d/' % self.movies[1].id, 3)
+
+    def test_public_trending(self):
+        self.check(self.public, '/public/request/movies/trending/', 3)
+
+    def test_public_search(self):
+        self.check(self.public, '/public/request/movies/search/?q=mov', 3)
+
+    def test_user_reservations(self):
+        self.check(self.client, '/user/request/reservations/', 4)
+
+    def test_user_reservation(self):
+        self.check(self.client, '/user/request/reservations/%d/' % self.reservations[0].id, 4)
+
+    def test_user_seats(self):
+        self.check(self.client, '/user/request/seats/screening/%d/' % self.screening.id, 3)
+
+    def test_user_profile(self):
+        self.check(self.client, '/user/request/profile/', 1)
+
+    def test_admin_movies(self):
+        self.check(self.adminClient, '/admin/request/movies/', 2)
+
+    def test_admin_movie(self):
+        self.check(self.adminClient, '/admin/request/movies/%d/' % self.movies[1].id, 2)
+
+    def test_admin_screenings(self):
+        self.check(self.adminClient, '/admin/request/screenings/', 3)
+
+    def test_admin_screening(self):
+        self.check(self.adminClient, '/admin/request/screenings/%d/' % self.screening.id, 3)
+
+    def test_admin_screenings_for_movie(self):
+        self.check(self.adminClient, '/admin/request/screenings/movie/%d/' % self.movies[1].id, 3)
+
+    def test_admin_rooms(self):
+        self.check(self.adminClient, '/admin/request/rooms/', 1)
+
+    def test_admin_reservations(self):
+        self.check(self.adminClient, '/admin/request/reservations/', 4)
+
+    def test_admin_reservation(self):
+        self.check(self.adminClient, '/admin/request/reservations/%d/' % self.reservations[0].id, 4)
+
+    def test_admin_users(self):
+        self.check(self.adminClient, '/admin/request/users/', 1)
+
+    def test_admin_all_users(self):
+        self.check(self.adminClient, '/admin/request/users/all/', 1)
+
+    def test_admin_trending(self):
+        self.check(self.adminClient, '/admin/request/movies/trending/', 3)
+
+    def test_admin_loyal_clients(self):
+        self.check(self.adminClient, '/admin/request/users/loyal-clients/', 1)
+
+    def test_booking(self):
+        seats = list(Seat.objects.filter(room=self.screening.roomId).values_list('id', flat=True))
+        # the counters updated after the commit are not run in a TestCase
+        with self.assertNumQueries(11):
+            response = self.client.post('/user/request/reservations/', {
+                'screening': self.screening.id, 'seats_ids': seats[2:5]}, format='json')
+        self.assertEqual(response.status_code, 201)
@@ -1,6 +1,157 @@
+import copy
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
 from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
 
 # change Token to Bearer to make it a bearer token
+# the token -> user lookups are cached to avoid a query per request :
+# - a small LRU in the process, trusted TOKEN_LOCAL_TIMEOUT seconds (the
+#   other processes can not clear it, so it is kept short)
+# - the shared cache TOKEN_CACHE, trusted TOKEN_CACHE_TIMEOUT seconds ; it
+#   only keeps the fields of the user without the password hash, the user is
+#   rebuilt with the password deferred (read from the database if needed,
+#   and not written by save())
+# a saved user (password changed, deactivated ...) or a deleted / replaced
+# token (logout, rotation) is removed from both
+# with TOKEN_EXPIRY (seconds) the tokens expire, and login gives a new one ;
+# with TOKEN_ROTATION every login gives a new token
+# a user has one token (rest_framework Token), shared by all the devices :
+# logout deletes it, which logs the user out everywhere
+
+TOKEN_CACHE = getattr(settings, 'TOKEN_CACHE', 'default')
+TOKEN_CACHE_TIMEOUT = getattr(settings, 'TOKEN_CACHE_TIMEOUT', 5 * 60)
+TOKEN_LOCAL_TIMEOUT = getattr(settings, 'TOKEN_LOCAL_TIMEOUT', 10)
+TOKEN_LOCAL_SIZE = getattr(settings, 'TOKEN_LOCAL_SIZE', 1024)
+TOKEN_EXPIRY = getattr(settings, 'TOKEN_EXPIRY', None)
+TOKEN_ROTATION = getattr(settings, 'TOKEN_ROTATION', False)
+
+_local = OrderedDict()     # key: (user, token created, trusted until)
+_lock = threading.Lock()
+
+User = get_user_model()
+CACHED_USER_FIELDS = [f.attname for f in User._meta.concrete_fields if f.attname != 'password']
+
+
+def _cache():
+    return caches[TOKEN_CACHE]
+
+
+def cache_key(key):
+    return 'token:%s' % key
+
+
+def _local_get(key):
+    with _lock:
+        entry = _local.get(key)
+        if entry is None:
+            return None
+        if entry[2] < time.monotonic():
+            del _local[key]
+            return None
+        _local.move_to_end(key)
+        return entry[:2]
+
+
+def _local_set(key, user, created):
+    with _lock:
+        _local[key] = (user, created, time.monotonic() + TOKEN_LOCAL_TIMEOUT)
+        _local.move_to_end(key)
+        while len(_local) > TOKEN_LOCAL_SIZE:
+            _local.popitem(last=False)
+
+
+def invalidate_token(key):
+    with _lock:
+        _local.pop(key, None)
+    _cache().delete(cache_key(key))
+
+
+def invalidate_user(user_id):
+    with _lock:
+        for key in [k for k, entry in _local.items() if entry[0].pk == user_id]:
+            del _local[key]
+    for key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        invalidate_token(key)
+
+
+def cached_user(user):
+    return tuple(getattr(user, name) for name in CACHED_USER_FIELDS)
+
+
+def user_from_cache(values):
+    return User.from_db(DEFAULT_DB_ALIAS, CACHED_USER_FIELDS, values)
+
+
+def expires_at(created):
+    if TOKEN_EXPIRY is None:
+        return None
+    return created + datetime.timedelta(seconds=TOKEN_EXPIRY)
+
+
+def token_expired(created):
+    end = expires_at(created)
+    return end is not None and end <= timezone.now()
+
+
+def login_token(user):
+    # the token of the user, a new one when it has expired or (TOKEN_ROTATION) at each login
+    token = Token.objects.filter(user=user).first()
+    if token is not None and (TOKEN_ROTATION or token_expired(token.created)):
+        token.delete()
+        token = None
+    if token is None:
+        token, created = Token.objects.get_or_create(user=user)
+    return token
+
 
 class BearerAuthentication(TokenAuthentication):
-    keyword = 'Bearer'
\ No newline at end of file
+    keyword = 'Bearer'
+
+    def authenticate_credentials(self, key):
+        entry = _local_get(key)
+        if entry is None:
+            entry = _cache().get(cache_key(key))
+            if entry is None:
+                try:
+                    token = Token.objects.select_related('user').defer('user__password').get(key=key)
+                except Token.DoesNotExist:
+                    raise exceptions.AuthenticationFailed(_('Invalid token.'))
+                entry = (cached_user(token.user), token.created)
+                _cache().set(cache_key(key), entry, TOKEN_CACHE_TIMEOUT)
+            entry = (user_from_cache(entry[0]), entry[1])
+            _local_set(key, *entry)
+        user, created = entry
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        if token_expired(created):
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+        # a copy : the cached user is shared by the requests
+        user = copy.copy(user)
+        return (user, Token(key=key, user=user, created=created))
+
+# signals : invalidation
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance=None, created=False, **kwargs):
+    if not created:
+        invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def token_changed(sender, instance=None, **kwargs):
+    invalidate_token(instance.key)
@@ -1,9 +1,9 @@
-from django.db import router
 from django.urls import path, include
-from .views import AllUserViewSet, AvailableMovieViewSet, AvailableScreeningViewSet, ComingSoonMovieViewSet, CreateUserAPIView, MovieViewset, OnlyUserViewSet, ReservationViewSet, RoomViewset, ScreeningViewset, available_screenings_for_movie, available_trending_movies, income_and_nb_reservations, logout_view, loyal_clients, number_of_movies_per_category, number_of_users, profile, reservation_details, reservations, customer_login, screenings_for_movie, seats_for_screening, seats_reserved_per_category_last_week, trending_movies
+from .views import AllUserViewSet, AvailableMovieViewSet, AvailableScreeningViewSet, ComingSoonMovieViewSet, CreateUserAPIView, MovieViewset, OnlyUserViewSet, ReservationViewSet, RoomViewset, ScreeningViewset, available_screenings_for_movie, available_trending_movies, income_and_nb_reservations, logout_view, loyal_clients, number_of_movies_per_category, number_of_users, profile, reservation_details, reservations, customer_login, screenings_for_movie, seat_events_ticket, seat_holds, seats_for_screening, seats_reserved_per_category_last_week, trending_movies
 # from rest_framework.authtoken.views import obtain_auth_token
-from .views import CategoryViewset
+from .views import CategoryViewset, import_screenings, metrics, response_cache_stats, slow_endpoints, search_movies_view, seats_reserved_per_category_series
 from rest_framework.routers import DefaultRouter
+from . import async_views
 
 routerPublic = DefaultRouter()
 routerPublic.register('categories', CategoryViewset, basename='Categories')
@@ -31,8 +31,18 @@ urlpatterns = [
     path('user/request/reservations/', reservations, name='Reservations For User'),                 # user
     path('user/request/profile/', profile, name='User Profile'),                                    # user
     path('user/request/seats/screening/<int:id>/', seats_for_screening, name='Seats For Screening'),    # user
+    path('user/request/holds/screening/<int:id>/', seat_holds, name='Seat Holds For Screening'),    # user
+    path('user/request/events/seats/screening/<int:id>/ticket/', seat_events_ticket, name='Seat Events Ticket'),    # user
     path('public/request/movies/trending/', available_trending_movies, name='Available Trending Movies'),    # public
+    path('public/request/movies/search/', search_movies_view, name='Search Movies'),    # public
     path('public/request/screenings/movie/<int:id>/', available_screenings_for_movie, name='Available Screenings For Movie'), #public
+    path('public/request/async/movies/', async_views.available_movies, name='Async Available Movies'), # public
+    path('public/request/async/movies/coming-soon/', async_views.coming_soon_movies, name='Async Coming Soon Movies'), # public
+    path('public/request/async/movies/trending/', async_views.available_trending_movies, name='Async Available Trending Movies'), # public
+    path('public/request/async/screenings/', async_views.available_screenings, name='Async Available Screenings'), # public
+    path('public/request/async/screenings/movie/<int:id>/', async_views.available_screenings_for_movie, name='Async Available Screenings For Movie'), # public
+    path('public/request/async/catalogue/', async_views.catalogue, name='Async Catalogue'), # public
+    path('user/request/async/seats/screening/<int:id>/', async_views.seats_for_screening, name='Async Seats For Screening'), # user
     path('public/request/', include(routerPublic.urls), name='Public Part'),    # public
     path('admin/request/movies/trending/', trending_movies, name='Trending Movies'), # admin
     path('admin/request/movies/per-categories/', number_of_movies_per_category, name='Number Of Movies Per Category'),   # admin
@@ -40,11 +50,19 @@ urlpatterns = [
     path('admin/request/users/loyal-clients/', loyal_clients, name='Number Of Users'),  # admin
     path('admin/request/reservations/total-numbers/', income_and_nb_reservations, name='Income & Nb of Reservations'), # admin
     path('admin/request/reservations/per-categories/last-week/', seats_reserved_per_category_last_week, name='Nb of Seats Reserved Last Week per Category'), # admin
+    path('admin/request/reservations/per-categories/series/', seats_reserved_per_category_series, name='Nb of Seats Reserved per Category'), # admin
     path('admin/request/screenings/movie/<int:id>/', screenings_for_movie, name='Screenings For Movie'), # admin
+    path('admin/request/screenings/import/', import_screenings, name='Import Screenings'), # admin
+    path('admin/request/cache/stats/', response_cache_stats, name='Response Cache Stats'), # admin
+    path('admin/request/metrics/', metrics, name='Metrics'), # admin
+    path('admin/request/metrics/slow-endpoints/', slow_endpoints, name='Slow Endpoints'), # admin
     path('admin/request/', include(routerAdmin.urls), name='Admin Part')        # admin
 ]
 
 # to do a reservation : 
 # public/request/sign-up -> token/generate-token (signup + login) == POST
 # users/request/seats/screening/<int:id> (to get the seats of a screening) == GET
+# users/request/holds/screening/<int:id> (optional, to hold the seats a few minutes) == POST
+# users/request/events/seats/screening/<int:id>/ticket (optional, a ticket for the events, valid once) == POST
+# users/request/events/seats/screening/<int:id>?ticket= (optional, seats reserved / released pushed as Server-Sent Events, not the holds ; ASGI only, with WSGI poll the seats) == GET
 # users/request/reservations (to make a reservation) == POST
\ No newline at end of file
@@ -1,23 +1,45 @@
 import datetime
-from django.db.models import Q, Count
-from django.db.models.aggregates import Sum
+from django.db.models import Count
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
-from rest_framework import status, filters, viewsets
+from rest_framework import status, viewsets
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import api_view, permission_classes
-from django.contrib.auth import authenticate, logout
+from django.contrib.auth import logout
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
 
-from .models import Category, Movie, Reservation, Room, Screening, Seat, SeatReserved, User, UserManager
-from .serializers import CategorySerializer, MovieSerializer, ReservationSerializer, RoomSerializer, ScreeningSerializer, SeatReservedSerializer, SeatSerializer, UserSerializer
-from .token import BearerAuthentication
+from .models import Category, Movie, Reservation, Room, RoomResizeError, Screening, ScreeningConflict, User, UserManager
+from .serializers import CategorySerializer, MovieListSerializer, MovieSerializer, ReservationSerializer, RoomSerializer, ScreeningSerializer, UserSerializer
+from .token import BearerAuthentication, expires_at, login_token
+from .passwords import PasswordPoolBusy, authenticate_user, hash_password
+from .pagination import MoviePagination, ReservationPagination, ScreeningPagination, UserPagination
+from . import availability, querysets
+from .seatmap import get_layout, seat_map
+from .booking import SeatConflict, hold_seats, reserve_seats
+from .holds import HOLD_TIMEOUT, release_holds
+from .seatevents import SEATEVENTS_TICKET_TIMEOUT, stream_ticket
+from .responsecache import CATEGORIES, MOVIES, ROOMS, SCREENINGS, SEATS, CachedResponseMixin, cache_response, cache_stats
+from .search import MovieSearchFilter, search_movies
+from .schedule_import import import_programme, read_csv, read_json_lines
+from .analytics import SeriesError, parse_range, seats_reserved_per_category
+from .rollups import reservation_totals
+from .dbrouter import ReplicaMixin, read_replica
+from .instrumentation import metrics_text, report
 
 # Create your views here.
 
 nbTrendingMovies = 5
 nbTrendingMoviesAdmin = 10
 nbLoyalClients = 3
+nbSearchResults = 20
+
+# too many logins / sign-ups waiting for the hashing of their password
+def busy_response(e):
+    response = Response(status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = e.retry_after
+    return response
 
 class CreateUserAPIView(APIView):   # public
     authentication_classes = [BearerAuthentication]
@@ -26,8 +48,12 @@ class CreateUserAPIView(APIView):   # public
         user = request.data
         serializer = UserSerializer(data=user)
         serializer.is_valid(raise_exception=True)
+        try:
+            passwordHash = hash_password(user['password'])
+        except PasswordPoolBusy as e:
+            return busy_response(e)
         userManager= UserManager()
-        userManager.create_user(user['email'], user['password'], user['firstName'], user['lastName'])
+        userManager.create_user(user['email'], firstName=user['firstName'], lastName=user['lastName'], passwordHash=passwordHash)
         #serializer.save()
         return Response(status=status.HTTP_201_CREATED)
 
@@ -40,13 +66,13 @@ def customer_login(request):    # public
         password = data['password']
     except:
         return Response(status=status.HTTP_400_BAD_REQUEST)
-    user = authenticate(email=email, password=password)
+    try:
+        user = authenticate_user(email, password)
+    except PasswordPoolBusy as e:
+        return busy_response(e)
     if user is not None:
-        try:
-            user_token = user.auth_token.key
-        except:
-            user_token = Token.objects.create(user=user)
-        data = {'token': user_token, 'admin': user.is_admin}
+        user_token = login_token(user)
+        data = {'token': user_token.key, 'admin': user.is_admin, 'expires': expires_at(user_token.created)}
         return Response(data=data, status=status.HTTP_200_OK)
     return Response(status=status.HTTP_401_UNAUTHORIZED)
 
@@ -60,40 +86,72 @@ def profile(request):       # user
 @api_view(['GET'])
 @permission_classes((IsAuthenticated, ))
 def seats_for_screening(request, id):   # user
-    screening = Screening.objects.get(id=id)
-    seats = Seat.objects.filter(room__id=screening.roomId.id)
-    seatResponse = []
-    for s in seats:
-        sr = SeatReserved.objects.filter(seatId__id=s.id, screening=screening.id).first()
-        if sr != None:
-            data = {'id' : s.id, 'row' : s.row, 'number' : s.number, 'taken': True}
-        else:
-            data = {'id' : s.id, 'row' : s.row, 'number' : s.number, 'taken': False}
-        seatResponse.append(data)
+    screening = get_object_or_404(Screening.objects.only('id', 'roomId'), id=id)
+    seatResponse = seat_map(screening, request.user)
     return Response(data=seatResponse, status=status.HTTP_200_OK)
 
+@api_view(['POST', 'DELETE'])
+@permission_classes((IsAuthenticated, ))
+def seat_holds(request, id):    # user
+    screening = get_object_or_404(Screening.objects.only('id', 'roomId'), id=id)
+    if not isinstance(request.data, dict):
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+    seatsIds = request.data.get('seats_ids')
+    if request.method == 'POST':
+        try:
+            seatsIds = hold_seats(request.user, screening, seatsIds)
+        except (TypeError, ValueError):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        except SeatConflict as e:
+            if e.invalid:
+                return Response(data={'conflicts': e.conflicts}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(data={'conflicts': e.conflicts}, status=status.HTTP_409_CONFLICT)
+        data = {'screening': screening.id, 'seats_ids': seatsIds, 'expires_in': HOLD_TIMEOUT}
+        return Response(data=data, status=status.HTTP_201_CREATED)
+    elif request.method == 'DELETE':
+        if seatsIds is None:    # all the holds of the user on the screening
+            seatsIds = [seat[0] for seat in get_layout(screening.roomId_id)['seats']]
+        elif not isinstance(seatsIds, list):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        release_holds(screening.id, seatsIds, request.user.id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+# ticket of the seat events stream of a screening (seatevents.py), for
+# EventSource : GET user/request/events/seats/screening/<id>/?ticket=
+@api_view(['POST'])
+@permission_classes((IsAuthenticated, ))
+def seat_events_ticket(request, id):    # user
+    data = {'ticket': stream_ticket(request.auth.key, id), 'expires_in': SEATEVENTS_TICKET_TIMEOUT}
+    return Response(data=data, status=status.HTTP_201_CREATED)
+
 @api_view(['GET'])
 @permission_classes((IsAdminUser, ))
 def screenings_for_movie(request, id):
-    screenings = Screening.objects.filter(movieId__id=id)
-    serializer = ScreeningSerializer(screenings, many=True)
-    return Response(serializer.data)
+    screenings = querysets.screenings(Screening.objects.filter(movieId__id=id))
+    paginator = ScreeningPagination()
+    page = paginator.paginate_queryset(screenings, request)
+    serializer = ScreeningSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
 
 @api_view(['GET'])
 @permission_classes((AllowAny, ))
+@read_replica
 def available_screenings_for_movie(request, id):
-    today = datetime.datetime.combine(datetime.date.today(), datetime.time.min)
-    screenings = Screening.objects.filter(movieId__id=id).filter( Q(date__gt=today.date()) | ( Q(date=today.date()) & Q(time__gte=today.time()) ))
-    serializer = ScreeningSerializer(screenings, many=True)
-    return Response(serializer.data)
+    screenings = querysets.screenings(availability.upcoming_screenings().filter(movieId__id=id))
+    paginator = ScreeningPagination()
+    page = paginator.paginate_queryset(screenings, request)
+    serializer = ScreeningSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
 
 @api_view(['GET','POST'])
 @permission_classes((IsAuthenticated, ))
 def reservations(request):    # user
     if request.method =='GET':
-        reservations = Reservation.objects.filter(user=request.user)
-        serializer = ReservationSerializer(reservations, many=True)
-        return Response(serializer.data)
+        reservations = querysets.reservations(Reservation.objects.filter(user=request.user))
+        paginator = ReservationPagination()
+        page = paginator.paginate_queryset(reservations, request)
+        serializer = ReservationSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     elif request.method == 'POST':
         data = request.data
         try:
@@ -102,11 +160,21 @@ def reservations(request):    # user
         except:
             return Response(status=status.HTTP_400_BAD_REQUEST)
         user = request.user
-        screening = Screening.objects.get(id=screeningId)
-        reservation = Reservation.objects.create(user=user, screeningId=screening, total=len(seatsIds)*screening.price)
-        for s in seatsIds:
-            seat = Seat.objects.get(id=s)
-            SeatReserved.objects.create(screening=screening, seatId=seat, reservation=reservation)
+        try:
+            screening = Screening.objects.get(id=screeningId)
+        except Screening.DoesNotExist:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        except (TypeError, ValueError):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        try:
+            reservation = reserve_seats(user, screening, seatsIds)
+        except (TypeError, ValueError):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        except SeatConflict as e:
+            if e.invalid:
+                return Response(data={'conflicts': e.conflicts}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(data={'conflicts': e.conflicts}, status=status.HTTP_409_CONFLICT)
+        reservation = querysets.reservations().get(id=reservation.id)
         serializer = ReservationSerializer(reservation)
         return Response(serializer.data, status.HTTP_201_CREATED)
 
@@ -114,7 +182,9 @@ def reservations(request):    # user
 @permission_classes((IsAuthenticated, ))
 def reservation_details(request, id):   # user
     if request.method == 'GET':
-        reservation = Reservation.objects.filter(user=request.user, id=id)
+        reservation = querysets.reservations(Reservation.objects.filter(user=request.user, id=id)).first()
+        if reservation is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
         serializer = ReservationSerializer(reservation)
         return Response(serializer.data)
     elif request.method == 'DELETE':
@@ -122,52 +192,70 @@ def reservation_details(request, id):   # user
         reservation.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-class CategoryViewset(viewsets.ReadOnlyModelViewSet):   # all
+class CategoryViewset(ReplicaMixin, CachedResponseMixin, viewsets.ReadOnlyModelViewSet):   # all
+    cache_groups = (CATEGORIES,)
     serializer_class = CategorySerializer
     queryset = Category.objects.all()
     authentication_classes = [BearerAuthentication]
     permission_classes = [AllowAny]
 
-class MovieViewset(viewsets.ModelViewSet):  # admin
-    serializer_class = MovieSerializer
-    queryset = Movie.objects.all()
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['title', 'director', 'cast']
+# lists of movies : MovieListSerializer and no large column loaded
+class MovieListMixin:
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return MovieListSerializer
+        return MovieSerializer
+
+    def movie_queryset(self, queryset):
+        if self.action == 'list':
+            return querysets.movie_list(queryset, self.request)
+        return querysets.movies(queryset)
+
+class MovieViewset(MovieListMixin, viewsets.ModelViewSet):  # admin
+    pagination_class = MoviePagination
+    def get_queryset(self):
+        return self.movie_queryset(Movie.objects.all())
+    filter_backends = [MovieSearchFilter]
     authentication_classes = [BearerAuthentication]
     permission_classes = [IsAdminUser]
+    def update(self, request, *args, **kwargs):
+        # a longer duration overlapping the next screening of a room
+        try:
+            return super().update(request, *args, **kwargs)
+        except ScreeningConflict:
+            return Response(status=status.HTTP_409_CONFLICT)
 
-class ComingSoonMovieViewSet(viewsets.ReadOnlyModelViewSet):    # public
-    serializer_class = MovieSerializer
-    queryset = Movie.objects.filter(releaseDate__gt = datetime.datetime.combine(datetime.date.today(), datetime.time.min).date())
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['title', 'director', 'cast']
+class ComingSoonMovieViewSet(ReplicaMixin, CachedResponseMixin, MovieListMixin, viewsets.ReadOnlyModelViewSet):    # public
+    cache_groups = (MOVIES, CATEGORIES, SCREENINGS, SEATS)
+    pagination_class = MoviePagination
+    def get_queryset(self):
+        return self.movie_queryset(availability.coming_soon_movies())
+    filter_backends = [MovieSearchFilter]
     authentication_classes = [BearerAuthentication]
     permission_classes = [AllowAny]
 
-class AvailableScreeningViewSet(viewsets.ReadOnlyModelViewSet): # public
+class AvailableScreeningViewSet(ReplicaMixin, CachedResponseMixin, viewsets.ReadOnlyModelViewSet): # public
+    cache_groups = (SCREENINGS, MOVIES, CATEGORIES, ROOMS, SEATS)
     serializer_class = ScreeningSerializer
+    pagination_class = ScreeningPagination
     def get_queryset(self):
-        today = datetime.datetime.combine(datetime.date.today(), datetime.time.min)
-        query = Screening.objects.filter( Q(date__gt=today.date()) | ( Q(date=today.date()) & Q(time__gte=today.time()) ))
-        return query
+        return querysets.screenings(availability.upcoming_screenings())
     authentication_classes = [BearerAuthentication]
     permission_classes = [AllowAny]
 
-class AvailableMovieViewSet(viewsets.ReadOnlyModelViewSet):    # public
-    serializer_class = MovieSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['title', 'director', 'cast']
+class AvailableMovieViewSet(ReplicaMixin, CachedResponseMixin, MovieListMixin, viewsets.ReadOnlyModelViewSet):    # public
+    cache_groups = (MOVIES, CATEGORIES, SCREENINGS, SEATS)
+    pagination_class = MoviePagination
+    filter_backends = [MovieSearchFilter]
     def get_queryset(self):
-        today = datetime.datetime.combine(datetime.date.today(), datetime.time.min)
-        screenings = Screening.objects.filter( Q(date__gt=today.date()) | ( Q(date=today.date()) & Q(time__gte=today.time()) )).values_list('movieId')
-        query = Movie.objects.filter(id__in = screenings)
-        return query
+        return self.movie_queryset(availability.available_movies())
     authentication_classes = [BearerAuthentication]
     permission_classes = [AllowAny]
 
 class ScreeningViewset(viewsets.ModelViewSet):  # admin
     serializer_class = ScreeningSerializer
-    queryset = Screening.objects.all()
+    queryset = querysets.screenings()
+    pagination_class = ScreeningPagination
     authentication_classes = [BearerAuthentication]
     permission_classes = [IsAdminUser]
     def create(self, request, *args, **kwargs):
@@ -181,48 +269,93 @@ class ScreeningViewset(viewsets.ModelViewSet):  # admin
         except:
             return Response(status=status.HTTP_409_CONFLICT)
 
+# body : CSV (text/csv) or JSON lines (application/x-ndjson), read as a stream
+@api_view(['POST'])
+@permission_classes((IsAdminUser, ))
+def import_screenings(request):     # admin
+    if request.stream is None:
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+    if request.content_type.startswith('text/csv'):
+        rows = read_csv(request.stream)
+    elif request.content_type.startswith('application/x-ndjson'):
+        rows = read_json_lines(request.stream)
+    else:
+        return Response(status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+    result = import_programme(rows)
+    return Response(data=result, status=status.HTTP_200_OK)
+
 class RoomViewset(viewsets.ModelViewSet):   # admin
     serializer_class = RoomSerializer
     queryset = Room.objects.all()
     authentication_classes = [BearerAuthentication]
     permission_classes = [IsAdminUser]
+    def update(self, request, *args, **kwargs):
+        try:
+            return super().update(request, *args, **kwargs)
+        except RoomResizeError:
+            return Response(status=status.HTTP_409_CONFLICT)
 
 class ReservationViewSet(viewsets.ReadOnlyModelViewSet):    # admin
     serializer_class = ReservationSerializer
-    queryset = Reservation.objects.all()
+    queryset = querysets.reservations()
+    pagination_class = ReservationPagination
     authentication_classes = [BearerAuthentication]
     permission_classes = [IsAdminUser]
 
 class OnlyUserViewSet(viewsets.ReadOnlyModelViewSet):   # admin
     serializer_class = UserSerializer
-    queryset = User.objects.filter(is_staff=False, is_admin=False)
+    queryset = querysets.users(User.objects.filter(is_staff=False, is_admin=False))
+    pagination_class = UserPagination
     authentication_classes = [BearerAuthentication]
     permission_classes = [IsAdminUser]
 
 class AllUserViewSet(viewsets.ReadOnlyModelViewSet):    # admin
     serializer_class = UserSerializer
-    queryset = User.objects.all()
+    queryset = querysets.users()
+    pagination_class = UserPagination
     authentication_classes = [BearerAuthentication]
     permission_classes = [IsAdminUser]
 
-@api_view(['GET'])  # all
+@api_view(['GET', 'POST'])  # user
+@permission_classes((IsAuthenticated, ))
 def logout_view(request):
+    # the token can not be used anymore (and leaves the caches), login gives a new one ;
+    # the user has one token for all the devices : they are all logged out
+    Token.objects.filter(user=request.user).delete()
     logout(request)
+    return Response(status=status.HTTP_204_NO_CONTENT)
 
+# typeahead : ?q=words&category=id&limit=n, best matches first (the words
+# match the start of the words of the movies, not a substring, see search.py)
 @api_view(['GET'])  # public
+@permission_classes((AllowAny, ))
+@read_replica
+@cache_response(MOVIES, CATEGORIES, SCREENINGS, SEATS)
+def search_movies_view(request):
+    try:
+        category = int(request.query_params['category']) if request.query_params.get('category') else None
+        limit = min(int(request.query_params.get('limit', nbSearchResults)), nbSearchResults)
+    except ValueError:
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+    ids = search_movies(request.query_params.get('q', ''), category, limit)
+    movies = querysets.movie_list(Movie.objects.filter(id__in=ids), request).in_bulk()
+    serializer = MovieListSerializer([movies[id] for id in ids if id in movies], many=True, context={'request': request})
+    return Response(serializer.data)
+
+@api_view(['GET'])  # public
+@read_replica
+@cache_response(MOVIES, CATEGORIES, SCREENINGS, SEATS)
 def available_trending_movies(request):
-    today = datetime.datetime.combine(datetime.date.today(), datetime.time.min)
-    screenings = Screening.objects.filter( Q(date__gt=today.date()) | ( Q(date=today.date()) & Q(time__gte=today.time()) )).values_list('movieId')
-    query = Movie.objects.filter(id__in = screenings)
-    most_watched_movies =query.annotate(count=Count('screening__reservation__seatreserved')).order_by('-count')[:nbTrendingMovies]
-    serializer = MovieSerializer(most_watched_movies, many=True)
+    most_watched_movies = querysets.trending(availability.available_movies(), request, nbTrendingMovies)
+    serializer = MovieListSerializer(most_watched_movies, many=True, context={'request': request})
     return Response(serializer.data)
 
 @api_view(['GET'])  # admin
 @permission_classes((IsAdminUser, ))
+@read_replica
 def trending_movies(request):
-    most_watched_movies = Movie.objects.annotate(count=Count('screening__reservation__seatreserved')).order_by('-count')[:nbTrendingMoviesAdmin]
-    serializer = MovieSerializer(most_watched_movies, many=True)
+    most_watched_movies = querysets.trending(request=request, limit=nbTrendingMoviesAdmin)
+    serializer = MovieListSerializer(most_watched_movies, many=True, context={'request': request})
     return Response(serializer.data)
 
 
@@ -230,6 +363,7 @@ def trending_movies(request):
 
 @api_view(['GET'])
 @permission_classes((IsAdminUser, ))
+@read_replica
 def number_of_movies_per_category(request):
     categories = Category.objects.all().annotate(movies_count=Count('movie'))
     response = []
@@ -240,6 +374,7 @@ def number_of_movies_per_category(request):
 
 @api_view(['GET'])
 @permission_classes((IsAdminUser, ))
+@read_replica
 def number_of_users(request):
     nb = User.objects.filter(is_staff=False, is_admin=False).count()
     data = {'total': nb }
@@ -247,34 +382,52 @@ def number_of_users(request):
 
 @api_view(['GET'])
 @permission_classes((IsAdminUser, ))
+@read_replica
 def income_and_nb_reservations(request):
-    totalNumber = Reservation.objects.count()
-    totalIncome = Reservation.objects.aggregate(Sum('total')).values()
-    data = {'totalNumber':totalNumber, 'totalIncome':totalIncome} # total income must be fixed
+    data = reservation_totals()
     return Response(data)
 
 @api_view(['GET'])
 @permission_classes((IsAdminUser, ))
+@read_replica
 def loyal_clients(request):
-    clients_most_reservations= User.objects.filter(is_staff=False, is_admin=False)
-    clients_most_reservations= clients_most_reservations.annotate(count=Count('reservation')).order_by('-count')[:nbLoyalClients]
+    clients_most_reservations = querysets.loyal_users(nbLoyalClients)
     serializer = UserSerializer(clients_most_reservations, many=True)
     return Response(serializer.data)
 
 @api_view(['GET'])
 @permission_classes((IsAdminUser, ))
+@read_replica
 def seats_reserved_per_category_last_week(request):
-    categories = Category.objects.all()
-    response = []
-    today = datetime.datetime.combine(datetime.date.today(), datetime.time.min)
-    for cat in categories:
-        day= today - datetime.timedelta(days=7)
-        series = []
-        for i in range(0,7):
-            nb = SeatReserved.objects.filter(reservation__screeningId__movieId__categoriesId=cat.id).filter(reservation__date=day).count()
-            data= {'name': day.date(), 'value': nb}
-            series.append(data)
-            day = day + datetime.timedelta(days=1)
-        data={'name': cat.name, 'series': series}
-        response.append(data)
-    return Response(data=response)
\ No newline at end of file
+    today = datetime.date.today()
+    response = seats_reserved_per_category(today - datetime.timedelta(days=7), today)
+    return Response(data=response)
+
+@api_view(['GET'])
+@permission_classes((IsAdminUser, ))
+@read_replica
+def seats_reserved_per_category_series(request):
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD&bucket=day|week|month
+    try:
+        start, end, bucket = parse_range(request.query_params)
+    except SeriesError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    response = seats_reserved_per_category(start, end, bucket)
+    return Response(data=response)
+
+@api_view(['GET'])
+@permission_classes((IsAdminUser, ))
+def response_cache_stats(request):
+    return Response(data=cache_stats())
+
+# Prometheus scrape (bearer token of an admin), numbers of this process
+@api_view(['GET'])
+@permission_classes((IsAdminUser, ))
+def metrics(request):
+    return HttpResponse(metrics_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# routes sorted by the time spent in them
+@api_view(['GET'])
+@permission_classes((IsAdminUser, ))
+def slow_endpoints(request):
+    return Response(data=report())